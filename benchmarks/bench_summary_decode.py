@@ -0,0 +1,155 @@
+"""Benchmark: decodifica di una giornata summary_data (120 pannelli × 1440 minuti).
+
+Confronta il vecchio ciclo cella per cella (``float()`` con try/except) con
+``tigo_decode.decode_summary`` nei percorsi NumPy e Python puro, per la sola
+somma giornaliera e per l'analisi completa (somma, ultima riga, statistiche
+per pannello). La conversione da oggetti JSON a float resta per cella anche
+con NumPy: il guadagno viene dalle operazioni sulla matrice già decodificata.
+
+Con celle ``"-"`` nel dict ``_block_np`` deve prima trovarle (maschera su
+una matrice di oggetti) e decode+somma resta sotto il ciclo legacy. Per questo
+il client locale passa a ``decode_summary`` risposte con i ``"-"`` già
+sostituiti da NaN nel testo JSON (``fetch_day_summary(nan_cells=True)``):
+l'ultimo caso misura quel percorso, sostituzione inclusa.
+
+Uso:  python benchmarks/bench_summary_decode.py [--panels 120] [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import random
+import time
+from pathlib import Path
+
+_MODULE = Path(__file__).resolve().parents[1] / "custom_components" / "tigo" / "tigo_decode.py"
+_spec = importlib.util.spec_from_file_location("tigo_decode", _MODULE)
+tigo_decode = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(tigo_decode)
+
+
+def make_day(panels: int, minutes: int = 1440, seed: int = 0, missing: float = 0.002) -> dict:
+    rnd = random.Random(seed)
+    order = [f"A{i}" for i in range(1, panels + 1)]
+    rows = []
+    for m in range(minutes):
+        d = []
+        for _ in order:
+            if rnd.random() < missing:
+                d.append("-")
+            else:
+                d.append(round(rnd.uniform(0, 420), 1))
+        rows.append({"t": f"{m // 60:02d}:{m % 60:02d}", "d": d})
+    # Round-trip JSON: stessi tipi che arrivano dal CCA
+    return json.loads(json.dumps({"dataset": [{"order": order, "data": rows}]}))
+
+
+def legacy_day_kwh(data: dict) -> float:
+    total_wh = 0.0
+    for block in data.get("dataset", []):
+        for entry in block.get("data", []):
+            minute_sum = 0.0
+            for v in entry.get("d", []):
+                try:
+                    minute_sum += float(v)
+                except (TypeError, ValueError):
+                    pass
+            total_wh += minute_sum / 60.0
+    return round(total_wh / 1000.0, 2)
+
+
+def legacy_analysis(data: dict) -> tuple:
+    """Somma giornaliera, ultima riga e min/max/media/Wh per pannello, cella per cella."""
+    cols: dict[str, list] = {}
+    total_wh = 0.0
+    last: dict[str, float] = {}
+    for block in data.get("dataset", []):
+        order = block.get("order") or []
+        for entry in block.get("data", []):
+            raw = entry.get("d", [])
+            if not raw:
+                continue
+            minute_sum = 0.0
+            last = {}
+            for i, v in enumerate(raw[:len(order)]):
+                try:
+                    f = float(v)
+                except (TypeError, ValueError):
+                    last[order[i]] = 0.0
+                    continue
+                minute_sum += f
+                last[order[i]] = f
+                cols.setdefault(order[i], []).append(f)
+            total_wh += minute_sum / 60.0
+    stats = {
+        p: {"min": min(c), "max": max(c), "mean": sum(c) / len(c), "wh": sum(c) / 60.0}
+        for p, c in cols.items()
+    }
+    return round(total_wh / 1000.0, 2), last, stats
+
+
+def matrix_analysis(data: dict, use_numpy: bool) -> tuple:
+    matrix = tigo_decode.decode_summary(data, use_numpy=use_numpy)
+    return matrix.day_kwh(), matrix.last_row(), matrix.panel_stats()
+
+
+def bench(label: str, fn, repeat: int) -> tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<38} {best * 1000:9.1f} ms")
+    return best, result
+
+
+def run_case(label: str, data: dict, repeat: int, nan_json: bool = False) -> None:
+    """Con ``nan_json`` i percorsi ``decode_summary`` leggono il JSON con ``"-"`` → NaN.
+
+    La sostituzione nei bytes entra nei tempi NumPy; il parse JSON no, perché
+    lo pagano allo stesso modo entrambi i percorsi.
+    """
+    print(f"\n{label}")
+    t_pre = 0.0
+    decoded = data
+    if nan_json:
+        body = json.dumps(data).encode()
+        t_pre, fixed = bench("sostituzione \"-\" → NaN nei bytes", lambda: body.replace(b'"-"', b"NaN"), repeat)
+        decoded = json.loads(fixed)
+
+    print("somma giornaliera (kWh):")
+    t_legacy, kwh = bench("cella per cella (legacy)", lambda: legacy_day_kwh(data), repeat)
+    if tigo_decode.HAS_NUMPY:
+        t_dec, matrix = bench("decode_summary NumPy (solo decode)",
+                              lambda: tigo_decode.decode_summary(decoded), repeat)
+        t_sum, kwh_np = bench("somma su matrice già decodificata", matrix.day_kwh, repeat)
+        print(f"  {kwh_np} kWh (legacy {kwh}); decode+somma ×{t_legacy / (t_pre + t_dec + t_sum):.1f}, "
+              f"somma su matrice ×{t_legacy / t_sum:.0f}")
+
+    print("analisi completa (somma + ultima riga + statistiche per pannello):")
+    t_legacy, _ = bench("cella per cella (legacy)", lambda: legacy_analysis(data), repeat)
+    t_py, _ = bench("decode_summary, Python puro", lambda: matrix_analysis(decoded, False), repeat)
+    print(f"  Python puro ×{t_legacy / (t_pre + t_py):.1f}")
+    if tigo_decode.HAS_NUMPY:
+        t_np, _ = bench("decode_summary, NumPy", lambda: matrix_analysis(decoded, True), repeat)
+        print(f"  NumPy ×{t_legacy / (t_pre + t_np):.1f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panels", type=int, default=120)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"summary_data: {args.panels} pannelli × 1440 minuti "
+          f"(NumPy {'disponibile' if tigo_decode.HAS_NUMPY else 'NON installato'})")
+    run_case("giornata pulita (solo numeri)", make_day(args.panels, missing=0.0), args.repeat)
+    run_case("giornata con celle \"-\" (0,2%)", make_day(args.panels), args.repeat)
+    run_case("giornata con celle \"-\" come la legge il client (JSON → NaN)", make_day(args.panels), args.repeat,
+             nan_json=True)
+
+
+if __name__ == "__main__":
+    main()
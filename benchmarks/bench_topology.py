@@ -0,0 +1,176 @@
+"""Benchmark: indice della topologia al setup (layout sintetico da 500 pannelli).
+
+Confronta il vecchio setup (``layout_map`` piatta, ``resolve_parents`` per
+pannello e device info ricostruita in ognuna delle 7 entità del pannello:
+4 sensori CCA + energia + giorno/mese) con ``tigo_topology.PanelTopology``
+(un solo attraversamento del layout, device info costruita una volta per
+pannello e condivisa).
+
+Uso:  python benchmarks/bench_topology.py [--panels 500] [--repeat 20]
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import sys
+import time
+import types
+from pathlib import Path
+
+# Il pacchetto dell'integrazione importa Home Assistant: si caricano solo
+# i moduli necessari (const, tigo_topology) sotto un pacchetto vuoto.
+_PACKAGE = Path(__file__).resolve().parents[1] / "custom_components" / "tigo"
+_pkg = types.ModuleType("tigo")
+_pkg.__path__ = [str(_PACKAGE)]
+sys.modules.setdefault("tigo", _pkg)
+tigo_topology = importlib.import_module("tigo.tigo_topology")
+
+DOMAIN = "tigo"
+PREFIX = "cca_192_168_1_10"
+# Entità per pannello sulla sorgente CCA: Pin, Vin, Rssi, Iin + energia + giorno/mese
+SENSORS_PER_PANEL = 4
+ENERGY_ENTITIES = 3
+
+
+def make_layout(panels: int, per_string: int = 12, strings_per_inverter: int = 4) -> dict:
+    """Layout come ``tigo_api.parse_layout``: inverter → stringhe (mppts) → pannelli."""
+    inverters = []
+    next_id = 1
+    placed = 0
+    inv_n = 0
+    while placed < panels:
+        inv_n += 1
+        inverter = {"label": f"Inverter {inv_n}", "object_id": next_id, "type": "Inverter", "mppts": []}
+        next_id += 1
+        for s in range(strings_per_inverter):
+            if placed >= panels:
+                break
+            string = {
+                "label": f"{chr(65 + (inv_n - 1) * strings_per_inverter + s)}",
+                "object_id": next_id,
+                "parent": inverter["object_id"],
+                "type": "String",
+                "panels": [],
+            }
+            next_id += 1
+            for p in range(min(per_string, panels - placed)):
+                string["panels"].append({
+                    "label": f"{string['label']}{p + 1}",
+                    "serial": f"4-{next_id:07X}",
+                    "object_id": next_id,
+                    "type": "Panel",
+                    "channel": f"04C05B{next_id:06X}.{p % 4}",
+                    "MP": p,
+                    "parent": string["object_id"],
+                })
+                next_id += 1
+                placed += 1
+            inverter["mppts"].append(string)
+        inverters.append(inverter)
+    return {"system": {"inverters": inverters}}
+
+
+def _legacy_resolve_parents(panel_id, layout_map: dict) -> dict:
+    string_label = None
+    inverter_label = None
+    current_id = panel_id
+    for _ in range(2):
+        current = layout_map.get(current_id)
+        if not current or "parent" not in current:
+            break
+        parent_id = current["parent"]
+        parent = layout_map.get(parent_id)
+        if not parent:
+            break
+        parent_type = parent.get("type")
+        if parent_type == "String" or parent_type == 3:
+            string_label = parent.get("label")
+        elif parent_type == "Inverter" or parent_type == 4:
+            inverter_label = parent.get("label")
+        current_id = parent_id
+    return {"string": string_label, "inverter": inverter_label}
+
+
+def _legacy_device_info(panel_id, layout_info: dict, parent_info: dict, label: str) -> dict:
+    serial = layout_info.get("serial", panel_id)
+    channel = layout_info.get("channel", "unknown")
+    # Calcolate e poi non usate, come nel costruttore originale
+    connections = None
+    if "." in channel:
+        mac = channel.split(".")[0].lower()
+        if len(mac) == 12:
+            connections = {("mac", ":".join([mac[i:i + 2] for i in range(0, 12, 2)]))}
+    info = {
+        "identifiers": {(DOMAIN, f"{PREFIX}_{panel_id}")},
+        "name": f"Panel {label}",
+        "manufacturer": "Tigo",
+        "model": layout_info.get("type", "Tigo Panel"),
+        "sw_version": channel,
+        "hw_version": serial,
+        "via_device": (DOMAIN, f"{PREFIX}_tigo_system"),
+    }
+    area = parent_info.get("string") or parent_info.get("inverter")
+    if area:
+        info["suggested_area"] = area
+    del connections
+    return info
+
+
+def legacy_setup(layout: dict) -> list:
+    layout_map = {}
+    for inverter in layout.get("system", {}).get("inverters", []):
+        layout_map[inverter.get("object_id")] = inverter
+        for mppt in inverter.get("mppts", []):
+            layout_map[mppt.get("object_id")] = mppt
+            for panel in mppt.get("panels", []):
+                layout_map[panel["object_id"]] = panel
+    out = []
+    for panel_id, layout_info in layout_map.items():
+        if layout_info.get("type") != "Panel":
+            continue
+        label = layout_info.get("label") or panel_id
+        # Ogni costruttore di entità risaliva i parent e rifaceva la device info
+        for _ in range(SENSORS_PER_PANEL + ENERGY_ENTITIES):
+            parent_info = _legacy_resolve_parents(panel_id, layout_map)
+            out.append(_legacy_device_info(panel_id, layout_info, parent_info, label))
+    return out
+
+
+def topology_setup(layout: dict) -> list:
+    topology = tigo_topology.PanelTopology.from_layout(layout, PREFIX)
+    out = []
+    for panel_id in topology:
+        for _ in range(SENSORS_PER_PANEL + ENERGY_ENTITIES):
+            out.append(topology.get(panel_id).device_info)
+    return out
+
+
+def bench(label: str, fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<40} {best * 1000:8.2f} ms")
+    return best, result
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--panels", type=int, default=500)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    layout = make_layout(args.panels)
+    entities = args.panels * (SENSORS_PER_PANEL + ENERGY_ENTITIES)
+    print(f"layout sintetico: {args.panels} pannelli, {entities} entità")
+    t_legacy, legacy = bench("layout_map + resolve_parents (legacy)", lambda: legacy_setup(layout), args.repeat)
+    t_new, new = bench("PanelTopology.from_layout", lambda: topology_setup(layout), args.repeat)
+    distinct = len({id(d) for d in new})
+    print(f"  ×{t_legacy / t_new:.1f}; device info: {len(legacy)} dict (legacy) → {distinct} condivisi")
+    assert legacy == new, "device info diverse tra legacy e indice"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,104 @@
 from __future__ import annotations
 
-import asyncio
 import logging
+import time
 from datetime import timedelta
-from typing import Callable
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.event import async_track_time_change
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import UpdateFailed
 from homeassistant.const import CONF_IP_ADDRESS
+from homeassistant.util import dt as dt_util
 
 from .const import (
     DOMAIN,
     SCAN_INTERVAL,                 # compat
     OPT_SCAN_INTERVAL,
+    OPT_ADAPTIVE_POLLING,
+    ADAPTIVE_POLLING_DEFAULT,
+    OPT_WS_COALESCE_WINDOW,
+    WS_COALESCE_WINDOW_DEFAULT_SEC,
+    OPT_STATE_HEARTBEAT,
+    STATE_HEARTBEAT_DEFAULT_SEC,
     SCAN_INTERVAL_DEFAULT_SEC,
     CLOUD_SCAN_INTERVAL_DEFAULT_SEC,
     CLOUD_SCAN_INTERVAL_MIN_SEC,
+    SOURCE_CCA,
     SOURCE_CLOUD,
     SOURCE_ESP,
     CONF_USERNAME,
     CONF_PASSWORD,
     CONF_SYSTEM_ID,
+    OPT_STATISTICS_ONLY,
+    STATISTICS_ONLY_DEFAULT,
+    STATISTICS_ONLY_STATE_INTERVAL_SEC,
+    STATISTICS_STORAGE_VERSION,
     _LOGGER,
 )
-from .tigo_api import fetch_tigo_data_from_ip, fetch_tigo_data_from_ws
+from .coordinator import TigoCoordinator
+from .tigo_api import entity_prefix, fetch_tigo_data_from_ws
+from .tigo_energy import DayEnergyCache, PanelEnergyBackfill, TodayEnergyAccumulator
+from .tigo_layout import LayoutCache, PanelInventory, async_cached_layout
+from .tigo_local import TigoLocalClient
+from .tigo_polling import ASLEEP_HEARTBEAT, AdaptiveInterval, PollCancelled, RetryScheduler
+from .tigo_snapshot import PanelSnapshot, snapshot_from_panels
+from .tigo_statistics import CloudPowerStatistics, HourlyAggregator, StatisticsBackfill, statistics_key
+from .tigo_summary import SummaryCursor
+from .tigo_ws import FrameCoalescer, TigoWsListener
 
 
-def _with_retries(fn: Callable[[], dict], label: str, attempts: int = 5, base_sleep: int = 15) -> dict:
-    last_err = None
-    for i in range(1, attempts + 1):
+def _sun_position(hass: HomeAssistant) -> tuple[float | None, bool | None]:
+    """(elevazione in gradi, sole in salita) da ``sun.sun``, o dalla posizione di HA."""
+    state = hass.states.get("sun.sun")
+    if state is not None and state.attributes.get("elevation") is not None:
         try:
-            return fn()
-        except Exception as e:
-            last_err = e
-            wait = min(base_sleep * i, 60)
-            _LOGGER.debug("[%s] tentativo %d/%d fallito: %s → ritento tra %ss", label, i, attempts, e, wait)
-            if i < attempts:
-                import time as _t
-                _t.sleep(wait)
-    _LOGGER.warning("[%s] ancora non raggiungibile dopo %d tentativi: %s", label, attempts, last_err)
-    raise last_err
+            return float(state.attributes["elevation"]), state.attributes.get("rising")
+        except (TypeError, ValueError):
+            pass
+    try:
+        from homeassistant.helpers.sun import get_astral_location
+
+        location, _elevation = get_astral_location(hass)
+        now = dt_util.utcnow()
+        elevation = location.solar_elevation(now)
+        later = location.solar_elevation(now + timedelta(minutes=5))
+        return float(elevation), later > elevation
+    except Exception:
+        return None, None
+
+
+def _total_power(data) -> float | None:
+    """Somma di Pin su tutti i pannelli dei dati del coordinator (sorgenti locali)."""
+    if isinstance(data, PanelSnapshot):
+        return data.total("Pin")
+    if not isinstance(data, dict):
+        return None
+    total = 0.0
+    for values in data.values():
+        try:
+            total += float(values.get("Pin") or 0)
+        except (AttributeError, TypeError, ValueError):
+            continue
+    return total
+
+
+def _statistics_only(entry: ConfigEntry) -> bool:
+    """Modalità solo statistiche: disponibile solo per il CCA (righe a minuti)."""
+    source = entry.options.get("source") or entry.data.get("source") or "CCA"
+    return source == SOURCE_CCA and bool(
+        entry.options.get(OPT_STATISTICS_ONLY, entry.data.get(OPT_STATISTICS_ONLY, STATISTICS_ONLY_DEFAULT))
+    )
+
+
+def _coalesce_window(entry: ConfigEntry) -> float:
+    """Finestra (s) del coalescer dei frame WS: opzioni, poi dati dell'entry."""
+    return float(entry.options.get(
+        OPT_WS_COALESCE_WINDOW,
+        entry.data.get(OPT_WS_COALESCE_WINDOW, WS_COALESCE_WINDOW_DEFAULT_SEC),
+    ))
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
@@ -51,11 +109,30 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         or entry.title
     )
     source = entry.options.get("source") or entry.data.get("source") or "CCA"
+    statistics_only = _statistics_only(entry)
 
     cloud_client = None
     cloud_layout: dict = {}
+    # Layout salvato su disco e riconvalidato in background (CCA e cloud)
+    layout_cache: LayoutCache | None = None
+    # Costo dell'ultimo ciclo di polling locale (richieste, byte, righe, ms)
+    poll_stats: dict = {}
+    # Cursore summary_data + serie a minuti per pannello (solo CCA)
+    cursor: SummaryCursor | None = None
+    # Client asincrono per gli endpoint locali del CCA
+    local_client: TigoLocalClient | None = None
+    # Energia dei giorni conclusi salvata su disco (solo CCA)
+    energy_cache: DayEnergyCache | None = None
+    today_energy: TodayEnergyAccumulator | None = None
+    energy_backfill: PanelEnergyBackfill | None = None
+    # Import dello storico orario nelle statistiche a lungo termine (solo CCA)
+    statistics_backfill: StatisticsBackfill | None = None
+    # Sottoscrizione WebSocket persistente + coalescer dei frame (solo ESP32)
+    ws_listener: TigoWsListener | None = None
+    coalescer: FrameCoalescer | None = None
 
     if source == SOURCE_CLOUD:
+        from .tigo_account import async_acquire_account, async_release_account
         from .tigo_cloud import TigoCloudClient
 
         username = entry.options.get(CONF_USERNAME) or entry.data.get(CONF_USERNAME)
@@ -63,30 +140,107 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         system_id = entry.data.get(CONF_SYSTEM_ID)
         _LOGGER.debug("Using CLOUD source for Tigo system %s", system_id)
 
-        cloud_client = TigoCloudClient(username, password, system_id)
-        # Layout statico: letto una volta al setup (login incluso automaticamente)
-        try:
-            cloud_layout = await hass.async_add_executor_job(cloud_client.fetch_layout)
-        except Exception as e:
-            _LOGGER.warning("Layout cloud non disponibile al setup: %s", e)
-            cloud_layout = {}
+        # Token, connessioni, budget richieste e layout condivisi con le altre
+        # entry dello stesso account; il token sopravvive ai riavvii
+        account = await async_acquire_account(hass, username, password)
+        entry.async_on_unload(lambda: async_release_account(hass, account))
+        cloud_client = TigoCloudClient(system_id=system_id, account=account)
 
-        def _sync_fetch() -> dict:
-            return cloud_client.fetch_all(cloud_layout)
+        async def _async_fetch_cloud_layout() -> dict:
+            # Login incluso automaticamente; l'uid del CCA serve per la potenza
+            panels = await hass.async_add_executor_job(cloud_client.fetch_layout)
+            return {"panels": panels, "cca_uid": cloud_client.cca_uid} if panels else {}
+
+        # Layout statico: dalla cache se presente, riconvalidato in background
+        layout_cache = LayoutCache(hass, entry.entry_id, str(system_id))
+        cached = await async_cached_layout(
+            hass, entry, layout_cache, _async_fetch_cloud_layout, f"tigo_cloud_{system_id}"
+        )
+        cloud_layout = cached.get("panels") or {}
+        if cloud_client.cca_uid is None:
+            cloud_client.cca_uid = cached.get("cca_uid")
+
+        async def _async_fetch() -> dict:
+            return await cloud_client.async_fetch_all(hass, cloud_layout)
         label = f"CLOUD {system_id}"
     elif source == SOURCE_ESP:
         _LOGGER.debug("Using WebSocket source for Tigo at %s", ip_address)
-        def _sync_fetch() -> dict:
-            return fetch_tigo_data_from_ws(f"ws://{ip_address}/ws")
+        ws_url = f"ws://{ip_address}/ws"
+
+        @callback
+        def _on_ws_flush(panels: dict) -> None:
+            scheduler.mark_alive()
+            # Frame parziale: i pannelli assenti mantengono l'ultimo valore
+            current = coordinator.data
+            if isinstance(current, PanelSnapshot):
+                coordinator.async_set_updated_data(current.merged(panels))
+            else:
+                coordinator.async_set_updated_data(snapshot_from_panels(panels))
+
+        # I frame WS passano dal coalescer: al più un aggiornamento per finestra
+        coalescer = FrameCoalescer(
+            _coalesce_window(entry),
+            _on_ws_flush,
+            now=dt_util.utcnow,
+        )
+        entry.async_on_unload(coalescer.cancel)
+        ws_listener = TigoWsListener(async_get_clientsession(hass), ws_url, coalescer.push)
+
+        async def _async_fetch() -> dict:
+            # Con la sottoscrizione attiva e frame recenti il poll non apre
+            # un'altra connessione: fa solo da fallback se il WS tace.
+            age = ws_listener.frame_age()
+            if ws_listener.connected and age is not None and age < coordinator.update_interval.total_seconds():
+                return coordinator.data
+            return snapshot_from_panels(await hass.async_add_executor_job(fetch_tigo_data_from_ws, ws_url))
         label = f"ESP32_WS {ip_address}"
     else:
         _LOGGER.debug("Using CCA IP source for Tigo at %s", ip_address)
-        def _sync_fetch() -> dict:
-            return fetch_tigo_data_from_ip(ip_address)
+        cursor = SummaryCursor()
+        aggregator: HourlyAggregator | None = None
+        if statistics_only:
+            # Tutte le righe della giornata passano dal cursore all'aggregatore orario
+            aggregator = HourlyAggregator()
+            cursor.full_day = True
+            cursor.row_listeners.append(aggregator.add_row)
+        local_client = TigoLocalClient(async_get_clientsession(hass), ip_address)
+        layout_cache = LayoutCache(hass, entry.entry_id, ip_address)
+        energy_cache = DayEnergyCache(hass, entry.entry_id)
+        await energy_cache.async_load()
+        today_energy = TodayEnergyAccumulator()
+        energy_backfill = PanelEnergyBackfill(hass, entry, local_client)
+        statistics_backfill = StatisticsBackfill(
+            hass, entry.entry_id, local_client, entity_prefix(source, ip_address), f"CCA {ip_address}",
+            aggregator=aggregator,
+        )
+        async def _async_fetch() -> dict:
+            snapshot = await local_client.fetch_snapshot(cursor)
+            poll_stats.clear()
+            poll_stats.update(snapshot["stats"])
+            _LOGGER.debug(
+                "[CCA %s] snapshot: %d richieste, %d byte, %d righe nuove, %.0f ms",
+                ip_address, poll_stats["requests"], poll_stats["bytes"],
+                poll_stats["rows"], poll_stats["elapsed_ms"],
+            )
+            return snapshot["panels"]
         label = f"CCA {ip_address}"
 
+    # Retry/backoff asincrono: nessun thread bloccato durante le attese
+    scheduler = RetryScheduler(label, on_state_change=lambda _asleep: _apply_interval())
+    entry.async_on_unload(scheduler.cancel)
+
     async def _async_update_method() -> dict:
-        return await hass.async_add_executor_job(_with_retries, _sync_fetch, label)
+        try:
+            data = await scheduler.run(_async_fetch)
+        except PollCancelled as e:
+            raise UpdateFailed(f"Polling annullato ({e})") from e
+        finally:
+            # Il coordinator pianifica il prossimo refresh subito dopo questo
+            # metodo: l'intervallo va aggiornato qui, non in un listener.
+            _apply_interval()
+        if adaptive is not None:
+            adaptive.observe_power(_total_power(data), time.monotonic())
+        return data
 
     # Default e minimo dipendono dalla sorgente: il cloud usa un intervallo più
     # ampio (dati non realtime, ~15 min) e un floor anti-throttle.
@@ -105,53 +259,93 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     ))
     update_interval = timedelta(seconds=scan_seconds) if scan_seconds > 0 else SCAN_INTERVAL
 
-    coordinator = DataUpdateCoordinator(
+    def _adaptive_enabled(e: ConfigEntry) -> bool:
+        return not is_cloud and bool(
+            e.options.get(OPT_ADAPTIVE_POLLING, e.data.get(OPT_ADAPTIVE_POLLING, ADAPTIVE_POLLING_DEFAULT))
+        )
+
+    # Intervallo adattivo: lo scan interval configurato fa da floor diurno
+    adaptive = AdaptiveInterval(update_interval.total_seconds()) if _adaptive_enabled(entry) else None
+
+    coordinator = TigoCoordinator(
         hass,
         _LOGGER,
         name=f"Tigo Panel Data ({ip_address})",
         update_method=_async_update_method,
         update_interval=update_interval,
+        panel_dispatch=not is_cloud,
     )
     coordinator.data_source = source
+    coordinator.poll_stats = poll_stats
+    coordinator.summary_cursor = cursor
+    coordinator.scheduler = scheduler
+    # Curve del giorno per pannello (solo cloud), lette dai sensori potenza
+    coordinator.cloud_series = cloud_client.series if cloud_client is not None else {}
+
+    def _state_heartbeat(e: ConfigEntry) -> int:
+        return int(e.options.get(OPT_STATE_HEARTBEAT, e.data.get(OPT_STATE_HEARTBEAT, STATE_HEARTBEAT_DEFAULT_SEC)))
+
+    # Letto dai sensori pannello: scrittura forzata anche a valore invariato
+    coordinator.state_heartbeat = _state_heartbeat(entry)
+    # Solo statistiche: i sensori pannello scrivono lo stato di rado
+    coordinator.statistics_only = statistics_only
+    coordinator.state_min_interval = STATISTICS_ONLY_STATE_INTERVAL_SEC if statistics_only else 0
+
+    def _apply_interval() -> None:
+        if adaptive is not None:
+            elevation, rising = _sun_position(hass)
+            coordinator.update_interval = timedelta(seconds=adaptive.next_interval(
+                elevation=elevation,
+                rising=rising,
+                failure_streak=scheduler.failure_streak,
+                asleep=scheduler.asleep,
+            ))
+        # Device in standby: heartbeat lento finché non risponde di nuovo
+        elif scheduler.asleep:
+            coordinator.update_interval = max(ASLEEP_HEARTBEAT, update_interval)
+        elif cloud_client is not None:
+            # Poll allineato allo slot cloud atteso, se arriva prima dell'intervallo
+            delay = cloud_client.next_poll_delay()
+            interval = update_interval
+            if delay is not None and delay < interval.total_seconds():
+                interval = timedelta(seconds=max(delay, CLOUD_SCAN_INTERVAL_MIN_SEC))
+            coordinator.update_interval = interval
+        else:
+            coordinator.update_interval = update_interval
 
     # --- nuovo: listener delle opzioni per applicare subito il nuovo intervallo ---
     async def _options_updated(hass: HomeAssistant, updated_entry: ConfigEntry) -> None:
+        nonlocal update_interval, adaptive
+        if _statistics_only(updated_entry) != statistics_only:
+            # Cambiano state_class dei sensori e cursore: serve un reload
+            hass.config_entries.async_schedule_reload(updated_entry.entry_id)
+            return
         new_scan = _clamp_scan(int(
             updated_entry.options.get(
                 OPT_SCAN_INTERVAL,
                 updated_entry.data.get(OPT_SCAN_INTERVAL, default_scan),
             )
         ))
-        coordinator.update_interval = timedelta(seconds=new_scan)
+        update_interval = timedelta(seconds=new_scan)
+        coordinator.state_heartbeat = _state_heartbeat(updated_entry)
+        if coalescer is not None:
+            coalescer.window = _coalesce_window(updated_entry)
+        if not _adaptive_enabled(updated_entry):
+            adaptive = None
+        elif adaptive is None:
+            adaptive = AdaptiveInterval(new_scan)
+        else:
+            adaptive.floor = float(new_scan)
+        _apply_interval()
         _LOGGER.info("⏱️ Tigo scan interval aggiornato a %ss", new_scan)
         # opzionale: triggera un refresh immediato
         await coordinator.async_request_refresh()
 
     entry.async_on_unload(entry.add_update_listener(_options_updated))
 
-    # Primo bootstrap con retry progressivo (come tua versione)
-    max_first_attempts = 6
-    first_delay = 10
-    success = False
-    for i in range(1, max_first_attempts + 1):
-        await coordinator.async_refresh()
-        if coordinator.last_update_success:
-            success = True
-            _LOGGER.info("✅ Tigo primo refresh riuscito (tentativo %d/%d)", i, max_first_attempts)
-            break
-        wait = min(first_delay * i, 60)
-        _LOGGER.warning(
-            "Tigo non raggiungibile al primo avvio (tentativo %d/%d). "
-            "Probabile standby notturno. Riprovo tra %ss…",
-            i, max_first_attempts, wait
-        )
-        await asyncio.sleep(wait)
-
-    if not success:
-        _LOGGER.warning(
-            "⚠️ Proseguo il setup di Tigo anche senza dati iniziali. "
-            "I sensori verranno creati e si aggiorneranno automaticamente appena il CCA/ESP si sveglia."
-        )
+    # Inventario dei pannelli noti: le entità si creano da lì, senza attendere il device
+    inventory = PanelInventory(hass, entry.entry_id)
+    await inventory.async_load()
 
     hass.data.setdefault(DOMAIN, {})[entry.entry_id] = {
         "coordinator": coordinator,
@@ -160,8 +354,56 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         "system_id": entry.data.get(CONF_SYSTEM_ID),
         "cloud_client": cloud_client,
         "cloud_layout": cloud_layout,
+        "summary_cursor": cursor,
+        "local_client": local_client,
+        "layout_cache": layout_cache,
+        "panel_inventory": inventory,
+        "energy_cache": energy_cache,
+        "today_energy": today_energy,
+        "energy_backfill": energy_backfill,
+        "statistics_backfill": statistics_backfill,
+        "ws_listener": ws_listener,
     }
     await hass.config_entries.async_forward_entry_setups(entry, ["sensor"])
+
+    # Primo refresh in background (con i retry dello scheduler): di notte il
+    # device può non rispondere per ore, le entità restano in attesa dei dati
+    # e i pannelli non ancora in inventario vengono aggiunti appena arrivano.
+    if inventory.panels:
+        _LOGGER.debug("Tigo %s: %d pannelli dall'inventario, primo refresh in background", label, len(inventory.panels))
+    entry.async_create_background_task(hass, coordinator.async_refresh(), f"tigo_first_refresh_{ip_address}")
+
+    if ws_listener is not None:
+        # Annullato automaticamente all'unload dell'entry
+        entry.async_create_background_task(hass, ws_listener.run(), f"tigo_ws_{ip_address}")
+
+    if statistics_backfill is not None:
+        @callback
+        def _run_statistics(_now=None) -> None:
+            entry.async_create_background_task(
+                hass, statistics_backfill.async_run(), f"tigo_statistics_{ip_address}"
+            )
+
+        # All'avvio (giorni persi durante lo spegnimento) e ogni notte (ieri);
+        # in modalità solo statistiche ogni ora, per le ore concluse di oggi
+        _run_statistics()
+        if statistics_only:
+            unsub = async_track_time_change(hass, _run_statistics, minute=5, second=0)
+        else:
+            unsub = async_track_time_change(hass, _run_statistics, hour=0, minute=30, second=0)
+        entry.async_on_unload(unsub)
+
+    if cloud_client is not None:
+        # Media/min/max orari della potenza per pannello dalle curve già in memoria
+        cloud_statistics = CloudPowerStatistics(hass, entry.entry_id, f"tigo_cloud_{entry.data.get(CONF_SYSTEM_ID)}")
+
+        @callback
+        def _import_cloud_statistics() -> None:
+            entry.async_create_background_task(
+                hass, cloud_statistics.async_import(cloud_client.series.get("pin")), f"tigo_cloud_statistics_{label}"
+            )
+
+        entry.async_on_unload(coordinator.async_add_listener(_import_cloud_statistics))
     return True
 
 
@@ -170,3 +412,24 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id, None)
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Rimuove i dati persistenti dell'entry (cache layout/inventario/energia, checkpoint statistiche)."""
+    await LayoutCache(hass, entry.entry_id, "").async_remove()
+    await PanelInventory(hass, entry.entry_id).async_remove()
+    await DayEnergyCache(hass, entry.entry_id).async_remove()
+    await Store(hass, STATISTICS_STORAGE_VERSION, statistics_key(entry.entry_id)).async_remove()
+
+    if (entry.options.get("source") or entry.data.get("source")) == SOURCE_CLOUD:
+        from .tigo_account import account_key, async_forget_account
+
+        # Token salvato dell'account solo se nessun'altra entry lo usa più
+        username = entry.options.get(CONF_USERNAME) or entry.data.get(CONF_USERNAME)
+        others = {
+            account_key(e.options.get(CONF_USERNAME) or e.data.get(CONF_USERNAME))
+            for e in hass.config_entries.async_entries(DOMAIN)
+            if e.entry_id != entry.entry_id
+        }
+        if account_key(username) not in others:
+            await async_forget_account(hass, username)
@@ -56,8 +56,9 @@ class TigoConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     return await self._create_local_entry(ip_input, SOURCE_ESP)
 
                 # CCA: sonda il firmware locale
-                from .tigo_api import probe_local
-                self._probe = await self.hass.async_add_executor_job(probe_local, ip_input)
+                from homeassistant.helpers.aiohttp_client import async_get_clientsession
+                from .tigo_local import TigoLocalClient
+                self._probe = await TigoLocalClient(async_get_clientsession(self.hass), ip_input).probe()
                 _LOGGER.debug("Probe locale %s: %s", ip_input, self._probe)
 
                 if not self._probe.get("reachable"):
@@ -85,16 +86,22 @@ class TigoConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     async def async_step_cloud(self, user_input: dict[str, Any] | None = None) -> FlowResult:
         """Login all'account cloud Tigo (firmware locale protetto da password)."""
+        from .tigo_account import async_acquire_account, async_release_account
         from .tigo_cloud import TigoCloudClient, TigoAuthError, TigoCloudError
 
         errors: dict[str, str] = {}
         if user_input is not None:
             self._username = user_input[CONF_USERNAME]
             self._password = user_input[CONF_PASSWORD]
+            # Stesso account delle entry già configurate: niente login in più.
+            # Un token valido (salvato con queste credenziali) le conferma già,
+            # altrimenti il primo accesso rifà il login e le verifica.
+            account = await async_acquire_account(self.hass, self._username, self._password)
 
             def _login_and_discover() -> list[dict]:
-                client = TigoCloudClient(self._username, self._password)
-                client.login()
+                client = TigoCloudClient(account=account)
+                if client.token is None:
+                    client.login()
                 return client.discover_systems()
 
             try:
@@ -103,7 +110,10 @@ class TigoConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 errors["base"] = "invalid_auth"
             except TigoCloudError:
                 errors["base"] = "cannot_connect"
-            else:
+            finally:
+                # Il token resta salvato: il setup dell'entry non rifà il login
+                async_release_account(self.hass, account)
+            if not errors:
                 if not self._systems:
                     errors["base"] = "no_systems"
                 elif len(self._systems) == 1:
@@ -184,6 +194,16 @@ class TigoOptionsFlow(config_entries.OptionsFlow):
             CLOUD_SCAN_INTERVAL_DEFAULT_SEC,
             CLOUD_SCAN_INTERVAL_MIN_SEC,
             CLOUD_SCAN_INTERVAL_MAX_SEC,
+            OPT_ADAPTIVE_POLLING,
+            ADAPTIVE_POLLING_DEFAULT,
+            OPT_WS_COALESCE_WINDOW,
+            WS_COALESCE_WINDOW_DEFAULT_SEC,
+            WS_COALESCE_WINDOW_MAX_SEC,
+            OPT_STATE_HEARTBEAT,
+            STATE_HEARTBEAT_DEFAULT_SEC,
+            STATE_HEARTBEAT_MAX_SEC,
+            OPT_STATISTICS_ONLY,
+            STATISTICS_ONLY_DEFAULT,
         )
         errors = {}
 
@@ -225,6 +245,20 @@ class TigoOptionsFlow(config_entries.OptionsFlow):
                     ip_input = user_input.get(CONF_IP_ADDRESS, "")
                     ipaddress.ip_address(ip_input)
                     data[CONF_IP_ADDRESS] = ip_input
+                    data[OPT_ADAPTIVE_POLLING] = bool(
+                        user_input.get(OPT_ADAPTIVE_POLLING, ADAPTIVE_POLLING_DEFAULT)
+                    )
+                    data[OPT_STATE_HEARTBEAT] = int(
+                        user_input.get(OPT_STATE_HEARTBEAT, STATE_HEARTBEAT_DEFAULT_SEC)
+                    )
+                    if source == SOURCE_ESP:
+                        data[OPT_WS_COALESCE_WINDOW] = int(
+                            user_input.get(OPT_WS_COALESCE_WINDOW, WS_COALESCE_WINDOW_DEFAULT_SEC)
+                        )
+                    if source == SOURCE_CCA:
+                        data[OPT_STATISTICS_ONLY] = bool(
+                            user_input.get(OPT_STATISTICS_ONLY, STATISTICS_ONLY_DEFAULT)
+                        )
 
                 return self.async_create_entry(title="", data=data)
 
@@ -253,10 +287,42 @@ class TigoOptionsFlow(config_entries.OptionsFlow):
             current_ip = self._config_entry.options.get(
                 CONF_IP_ADDRESS, self._config_entry.data.get(CONF_IP_ADDRESS, "")
             )
+            current_adaptive = self._config_entry.options.get(
+                OPT_ADAPTIVE_POLLING,
+                self._config_entry.data.get(OPT_ADAPTIVE_POLLING, ADAPTIVE_POLLING_DEFAULT),
+            )
+            current_heartbeat = int(self._config_entry.options.get(
+                OPT_STATE_HEARTBEAT,
+                self._config_entry.data.get(OPT_STATE_HEARTBEAT, STATE_HEARTBEAT_DEFAULT_SEC),
+            ))
+            ws_field = {}
+            if source == SOURCE_ESP:
+                current_window = int(self._config_entry.options.get(
+                    OPT_WS_COALESCE_WINDOW,
+                    self._config_entry.data.get(OPT_WS_COALESCE_WINDOW, WS_COALESCE_WINDOW_DEFAULT_SEC),
+                ))
+                ws_field = {
+                    vol.Optional(OPT_WS_COALESCE_WINDOW, default=current_window): vol.All(
+                        vol.Coerce(int), vol.Range(min=0, max=WS_COALESCE_WINDOW_MAX_SEC)
+                    )
+                }
+            stats_field = {}
+            if source == SOURCE_CCA:
+                current_stats_only = self._config_entry.options.get(
+                    OPT_STATISTICS_ONLY,
+                    self._config_entry.data.get(OPT_STATISTICS_ONLY, STATISTICS_ONLY_DEFAULT),
+                )
+                stats_field = {vol.Optional(OPT_STATISTICS_ONLY, default=current_stats_only): bool}
             schema = vol.Schema({
                 vol.Required(CONF_IP_ADDRESS, default=current_ip): str,
                 vol.Required("source", default=source): vol.In(DATA_SOURCE),
                 **scan_field,
+                vol.Optional(OPT_ADAPTIVE_POLLING, default=current_adaptive): bool,
+                vol.Optional(OPT_STATE_HEARTBEAT, default=current_heartbeat): vol.All(
+                    vol.Coerce(int), vol.Range(min=0, max=STATE_HEARTBEAT_MAX_SEC)
+                ),
+                **ws_field,
+                **stats_field,
             })
 
         return self.async_show_form(step_id="init", data_schema=schema, errors=errors)
@@ -48,10 +48,69 @@ SCAN_INTERVAL_DEFAULT_SEC = 30                # default locale (secondi)
 SCAN_INTERVAL_MIN_SEC = 5                     # minimo consigliato (locale)
 SCAN_INTERVAL_MAX_SEC = 600                   # massimo (10 min)
 
+# --- Polling adattivo (sorgenti locali) ---
+# Lo scan interval configurato è il floor diurno; di notte, con potenza stabile
+# o con il device che non risponde l'intervallo si allunga.
+OPT_ADAPTIVE_POLLING = "adaptive_polling"
+ADAPTIVE_POLLING_DEFAULT = True
+
+# --- Scritture di stato ---
+# I sensori pannello scrivono lo stato solo se cambia; opzionalmente si forza
+# una scrittura ogni N secondi anche a valore fermo (0 = mai).
+OPT_STATE_HEARTBEAT = "state_heartbeat"
+STATE_HEARTBEAT_DEFAULT_SEC = 0
+STATE_HEARTBEAT_MAX_SEC = 3600
+
+# --- Push ESP32 (WebSocket) ---
+# Finestra (secondi) in cui i frame WS vengono fusi in un solo aggiornamento
+OPT_WS_COALESCE_WINDOW = "ws_coalesce_window"
+WS_COALESCE_WINDOW_DEFAULT_SEC = 5
+WS_COALESCE_WINDOW_MAX_SEC = 60
+
 # --- Scan interval sorgente CLOUD ---
 # I dati cloud NON sono realtime: la serie per-pannello è a slot di 15 minuti
 # e il caricamento CCA->cloud avviene a intervalli di ~10-15 min. Un polling
 # frequente non dà dati più freschi e rischia il throttle (HTTP 429).
 CLOUD_SCAN_INTERVAL_DEFAULT_SEC = 300        # default cloud (5 min)
 CLOUD_SCAN_INTERVAL_MIN_SEC = 120            # minimo cloud (anti-throttle)
-CLOUD_SCAN_INTERVAL_MAX_SEC = 3600           # massimo cloud (1 ora)
\ No newline at end of file
+CLOUD_SCAN_INTERVAL_MAX_SEC = 3600           # massimo cloud (1 ora)
+# Freschezza dei dati cloud: dopo un refresh completo il prossimo dato è atteso
+# allo slot successivo (+ margine per il caricamento); prima si riusa lo
+# snapshot, dopo si sonda solo homepage finché minLastTime non avanza.
+CLOUD_SLOT_SEC = 900
+CLOUD_UPLOAD_GRACE_SEC = 120
+CLOUD_FULL_REFRESH_MAX_SEC = 3600
+# Budget richieste cloud per account (token bucket) e backoff su 429/5xx
+CLOUD_RATE_PER_HOUR = 240
+CLOUD_RATE_BURST = 30
+CLOUD_BACKOFF_BASE_SEC = 30
+CLOUD_BACKOFF_MAX_SEC = 900
+# --- Cache energia giornaliera (CCA) ---
+# I giorni conclusi non cambiano più: il loro kWh viene salvato nello storage
+# di HA e non più riscaricato. Si tengono al massimo questi giorni.
+ENERGY_CACHE_STORAGE_VERSION = 1
+ENERGY_CACHE_MAX_DAYS = 31
+
+# --- Statistiche a lungo termine (CCA) ---
+# Energia oraria per pannello e di sistema ricostruita dalle righe a minuti
+# e importata come statistiche esterne ("tigo:<prefisso>_<pannello>_energy").
+STATISTICS_STORAGE_VERSION = 1
+STATISTICS_BACKFILL_MAX_DAYS = 30
+STATISTICS_BACKFILL_CONCURRENCY = 2
+
+# Modalità "solo statistiche": le righe a minuti già scaricate vengono
+# aggregate in statistiche orarie (media/min/max per pannello e metrica,
+# energia cumulativa) e i sensori pannello scrivono lo stato al più ogni
+# STATISTICS_ONLY_STATE_INTERVAL_SEC, senza state_class.
+OPT_STATISTICS_ONLY = "statistics_only"
+STATISTICS_ONLY_DEFAULT = False
+STATISTICS_ONLY_STATE_INTERVAL_SEC = 300
+
+# --- Cache del layout (CCA summary_config / cloud tigobuild/config) ---
+# Salvato con un hash del contenuto: all'avvio si usa la copia su disco e la
+# si riconvalida in background; si ricarica l'entry solo se l'hash cambia.
+LAYOUT_CACHE_STORAGE_VERSION = 1
+# Inventario dei pannelli noti: entità create subito al riavvio, senza
+# attendere il primo refresh riuscito
+INVENTORY_STORAGE_VERSION = 1
+CLOUD_ACCOUNTS_STORAGE_VERSION = 1
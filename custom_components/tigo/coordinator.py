@@ -0,0 +1,122 @@
+"""DataUpdateCoordinator delle sorgenti locali con notifica per pannello."""
+from __future__ import annotations
+
+import time
+from collections.abc import Callable, Mapping
+
+from homeassistant.core import CALLBACK_TYPE, callback
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.util import dt as dt_util
+
+from .tigo_api import PANEL_ALL, panel_diff
+
+
+class TigoCoordinator(DataUpdateCoordinator):
+    """Coordinator che sveglia solo le entità dei pannelli/metriche cambiati.
+
+    Le entità si registrano con un contesto ``(panel_id, metrica)`` (vedi
+    ``CoordinatorEntity(coordinator, context)``). Ad ogni aggiornamento si
+    calcola ``panel_diff`` tra i dati notificati l'ultima volta e quelli nuovi
+    e si chiamano solo i listener il cui contesto è nel diff; quelli senza
+    contesto sono sempre notificati. Cambio di disponibilità o di giorno
+    (reset dei contatori di periodo) e scadenza di ``state_heartbeat``
+    notificano tutti.
+
+    I listener con contesto stanno in un registro proprio
+    ``{panel_id: {contesto: {token: callback}}}``, senza dipendere dalla
+    struttura interna dei listener del coordinator base.
+
+    Con ``panel_dispatch=False`` (sorgente cloud) si comporta come il
+    coordinator standard.
+    """
+
+    def __init__(self, *args, panel_dispatch: bool = True, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.panel_dispatch = panel_dispatch
+        self.dirty: set | None = None
+        self._dispatched: dict | None = None
+        self._dispatched_ok: bool | None = None
+        self._dispatched_day = None
+        self._full_dispatch = 0.0
+        self.state_heartbeat = 0
+        self._panel_listeners: dict = {}
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE, context=None) -> Callable[[], None]:
+        if context is None:
+            return super().async_add_listener(update_callback, context)
+        panel = context[0] if isinstance(context, tuple) else context
+        token = object()
+        self._panel_listeners.setdefault(panel, {}).setdefault(context, {})[token] = update_callback
+        # Segnaposto nel coordinator base: tiene la pianificazione del polling
+        # finché esiste almeno un listener, come per quelli senza contesto
+        remove_placeholder = super().async_add_listener(_placeholder)
+
+        @callback
+        def remove_listener() -> None:
+            remove_placeholder()
+            by_context = self._panel_listeners.get(panel, {})
+            callbacks = by_context.get(context, {})
+            callbacks.pop(token, None)
+            if not callbacks:
+                by_context.pop(context, None)
+            if not by_context:
+                self._panel_listeners.pop(panel, None)
+
+        return remove_listener
+
+    def _panel_callbacks(self) -> list:
+        """Callback dei listener con contesto da notificare per ``self.dirty``."""
+        if self.dirty is None:
+            return [
+                cb
+                for by_context in self._panel_listeners.values()
+                for callbacks in by_context.values()
+                for cb in callbacks.values()
+            ]
+        contexts: set = set()
+        for panel, metric in self.dirty:
+            by_context = self._panel_listeners.get(panel)
+            if not by_context:
+                continue
+            if metric == PANEL_ALL:
+                contexts.update(by_context)
+            else:
+                contexts.update(c for c in ((panel, metric), panel) if c in by_context)
+        out = []
+        for context in contexts:
+            panel = context[0] if isinstance(context, tuple) else context
+            out.extend(self._panel_listeners[panel][context].values())
+        return out
+
+    @callback
+    def async_update_listeners(self) -> None:
+        data = self.data
+        today = dt_util.now().date()
+        now = time.monotonic()
+        heartbeat_due = self.state_heartbeat > 0 and now - self._full_dispatch >= self.state_heartbeat
+        if (
+            not self.panel_dispatch
+            or not isinstance(data, Mapping)
+            or not isinstance(self._dispatched, Mapping)
+            or self.last_update_success != self._dispatched_ok
+            or today != self._dispatched_day
+            or heartbeat_due
+        ):
+            self.dirty = None
+            self._full_dispatch = now
+        else:
+            self.dirty = panel_diff(self._dispatched, data)
+        self._dispatched = data
+        self._dispatched_ok = self.last_update_success
+        self._dispatched_day = today
+
+        # Listener senza contesto (entità di sistema, discovery, statistiche)
+        super().async_update_listeners()
+        for update_callback in self._panel_callbacks():
+            update_callback()
+
+
+@callback
+def _placeholder() -> None:
+    """Listener vuoto registrato nel coordinator base per ogni listener con contesto."""
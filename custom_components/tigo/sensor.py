@@ -1,21 +1,27 @@
 from __future__ import annotations
 import asyncio
 import logging
+import time
 from datetime import timedelta, datetime
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.device_registry import async_get
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, CoordinatorEntity
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.helpers import device_registry as dr
-from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.restore_state import RestoredExtraData, RestoreEntity
 from homeassistant.util import dt as dt_util
 
 import calendar
+from collections.abc import Mapping
 
 from .const import DOMAIN, SOURCE_CLOUD, _LOGGER
-from .tigo_api import fetch_tigo_data_from_ip, fetch_tigo_layout_from_ip, fetch_daily_energy, fetch_device_info
+from .tigo_api import PANEL_ALL, PANEL_ENERGY, entity_prefix
+from .tigo_energy import PanelEnergyBackfill
+from .tigo_layout import async_cached_layout
+from .tigo_topology import PanelNode, PanelTopology, cloud_panel_node, panel_node
 
 from homeassistant.const import (
     UnitOfPower,
@@ -23,6 +29,7 @@ from homeassistant.const import (
     UnitOfElectricCurrent,
     UnitOfEnergy,
     SIGNAL_STRENGTH_DECIBELS_MILLIWATT,
+    EntityCategory,
 )
 
 from homeassistant.components.sensor import (
@@ -83,67 +90,42 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
         await _setup_cloud_sensors(hass, entry, async_add_entities)
         return
 
-    safe_ip = ip_address.replace(".", "")
-    cca_prefix = f"{source[:3].lower()}_{safe_ip}"
+    cca_prefix = entity_prefix(source, ip_address)
     _LOGGER.debug("Using stable prefix based on IP: %s", cca_prefix)
     
 
+    local_client = hass.data[DOMAIN][entry.entry_id].get("local_client")
+    energy_cache = hass.data[DOMAIN][entry.entry_id].get("energy_cache")
+    today_accumulator = hass.data[DOMAIN][entry.entry_id].get("today_energy")
+    energy_backfill = hass.data[DOMAIN][entry.entry_id].get("energy_backfill")
+    inventory = hass.data[DOMAIN][entry.entry_id]["panel_inventory"]
+    statistics_only = getattr(coordinator, "statistics_only", False)
+
     if source == "CCA":
-        try:
-            layout = await hass.async_add_executor_job(fetch_tigo_layout_from_ip, ip_address)
-        except Exception as e:
-            _LOGGER.warning("Errore fetch_tigo_layout_from_ip: %s", e)
-            layout = {}
+        # Dalla cache su disco se presente (riconvalida in background)
+        layout = await async_cached_layout(
+            hass, entry, hass.data[DOMAIN][entry.entry_id]["layout_cache"], local_client.fetch_layout, cca_prefix,
+            inventory,
+        )
     else:
         layout = {"system": {"inverters": []}}
         _LOGGER.debug("Skipping layout fetch for ESP32 (using empty layout)")
     
-    layout_map = {}
-    for inverter in layout.get("system", {}).get("inverters", []):
-        layout_map[inverter.get("object_id")] = inverter
-        for mppt in inverter.get("mppts", []):
-            layout_map[mppt.get("object_id")] = mppt
-            for panel in mppt.get("panels", []):
-                layout_map[panel["object_id"]] = panel
-    
-    
-
-    def resolve_parents(panel_id: str, layout_map: dict) -> dict:
-        string_label = None
-        inverter_label = None
-        current_id = panel_id
-
-        for _ in range(2):
-            current = layout_map.get(current_id)
-            if not current or "parent" not in current:
-                break
-            parent_id = current["parent"]
-            parent = layout_map.get(parent_id)
-            if not parent:
-                break
-            parent_type = parent.get("type")
-            if parent_type == "String" or parent_type == 3:
-                string_label = parent.get("label")
-            elif parent_type == "Inverter" or parent_type == 4:
-                inverter_label = parent.get("label")
-            current_id = parent_id
-
-        return {
-            "string": string_label,
-            "inverter": inverter_label,
-        }
+    # Indice pannello → stringa → inverter con device info già pronta
+    topology = PanelTopology.from_layout(layout, cca_prefix)
+    # Pannelli fuori dal layout (ESP32, inventario): nodo costruito una volta
+    extra_nodes: dict = {}
 
-    entities = []
-    panel_data = coordinator.data or {}
     source = getattr(coordinator, "data_source", entry.data.get("source", "CCA"))
-    energy_entities_by_panel = {}
-
-    for panel_id, data in panel_data.items():
-        if not isinstance(data, dict):
-            continue
 
-        layout_info = layout_map.get(panel_id, {})
-        parent_info = resolve_parents(panel_id, layout_map)
+    def describe_panel(panel_id: str, data: dict, known: dict | None) -> dict:
+        """Voce d'inventario del pannello: label, metriche, layout e stringa/inverter."""
+        known = known or {}
+        node = topology.get(panel_id)
+        if node is not None:
+            layout_info, parent_info = node.layout_info(), node.parents
+        else:
+            layout_info, parent_info = known.get("layout") or {}, known.get("parents") or {}
 
         # --- Label leggibile e arricchimento device info per ESP ---
         if source == "ESP32_WS" and not layout_info:
@@ -156,30 +138,122 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
                 "label": display_label,
             }
         else:
-            display_label = layout_info.get("label") or panel_id
+            display_label = layout_info.get("label") or known.get("label") or panel_id
 
-        # sensori standard
-        for param, prop in PANEL_PROPERTIES.items():
+        metrics = set(known.get("metrics") or [])
+        for param in PANEL_PROPERTIES:
             if param == "Temp" and source != "ESP32_WS":
                 continue
             if param in data:
-                entities.append(
-                    TigoPanelSensor(
-                        coordinator,
-                        panel_id,
-                        param,
-                        layout_info,
-                        parent_info,
-                        cca_prefix,
-                        display_label=display_label,
-                        **prop
-                    )
+                metrics.add(param)
+        return {
+            "label": display_label,
+            "metrics": [p for p in PANEL_PROPERTIES if p in metrics],
+            "layout": layout_info,
+            "parents": parent_info,
+        }
+
+    # (panel_id, param) dei sensori già creati; "energy" per il trio energia
+    created: set = set()
+
+    def panel_entities(panel_id: str, info: dict) -> list:
+        out = []
+        node = topology.get(panel_id) or extra_nodes.get(panel_id)
+        if node is None:
+            node = extra_nodes[panel_id] = panel_node(
+                panel_id, info.get("layout"), info.get("parents"), info.get("label"),
+                cca_prefix, f"{cca_prefix}_tigo_system",
+            )
+
+        # sensori standard
+        for param in info.get("metrics") or []:
+            prop = PANEL_PROPERTIES.get(param)
+            if prop is None or (panel_id, param) in created:
+                continue
+            created.add((panel_id, param))
+            if statistics_only:
+                # Storico a lungo termine dalle statistiche orarie importate
+                prop = {**prop, "state_class": None}
+            out.append(
+                TigoPanelSensor(
+                    coordinator,
+                    node,
+                    param,
+                    cca_prefix,
+                    **prop
                 )
+            )
 
-        total_energy = TigoPanelEnergy(coordinator, panel_id, layout_info, parent_info, cca_prefix, display_label)
-        entities.append(total_energy)
-        entities.append(TigoPanelPeriodEnergy(coordinator, "day", total_energy, panel_id, cca_prefix, display_label))
-        entities.append(TigoPanelPeriodEnergy(coordinator, "month", total_energy, panel_id, cca_prefix, display_label))
+        if (panel_id, PANEL_ENERGY) not in created:
+            created.add((panel_id, PANEL_ENERGY))
+            total_energy = TigoPanelEnergy(coordinator, node, cca_prefix, backfill=energy_backfill)
+            out.append(total_energy)
+            out.append(TigoPanelPeriodEnergy(coordinator, "day", total_energy, node, cca_prefix))
+            out.append(TigoPanelPeriodEnergy(coordinator, "month", total_energy, node, cca_prefix))
+        return out
+
+    # Pannelli noti dall'inventario su disco + quelli già nei dati del coordinator:
+    # al riavvio le entità esistono subito, anche col device in standby
+    panels = {pid: describe_panel(pid, {}, info) for pid, info in inventory.panels.items()}
+    for panel_id, data in (coordinator.data or {}).items():
+        if isinstance(data, Mapping):
+            panels[panel_id] = describe_panel(panel_id, data, panels.get(panel_id))
+
+    entities = []
+    for panel_id, info in panels.items():
+        entities.extend(panel_entities(panel_id, info))
+    await inventory.async_update(panels)
+
+    def _discovery_candidates(data: Mapping):
+        """Pannelli da riesaminare: tutti su notifica completa, altrimenti solo quelli del diff
+        nuovi/rinominati o con una metrica che l'inventario non ha ancora."""
+        dirty = coordinator.dirty
+        if dirty is None:
+            return data.keys()
+        out = set()
+        for panel_id, metric in dirty:
+            if panel_id in out:
+                continue
+            if metric == PANEL_ALL:
+                out.add(panel_id)
+            elif metric in PANEL_PROPERTIES:
+                known = inventory.panels.get(panel_id)
+                if known is None or metric not in (known.get("metrics") or []):
+                    out.add(panel_id)
+        return out
+
+    @callback
+    def _async_discover_panels() -> None:
+        """Aggiunge entità per pannelli/metriche comparsi dopo il setup (es. al risveglio)."""
+        all_data = coordinator.data
+        if not isinstance(all_data, Mapping):
+            return
+        found: dict = {}
+        new_entities: list = []
+        for panel_id in _discovery_candidates(all_data):
+            data = all_data.get(panel_id)
+            if not isinstance(data, Mapping):
+                continue
+            known = inventory.panels.get(panel_id)
+            if known is not None:
+                known_metrics = known.get("metrics") or []
+                if all(
+                    param in known_metrics
+                    for param in PANEL_PROPERTIES
+                    if param in data and (param != "Temp" or source == "ESP32_WS")
+                ):
+                    continue
+            info = describe_panel(panel_id, data, known)
+            found[panel_id] = info
+            new_entities.extend(panel_entities(panel_id, info))
+        if not found:
+            return
+        _LOGGER.info("Tigo: %d pannelli nuovi o con nuove metriche, aggiungo %d entità", len(found), len(new_entities))
+        if new_entities:
+            async_add_entities(new_entities)
+        hass.async_create_task(inventory.async_update(found))
+
+    entry.async_on_unload(coordinator.async_add_listener(_async_discover_panels))
 
     device_registry = dr.async_get(hass)
 
@@ -204,29 +278,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
 
     if source == "CCA":
         async def fetch_energy_data():
-            raw = await hass.async_add_executor_job(fetch_daily_energy, ip_address)
-            device_info = await hass.async_add_executor_job(fetch_device_info, ip_address)
-
-            _LOGGER.debug("Risultato da fetch_daily_energy: %s", raw)
-
-            history = raw.get("history", [])
-            today_energy = raw.get("today_energy", 0)
-            yesterday_energy = raw.get("yesterday_energy", 0)
-            weekly_energy = raw.get("weekly_energy", 0)
-
-            history_weekly_named = {
-                f"{d} ({calendar.day_name[datetime.strptime(d, '%Y-%m-%d').weekday()]})": v
-                for d, v in history[-7:]
-            }
-
-            return {
-                "today_energy": today_energy,
-                "yesterday_energy": yesterday_energy,
-                "weekly_energy": weekly_energy,
-                "history": history,
-                "history_weekly_named": history_weekly_named,
-                **device_info,
-            }
+            return await fetch_system_energy(local_client, energy_cache, today_accumulator)
 
         system_coordinator = DataUpdateCoordinator(
             hass,
@@ -236,7 +288,10 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
             update_interval=timedelta(minutes=10),
         )
 
-        await system_coordinator.async_config_entry_first_refresh()
+        # Primo refresh in background: storico e info device non bloccano il setup
+        entry.async_create_background_task(
+            hass, system_coordinator.async_refresh(), f"tigo_system_energy_{ip_address}"
+        )
 
         entities += [
             TigoSystemSensor("Tigo Today Production", "today_energy",
@@ -278,64 +333,140 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_e
 
     async_add_entities(entities)
 
-class TigoPanelSensor(CoordinatorEntity, SensorEntity):
+async def fetch_system_energy(local_client, energy_cache, today_accumulator) -> dict:
+    """Dati del coordinator di sistema CCA: energia oggi/ieri/7 giorni, storico e info device."""
+    raw = await local_client.fetch_daily_energy(energy_cache, today_accumulator)
+    device_info = await local_client.fetch_device_info()
+
+    _LOGGER.debug("Risultato da fetch_daily_energy: %s", raw)
+
+    history = raw.get("history", [])
+    today_kwh = raw.get("today_energy", 0)
+    yesterday_energy = raw.get("yesterday_energy", 0)
+    weekly_energy = raw.get("weekly_energy", 0)
+
+    history_weekly_named = {
+        f"{d} ({calendar.day_name[datetime.strptime(d, '%Y-%m-%d').weekday()]})": v
+        for d, v in history[-7:]
+    }
+
+    return {
+        "today_energy": today_kwh,
+        "yesterday_energy": yesterday_energy,
+        "weekly_energy": weekly_energy,
+        "history": history,
+        "history_weekly_named": history_weekly_named,
+        **device_info,
+    }
+
+
+class _DeltaStateMixin:
+    """Scrive lo stato solo quando valore, nome, attributi o disponibilità cambiano.
+
+    Di notte (tutti zeri) o con valori fermi evita righe ripetute nel recorder
+    ed eventi inutili sul bus. ``coordinator.state_heartbeat`` (secondi, 0 =
+    disattivo) forza comunque una scrittura periodica.
+
+    Le entità con ``_throttled_writes`` scrivono al più ogni
+    ``coordinator.state_min_interval`` secondi (modalità solo statistiche),
+    salvo cambi di disponibilità; l'ultimo valore rimandato viene scritto
+    allo scadere dell'intervallo.
+    """
+
+    _last_written = None
+    _last_write_ts: float | None = None
+    _throttled_writes = False
+    _deferred_write = None
+
+    @callback
+    def _async_deferred_write(self, _now=None) -> None:
+        self._deferred_write = None
+        if self.hass is not None:
+            self._async_write_if_changed()
+
+    async def async_will_remove_from_hass(self) -> None:
+        if self._deferred_write is not None:
+            self._deferred_write()
+            self._deferred_write = None
+        await super().async_will_remove_from_hass()
+
+    def _state_signature(self) -> tuple:
+        return (self.available, self.native_value, self.name, self.extra_state_attributes)
+
+    @callback
+    def _async_write_if_changed(self, force: bool = False) -> None:
+        signature = self._state_signature()
+        now = time.monotonic()
+        if not force and signature == self._last_written:
+            heartbeat = getattr(self.coordinator, "state_heartbeat", 0) or 0
+            if not heartbeat or self._last_write_ts is None or now - self._last_write_ts < heartbeat:
+                return
+        min_interval = getattr(self.coordinator, "state_min_interval", 0) if self._throttled_writes else 0
+        if (
+            not force
+            and min_interval
+            and self._last_write_ts is not None
+            and now - self._last_write_ts < min_interval
+            and self._last_written is not None
+            and self._last_written[0] == signature[0]
+        ):
+            if self._deferred_write is None:
+                self._deferred_write = async_call_later(
+                    self.hass, min_interval - (now - self._last_write_ts), self._async_deferred_write
+                )
+            return
+        self._last_written = signature
+        self._last_write_ts = now
+        self.async_write_ha_state()
+
+
+class TigoPanelSensor(_DeltaStateMixin, CoordinatorEntity, SensorEntity):
+    _throttled_writes = True
+
     def __init__(
         self,
         coordinator,
-        panel_id,
+        node: PanelNode,
         param,
-        layout_info,
-        parent_info,
         cca_prefix,
         name,
         native_unit_of_measurement,
         device_class,
         state_class,
         icon,
-        display_label=None,
     ):
-        super().__init__(coordinator)
-        self._panel_id = panel_id
+        super().__init__(coordinator, (node.panel_id, param))
+        self._node = node
+        self._panel_id = node.panel_id
         self._param = param
-        self._layout = layout_info or {}
-        self._parent_info = parent_info or {}
-        self._display_label = display_label or panel_id
+        self._display_label = node.label
         self._prop_name = name  # es. "Power", "Voltage", ...
-        self._attr_unique_id = f"{cca_prefix}_tigo_{panel_id}_{param.lower()}"
+        self._attr_unique_id = f"{cca_prefix}_tigo_{node.panel_id}_{param.lower()}"
         self._attr_native_unit_of_measurement = native_unit_of_measurement
         self._attr_device_class = device_class
         self._attr_state_class = state_class
         self._attr_icon = icon
-
-        serial = self._layout.get("serial", panel_id)
-        channel = self._layout.get("channel", "unknown")
-        #_LOGGER.debug("Seriale: %s- Channel: %s", serial, channel)
-
-        connections = None
-        if "." in channel:
-            mac = channel.split(".")[0].lower()
-            if len(mac) == 12:
-                connections = {("mac", ":".join([mac[i:i+2] for i in range(0, 12, 2)]))}
-
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"{cca_prefix}_{panel_id}")},
-            "name": f"Panel {self._display_label}",
-            "manufacturer": "Tigo",
-            "model": self._layout.get("type", "Tigo Panel"),
-            "sw_version": channel,
-            "hw_version": serial,
-            "via_device": (DOMAIN, f"{cca_prefix}_tigo_system"),
+        # Device info condivisa dalle entità del pannello (tigo_topology)
+        self._attr_device_info = node.device_info
+        # Attributi fissi: stesso dict ad ogni scrittura dello stato
+        self._static_attributes = {
+            "label": node.label,
+            "serial": node.serial,
+            "channel": node.channel,
+            "param": param,
+            "mp": node.mp,
         }
 
-#        if connections:
-#            self._attr_device_info["connections"] = connections
+        _LOGGER.debug("Creating sensor: Panel %s %s | ID: %s | Param: %s", self._display_label, self._prop_name, node.panel_id, param)
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self._last_written = self._state_signature()
+        self._last_write_ts = time.monotonic()
 
-        area = parent_info.get("string") or parent_info.get("inverter")
-        if area:
-            self._attr_device_info["suggested_area"] = area
-        
-        _LOGGER.debug("Creating sensor: Panel %s %s | ID: %s | Param: %s", self._display_label, self._prop_name, panel_id, param)
-        _LOGGER.debug("Device identifiers: %s", self._attr_device_info["identifiers"])
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        self._async_write_if_changed()
 
     @property
     def _current_label(self) -> str:
@@ -369,15 +500,7 @@ class TigoPanelSensor(CoordinatorEntity, SensorEntity):
 
     @property
     def extra_state_attributes(self):
-        return {
-            "label": self._layout.get("label"),
-            "serial": self._layout.get("serial"),
-            "channel": self._layout.get("channel"),
-            "param": self._param,
-#            "inverter": self._parent_info.get("inverter"),
-#            "string": self._parent_info.get("string"),
-            "mp": self._layout.get("MP"),
-        }
+        return self._static_attributes
 
 class _EnergyIntegrator:
     """Integrazione trapezoidale semplice da W a kWh."""
@@ -404,31 +527,24 @@ class _EnergyIntegrator:
         return self.kwh
 
 
-class TigoPanelEnergy(CoordinatorEntity, SensorEntity, RestoreEntity):
+class TigoPanelEnergy(_DeltaStateMixin, CoordinatorEntity, SensorEntity, RestoreEntity):
     _attr_device_class = SensorDeviceClass.ENERGY
     _attr_state_class = SensorStateClass.TOTAL_INCREASING
     _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
     _attr_icon = "mdi:lightning-bolt"
 
-    def __init__(self, coordinator, panel_id, layout_info, parent_info, cca_prefix, display_label=None):
-        super().__init__(coordinator)
-        self._panel_id = panel_id
-        self._layout = layout_info or {}
-        self._parent_info = parent_info or {}
-        self._display_label = display_label or panel_id
-        self._attr_unique_id = f"{cca_prefix}_tigo_{panel_id}_energy"
+    def __init__(self, coordinator, node: PanelNode, cca_prefix, backfill: PanelEnergyBackfill | None = None):
+        super().__init__(coordinator, (node.panel_id, PANEL_ENERGY))
+        self._node = node
+        self._panel_id = node.panel_id
+        # Solo CCA: i buchi (riavvio HA, poll falliti) si colmano dalle righe a minuti
+        self._backfill = backfill
+        self._integrate_lock = asyncio.Lock()
+        self._display_label = node.label
+        self._attr_unique_id = f"{cca_prefix}_tigo_{node.panel_id}_energy"
         self._integrator = _EnergyIntegrator()
         self._kwh = 0.0
-
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"{cca_prefix}_{panel_id}")},
-            "name": f"Panel {self._display_label}",
-            "manufacturer": "Tigo",
-            "model": self._layout.get("type", "Tigo Panel"),
-            "sw_version": self._layout.get("channel", "unknown"),
-            "hw_version": self._layout.get("serial", panel_id),
-            "via_device": (DOMAIN, f"{cca_prefix}_tigo_system"),
-        }
+        self._attr_device_info = node.device_info
 
     @property
     def _current_label(self) -> str:
@@ -448,29 +564,108 @@ class TigoPanelEnergy(CoordinatorEntity, SensorEntity, RestoreEntity):
                 self._kwh = self._integrator.kwh
             except (TypeError, ValueError):
                 pass
-        self.async_on_remove(self.coordinator.async_add_listener(self._handle_coordinator_update))
-        await self._async_integrate_once()
-        self.async_write_ha_state()
+        if self._backfill is not None:
+            # Ultimo campione integrato prima del riavvio: da lì parte il backfill
+            extra = await self.async_get_last_extra_data()
+            stored = extra.as_dict() if extra else {}
+            last_ts = dt_util.parse_datetime(stored.get("last_ts") or "")
+            if last_ts is not None and last and last.state not in (None, "unknown", "unavailable"):
+                self._integrator.last_ts = last_ts
+                self._integrator.last_w = float(stored.get("last_w") or 0.0)
+        self.async_on_remove(self.coordinator.async_add_listener(
+            self._handle_coordinator_update, self.coordinator_context
+        ))
+        # Niente richieste al CCA qui: l'eventuale buco si colma in background
+        # dopo il primo refresh riuscito
+        self._async_write_if_changed(force=True)
+        if self.coordinator.data:
+            self._handle_coordinator_update()
     
 
+    @property
+    def extra_restore_state_data(self) -> RestoredExtraData:
+        last_ts = self._integrator.last_ts
+        return RestoredExtraData({
+            "last_ts": last_ts.isoformat() if last_ts else None,
+            "last_w": self._integrator.last_w,
+        })
+
+    async def _async_backfill_gap(self, w: float | None) -> None:
+        """Colma con le righe a minuti del CCA il buco dall'ultimo campione integrato."""
+        last_ts = self._integrator.last_ts
+        if self._backfill is None or last_ts is None:
+            return
+        now = dt_util.utcnow()
+        if now - last_ts <= self._backfill.min_gap(self.coordinator.update_interval):
+            return
+        result = await self._backfill.async_panel_energy(self._panel_id, last_ts, now)
+        if result is None:
+            if w is not None:
+                # Storico non disponibile ma dato live sì: niente trapezio sul buco
+                self._integrator.last_ts = None
+            return
+        wh, row_ts, row_w = result
+        self._integrator.kwh += wh / 1000.0
+        if row_ts is None:
+            self._integrator.last_ts = None
+        else:
+            self._integrator.last_ts = row_ts
+            self._integrator.last_w = row_w
+        _LOGGER.debug("Backfill pannello %s: +%.1f Wh da %s a %s", self._panel_id, wh, last_ts, row_ts)
+
     async def _async_integrate_once(self):
-        coord_data = self.coordinator.data or {}
-        pd = coord_data.get(self._panel_id) or {}
+        async with self._integrate_lock:
+            await self._async_integrate_locked()
 
+    def _live_w(self) -> float | None:
+        pd = (self.coordinator.data or {}).get(self._panel_id) or {}
         w_raw = pd.get("Pin")
         w = float(w_raw) if w_raw is not None else None
         if w is not None and w < 0:
             w = 0.0
+        return w
+
+    def _gap_open(self) -> bool:
+        last_ts = self._integrator.last_ts
+        return (
+            self._backfill is not None
+            and last_ts is not None
+            and dt_util.utcnow() - last_ts > self._backfill.min_gap(self.coordinator.update_interval)
+        )
 
-        now = dt_util.utcnow()
-        self._kwh = round(self._integrator.update(w, now), 3)
+    async def _async_integrate_locked(self):
+        coord_data = self.coordinator.data or {}
+        pd = coord_data.get(self._panel_id) or {}
+
+        # Push ESP32: integra tutti i campioni fusi dal coalescer, non solo l'ultimo
+        samples = pd.get("PinSamples")
+        if samples:
+            for ts, w_raw in samples:
+                self._integrator.update(max(float(w_raw), 0.0), ts)
+            self._kwh = round(self._integrator.kwh, 3)
+            return
+
+        if self._gap_open():
+            # Il buco non si integra dal vivo: lo colma il task di backfill
+            if self.coordinator.last_update_success:
+                self._backfill.async_request(self._panel_id, self._async_backfill_then_write)
+            return
+
+        self._kwh = round(self._integrator.update(self._live_w(), dt_util.utcnow()), 3)
+
+    async def _async_backfill_then_write(self) -> None:
+        async with self._integrate_lock:
+            w = self._live_w()
+            await self._async_backfill_gap(w)
+            self._kwh = round(self._integrator.update(w, dt_util.utcnow()), 3)
+        self._async_write_if_changed()
 
     def _handle_coordinator_update(self):
         self.hass.async_create_task(self._async_integrate_then_write())
 
     async def _async_integrate_then_write(self):
         await self._async_integrate_once()
-        self.async_write_ha_state()
+        self._async_write_if_changed()
 
     @property
     def native_value(self):
@@ -479,35 +674,30 @@ class TigoPanelEnergy(CoordinatorEntity, SensorEntity, RestoreEntity):
     @property
     def extra_state_attributes(self):
         return {
-            "serial": self._layout.get("serial"),
-            "channel": self._layout.get("channel"),
+            "serial": self._node.serial,
+            "channel": self._node.channel,
             "source": "Pin (power) trapezoidal integration on coordinator updates",
         }
 
-class TigoPanelPeriodEnergy(CoordinatorEntity, SensorEntity, RestoreEntity):
+class TigoPanelPeriodEnergy(_DeltaStateMixin, CoordinatorEntity, SensorEntity, RestoreEntity):
     _attr_device_class = SensorDeviceClass.ENERGY
     _attr_state_class = SensorStateClass.TOTAL
     _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
     _attr_icon = "mdi:calendar-clock"
     _attr_entity_registry_enabled_default = True
 
-    def __init__(self, coordinator, period: str, total_entity: TigoPanelEnergy,
-                 panel_id: str, cca_prefix: str, display_label: str = None):
-        super().__init__(coordinator)
+    def __init__(self, coordinator, period: str, total_entity: TigoPanelEnergy, node: PanelNode, cca_prefix: str):
+        super().__init__(coordinator, (node.panel_id, PANEL_ENERGY))
         self._period = period
         self._total_entity = total_entity
-        self._panel_id = panel_id
-        self._display_label = display_label or panel_id
-        self._attr_unique_id = f"{cca_prefix}_tigo_{panel_id}_energy_{period}"
+        self._panel_id = node.panel_id
+        self._display_label = node.label
+        self._attr_unique_id = f"{cca_prefix}_tigo_{node.panel_id}_energy_{period}"
         self._baseline = 0.0
         self._period_key = None
         self._value = 0.0
         self._last_reset: datetime | None = None
-
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"{cca_prefix}_{panel_id}")},
-            "via_device": (DOMAIN, f"{cca_prefix}_tigo_system"),
-        }
+        self._attr_device_info = node.device_info
 
     @property
     def _current_label(self) -> str:
@@ -544,9 +734,11 @@ class TigoPanelPeriodEnergy(CoordinatorEntity, SensorEntity, RestoreEntity):
                 except (TypeError, ValueError):
                     pass
 
-        self.async_on_remove(self.coordinator.async_add_listener(self._handle_update))
+        self.async_on_remove(self.coordinator.async_add_listener(
+            self._handle_update, self.coordinator_context
+        ))
         await self._async_recompute()
-        self.async_write_ha_state()
+        self._async_write_if_changed(force=True)
     
 
     async def _async_recompute(self):
@@ -568,7 +760,7 @@ class TigoPanelPeriodEnergy(CoordinatorEntity, SensorEntity, RestoreEntity):
         # il nuovo valore dal coordinator prima che leggiamo native_value
         await asyncio.sleep(0)
         await self._async_recompute()
-        self.async_write_ha_state()
+        self._async_write_if_changed()
 
     @property
     def native_value(self):
@@ -642,17 +834,45 @@ async def _setup_cloud_sensors(hass: HomeAssistant, entry: ConfigEntry, async_ad
             TigoCloudSystemSensor(coordinator, prefix, key, name, unit, dclass, sclass, icon, is_energy)
         )
 
+    # --- Diagnostica: budget richieste dell'account (condiviso tra le entry) ---
+    governor = store["cloud_client"].governor
+    for key, name, unit, icon in (
+        ("requests_hour", "Tigo Cloud Requests Last Hour", "requests", "mdi:swap-vertical"),
+        ("throttled", "Tigo Cloud Throttled Responses", None, "mdi:speedometer-slow"),
+        ("budget", "Tigo Cloud Request Budget", "requests", "mdi:gauge"),
+    ):
+        entities.append(TigoCloudRateSensor(coordinator, prefix, governor, key, name, unit, icon))
+
     # --- Sensori per pannello: energia giornaliera + potenza istantanea ---
-    panels = (coordinator.data or {}).get("panels", {})
-    for oid, info in panels.items():
-        merged = dict(layout.get(oid, {}))
-        merged.update(info)
-        entities.append(TigoCloudPanelEnergy(coordinator, prefix, oid, merged))
-        entities.append(TigoCloudPanelPower(coordinator, prefix, oid, merged))
-        entities.append(TigoCloudPanelReclaimed(coordinator, prefix, oid, merged))
+    # Dal layout (in cache su disco) anche prima del primo refresh riuscito
+    created: set = set()
 
+    topology = PanelTopology.from_cloud_layout(layout, prefix)
+
+    def panel_entities(panels: dict) -> list:
+        out = []
+        for oid, info in panels.items():
+            if oid in created:
+                continue
+            created.add(oid)
+            # Pannello fuori dal layout: nodo dai dati del coordinator
+            node = topology.get(oid) or cloud_panel_node(oid, info, prefix)
+            out.append(TigoCloudPanelEnergy(coordinator, prefix, node))
+            out.append(TigoCloudPanelPower(coordinator, prefix, node))
+            out.append(TigoCloudPanelReclaimed(coordinator, prefix, node))
+        return out
+
+    entities.extend(panel_entities({**layout, **(coordinator.data or {}).get("panels", {})}))
     async_add_entities(entities)
 
+    @callback
+    def _async_discover_panels() -> None:
+        panels = (coordinator.data or {}).get("panels", {})
+        if panels.keys() - created:
+            async_add_entities(panel_entities(panels))
+
+    entry.async_on_unload(coordinator.async_add_listener(_async_discover_panels))
+
 
 def _wh_to_kwh(v):
     try:
@@ -723,6 +943,41 @@ class TigoCloudSystemSensor(CoordinatorEntity, SensorEntity):
         return {"last_data": system.get("last_data")}
 
 
+class TigoCloudRateSensor(CoordinatorEntity, SensorEntity):
+    """Contatore diagnostico del governatore delle richieste cloud."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, coordinator, prefix, governor, key, name, unit, icon):
+        super().__init__(coordinator)
+        self._governor = governor
+        self._key = key
+        self._attr_name = name
+        self._attr_unique_id = f"{prefix}_rate_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_icon = icon
+        if key == "throttled":
+            self._attr_state_class = SensorStateClass.TOTAL_INCREASING
+        self._attr_device_info = {"identifiers": {(DOMAIN, f"{prefix}_system")}}
+
+    @property
+    def available(self) -> bool:
+        # Il contatore vale anche se l'ultimo poll è fallito (es. account in pausa)
+        return True
+
+    @property
+    def native_value(self):
+        return self._governor.stats()[self._key]
+
+    @property
+    def extra_state_attributes(self):
+        if self._key != "budget":
+            return None
+        stats = self._governor.stats()
+        return {"per_hour": self._governor.per_hour, "blocked_for_s": stats["blocked_for"]}
+
+
 class TigoCloudPanelEnergy(CoordinatorEntity, SensorEntity):
     """Energia giornaliera di un singolo pannello (dato cloud)."""
 
@@ -731,27 +986,14 @@ class TigoCloudPanelEnergy(CoordinatorEntity, SensorEntity):
     _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
     _attr_icon = "mdi:solar-panel"
 
-    def __init__(self, coordinator, prefix, panel_id, info):
+    def __init__(self, coordinator, prefix, node: PanelNode):
         super().__init__(coordinator)
         self._prefix = prefix
-        self._panel_id = str(panel_id)
-        self._info = info or {}
-        label = self._info.get("name") or self._panel_id
+        self._node = node
+        self._panel_id = node.panel_id
         self._attr_unique_id = f"{prefix}_{self._panel_id}_energy_today"
-        self._attr_name = f"Panel {label} Energy Today"
-
-        serial = self._info.get("serial") or self._panel_id
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"{prefix}_{self._panel_id}")},
-            "name": f"Panel {label}",
-            "manufacturer": "Tigo",
-            "model": "Tigo Panel",
-            "hw_version": serial,
-            "via_device": (DOMAIN, f"{prefix}_system"),
-        }
-        area = self._info.get("string") or self._info.get("inverter")
-        if area:
-            self._attr_device_info["suggested_area"] = area
+        self._attr_name = f"Panel {node.label} Energy Today"
+        self._attr_device_info = node.device_info
 
     def _panel(self) -> dict:
         return ((self.coordinator.data or {}).get("panels", {}) or {}).get(self._panel_id, {})
@@ -767,13 +1009,14 @@ class TigoCloudPanelEnergy(CoordinatorEntity, SensorEntity):
     @property
     def extra_state_attributes(self):
         p = self._panel()
+        node = self._node
         return {
-            "serial": self._info.get("serial"),
-            "short_serial": self._info.get("short_serial"),
-            "channel": self._info.get("channel"),
-            "string": self._info.get("string"),
-            "inverter": self._info.get("inverter"),
-            "watt_rating": self._info.get("watt_rating"),
+            "serial": node.serial,
+            "short_serial": node.short_serial,
+            "channel": node.channel,
+            "string": node.string,
+            "inverter": node.inverter,
+            "watt_rating": node.watt_rating,
             "last_data": p.get("last_data"),
         }
 
@@ -785,19 +1028,17 @@ class TigoCloudPanelPower(CoordinatorEntity, SensorEntity):
     _attr_state_class = SensorStateClass.MEASUREMENT
     _attr_native_unit_of_measurement = UnitOfPower.WATT
     _attr_icon = "mdi:solar-power"
+    # La curva del giorno (fino a 96 punti) non va scritta nel recorder a ogni stato
+    _unrecorded_attributes = frozenset({"power_curve"})
 
-    def __init__(self, coordinator, prefix, panel_id, info):
+    def __init__(self, coordinator, prefix, node: PanelNode):
         super().__init__(coordinator)
         self._prefix = prefix
-        self._panel_id = str(panel_id)
-        self._info = info or {}
-        label = self._info.get("name") or self._panel_id
+        self._node = node
+        self._panel_id = node.panel_id
         self._attr_unique_id = f"{prefix}_{self._panel_id}_power"
-        self._attr_name = f"Panel {label} Power"
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"{prefix}_{self._panel_id}")},
-            "via_device": (DOMAIN, f"{prefix}_system"),
-        }
+        self._attr_name = f"Panel {node.label} Power"
+        self._attr_device_info = node.device_info
 
     def _panel(self) -> dict:
         return ((self.coordinator.data or {}).get("panels", {}) or {}).get(self._panel_id, {})
@@ -814,9 +1055,10 @@ class TigoCloudPanelPower(CoordinatorEntity, SensorEntity):
     def extra_state_attributes(self):
         p = self._panel()
         return {
-            "serial": self._info.get("serial"),
-            "string": self._info.get("string"),
+            "serial": self._node.serial,
+            "string": self._node.string,
             "sample_time": p.get("power_time"),
+            "power_curve": _day_curve(self.coordinator, "pin", self._panel_id),
         }
 
 
@@ -827,18 +1069,14 @@ class TigoCloudPanelReclaimed(CoordinatorEntity, SensorEntity):
     _attr_state_class = SensorStateClass.MEASUREMENT
     _attr_native_unit_of_measurement = UnitOfPower.WATT
     _attr_icon = "mdi:recycle"
+    _unrecorded_attributes = frozenset({"reclaimed_curve"})
 
-    def __init__(self, coordinator, prefix, panel_id, info):
+    def __init__(self, coordinator, prefix, node: PanelNode):
         super().__init__(coordinator)
-        self._panel_id = str(panel_id)
-        self._info = info or {}
-        label = self._info.get("name") or self._panel_id
+        self._panel_id = node.panel_id
         self._attr_unique_id = f"{prefix}_{self._panel_id}_reclaimed"
-        self._attr_name = f"Panel {label} Reclaimed Power"
-        self._attr_device_info = {
-            "identifiers": {(DOMAIN, f"{prefix}_{self._panel_id}")},
-            "via_device": (DOMAIN, f"{prefix}_system"),
-        }
+        self._attr_name = f"Panel {node.label} Reclaimed Power"
+        self._attr_device_info = node.device_info
 
     def _panel(self) -> dict:
         return ((self.coordinator.data or {}).get("panels", {}) or {}).get(self._panel_id, {})
@@ -851,6 +1089,18 @@ class TigoCloudPanelReclaimed(CoordinatorEntity, SensorEntity):
         except (TypeError, ValueError):
             return None
 
+    @property
+    def extra_state_attributes(self):
+        return {"reclaimed_curve": _day_curve(self.coordinator, "reclaimedPower", self._panel_id)}
+
+
+def _day_curve(coordinator, temp: str, panel_id: str) -> list:
+    """Curva a 15 min della giornata ``[[orario, W], ...]`` dalle serie del client cloud."""
+    series = (getattr(coordinator, "cloud_series", None) or {}).get(temp)
+    if series is None:
+        return []
+    return [[t, v] for t, v in series.curve(panel_id)]
+
 
 class TigoSystemSensor(CoordinatorEntity, SensorEntity):
     def __init__(self, name, key, unit, unique_id, coordinator, cca_prefix, device_class=None, icon=None):
@@ -874,7 +1124,8 @@ class TigoSystemSensor(CoordinatorEntity, SensorEntity):
 
     @property
     def native_value(self):
-        value = self.coordinator.data.get(self._key)
+        # Primo refresh in background: i dati possono non esserci ancora
+        value = (self.coordinator.data or {}).get(self._key)
 
         if isinstance(value, dict):
             try:
@@ -893,8 +1144,9 @@ class TigoSystemSensor(CoordinatorEntity, SensorEntity):
 
     @property
     def extra_state_attributes(self):
-        raw_history = self.coordinator.data.get("history") or []
-        weekly_energy = self.coordinator.data.get("weekly_energy", 0)
+        data = self.coordinator.data or {}
+        raw_history = data.get("history") or []
+        weekly_energy = data.get("weekly_energy", 0)
 
         history_weekly_named = {
             f"{d} ({calendar.day_name[datetime.strptime(d, '%Y-%m-%d').weekday()]})": v
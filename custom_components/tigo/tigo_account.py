@@ -0,0 +1,154 @@
+"""Registro degli account cloud Tigo condivisi tra le config entry.
+
+Ogni entry cloud creava il suo ``TigoCloudClient`` con la sua sessione e il
+suo ``login()``, e il config flow ne creava un altro ancora: con più impianti
+sotto lo stesso account erano N login e N pool di connessioni aperti.
+
+Ora c'è un ``CloudAccount`` per username (token, sessione HTTP, budget
+richieste, layout già letti), con un conteggio delle entry che lo usano:
+si chiude quando l'ultima viene scaricata. Il token viene
+salvato nello storage di HA (``.storage/tigo.cloud_accounts``) insieme a un
+HMAC delle credenziali, così un riavvio non rifà il login di ogni account;
+se la password cambia il token salvato viene ignorato. La chiave dell'HMAC
+è casuale per installazione e sta in un file a parte
+(``.storage/tigo.cloud_accounts_key``): nello storage dei token non finisce
+nulla ricavabile dalla sola password. Il budget richieste
+(``tigo_ratelimit``) resta per username e sopravvive ai reload.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import secrets
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import CLOUD_ACCOUNTS_STORAGE_VERSION, DOMAIN, _LOGGER
+from .tigo_cloud import CloudAccount
+from .tigo_ratelimit import governor_for
+
+# Chiave di hass.data con store, token salvati e account attivi
+ACCOUNTS_KEY = f"{DOMAIN}_cloud_accounts"
+# Ritardo del salvataggio del token (più refresh ravvicinati → una scrittura)
+TOKEN_SAVE_DELAY_SEC = 5
+
+
+def account_key(username: str) -> str:
+    return (username or "").strip().lower()
+
+
+def _credentials_mac(secret: bytes, username: str, password: str) -> str:
+    raw = f"{account_key(username)}\n{password or ''}"
+    return hmac.new(secret, raw.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+async def _async_secret(hass: HomeAssistant) -> bytes:
+    """Chiave HMAC dell'installazione, creata al primo uso."""
+    store = Store(hass, CLOUD_ACCOUNTS_STORAGE_VERSION, f"{DOMAIN}.cloud_accounts_key", private=True)
+    try:
+        stored = await store.async_load()
+        return bytes.fromhex(stored["key"])
+    except Exception:
+        pass
+    key = secrets.token_bytes(32)
+    await store.async_save({"key": key.hex()})
+    return key
+
+
+async def _async_registry(hass: HomeAssistant) -> dict:
+    registry = hass.data.get(ACCOUNTS_KEY)
+    if registry is not None:
+        return registry
+    # Un solo caricamento alla volta: la chiave HMAC va creata una volta sola
+    async with hass.data.setdefault(f"{ACCOUNTS_KEY}_lock", asyncio.Lock()):
+        return await _async_load_registry(hass)
+
+
+async def _async_load_registry(hass: HomeAssistant) -> dict:
+    registry = hass.data.get(ACCOUNTS_KEY)
+    if registry is None:
+        store = Store(hass, CLOUD_ACCOUNTS_STORAGE_VERSION, f"{DOMAIN}.cloud_accounts", private=True)
+        try:
+            stored = await store.async_load()
+        except Exception as e:
+            _LOGGER.warning("Token cloud salvati non leggibili, rifaccio il login: %s", e)
+            stored = None
+        secret = await _async_secret(hass)
+        registry = hass.data[ACCOUNTS_KEY] = {
+            "store": store,
+            "secret": secret,
+            "tokens": dict((stored or {}).get("tokens") or {}),
+            "accounts": {},
+            "users": {},
+        }
+        if (stored or {}).get("accounts"):
+            # Formato precedente (sha256 non salato delle credenziali): si riscrive
+            # senza, i token si riottengono col prossimo login
+            await store.async_save({"tokens": registry["tokens"]})
+    return registry
+
+
+async def async_acquire_account(hass: HomeAssistant, username: str, password: str) -> CloudAccount:
+    """``CloudAccount`` condiviso dell'username (creato al primo uso).
+
+    Va rilasciato con ``async_release_account`` (es. all'unload dell'entry).
+    """
+    registry = await _async_registry(hass)
+    user = account_key(username)
+    auth = _credentials_mac(registry["secret"], username, password)
+    # Credenziali diverse (password appena cambiata, o sbagliata nel config
+    # flow) non toccano l'account in uso dalle altre entry
+    key = (user, auth)
+    account: CloudAccount | None = registry["accounts"].get(key)
+
+    if account is None:
+        saved = registry["tokens"].get(user) or {}
+        token = saved.get("token") if saved.get("auth") == auth else None
+
+        def _on_token(new_token: str) -> None:
+            # Chiamato dai thread dell'executor: il salvataggio va sul loop
+            hass.loop.call_soon_threadsafe(_save_token, hass, user, auth, new_token)
+
+        account = CloudAccount(username, password, token, governor_for(hass, username), _on_token)
+        registry["accounts"][key] = account
+        registry["users"][key] = 0
+    registry["users"][key] += 1
+    return account
+
+
+@callback
+def async_release_account(hass: HomeAssistant, account: CloudAccount) -> None:
+    """Rilascia l'account; chiude sessione e pool quando nessuno lo usa più."""
+    registry = hass.data.get(ACCOUNTS_KEY)
+    if registry is None:
+        return
+    key = (
+        account_key(account.username),
+        _credentials_mac(registry["secret"], account.username, account.password),
+    )
+    if registry["accounts"].get(key) is not account:
+        return
+    registry["users"][key] -= 1
+    if registry["users"][key] <= 0:
+        registry["accounts"].pop(key)
+        registry["users"].pop(key)
+        account.close()
+
+
+@callback
+def _save_token(hass: HomeAssistant, user: str, auth: str, token: str) -> None:
+    registry = hass.data.get(ACCOUNTS_KEY)
+    if registry is None:
+        return
+    registry["tokens"][user] = {"token": token, "auth": auth}
+    tokens = registry["tokens"]
+    registry["store"].async_delay_save(lambda: {"tokens": tokens}, TOKEN_SAVE_DELAY_SEC)
+
+
+async def async_forget_account(hass: HomeAssistant, username: str) -> None:
+    """Cancella il token salvato dell'username (rimossa l'ultima entry dell'account)."""
+    registry = await _async_registry(hass)
+    if registry["tokens"].pop(account_key(username), None) is not None:
+        await registry["store"].async_save({"tokens": registry["tokens"]})
@@ -1,25 +1,20 @@
 import re
-import socket
-import requests
 from datetime import datetime, timedelta
 import logging
 import time
 import websocket
 import json
-from requests.adapters import HTTPAdapter
-from .const import AUTH_HEADER, FIRMWARE_CLOUD_MIN, _LOGGER
-
-_session: requests.Session | None = None
-
-def _get_session() -> requests.Session:
-    global _session
-    if _session is None:
-        s = requests.Session()
-        adapter = HTTPAdapter(max_retries=0, pool_connections=10, pool_maxsize=10)
-        s.mount("http://", adapter)
-        s.mount("https://", adapter)
-        _session = s
-    return _session
+from array import array
+from collections.abc import Mapping
+from .const import _LOGGER
+from .tigo_snapshot import PanelSnapshot, snapshot_from_columns
+from .tigo_summary import SummaryCursor
+
+# Metriche lette da summary_data ad ogni poll: la prima risposta "pin"
+# fornisce anche l'ordine dei pannelli e viene riusata.
+SNAPSHOT_METRICS = ("pin", "vin", "rssi")
+# Dimensione dei pezzi letti in streaming da summary_data
+STREAM_CHUNK_SIZE = 8192
 
 _LAST_LOG = {}  # {key: epoch}
 def _log_throttled(key: str, level: int, msg: str, min_interval_sec: int = 1800) -> None:
@@ -29,28 +24,6 @@ def _log_throttled(key: str, level: int, msg: str, min_interval_sec: int = 1800)
         _LAST_LOG[key] = now
         _LOGGER.log(level, msg)
 
-def _get_json(url: str, *, params: dict | None = None, timeout: float = 6.0) -> dict | list | None:
-    s = _get_session()
-    try:
-        r = s.get(url, headers=AUTH_HEADER, params=params or {}, timeout=timeout)
-        r.raise_for_status()
-        return r.json()
-    except requests.exceptions.ConnectTimeout:
-        _log_throttled(f"timeout:{url}", logging.INFO, f"Tigo timeout su {url}: probabile standby notturno")
-        return None
-    except requests.exceptions.ReadTimeout:
-        _log_throttled(f"readtimeout:{url}", logging.INFO, f"Tigo read-timeout su {url}: probabile standby notturno")
-        return None
-    except requests.exceptions.ConnectionError as e:
-        _log_throttled(f"connerr:{url}", logging.INFO, f"Tigo non raggiungibile ({e.__class__.__name__}): {url}")
-        return None
-    except ValueError as e:
-        _log_throttled(f"badjson:{url}", logging.WARNING, f"Tigo JSON non valido da {url}: {e}")
-        return None
-    except Exception as e:
-        _log_throttled(f"generic:{url}", logging.WARNING, f"Errore generico su {url}: {e}")
-        return None
-
 def fetch_tigo_data_from_ws(ws_url: str) -> dict:
     """Legge i dati dal WS e li restituisce come dict {panel_id: {...}}"""
     try:
@@ -61,9 +34,15 @@ def fetch_tigo_data_from_ws(ws_url: str) -> dict:
     except Exception as e:
         _log_throttled(f"ws:{ws_url}", logging.INFO, f"Errore WS fetch: {e}")
         return {}
+    return parse_ws_frame(data_list)
 
+
+def parse_ws_frame(data_list: list | None) -> dict:
+    """Converte un frame JSON dell'ESP32 (lista di moduli) in {panel_id: {...}}."""
     panel_data = {}
     for mod in data_list or []:
+        if not isinstance(mod, dict):
+            continue
         barcode = mod.get("barcode") or None
         addr = mod.get("addr") or None
         generic_id = mod.get("id")
@@ -88,69 +67,95 @@ def fetch_tigo_data_from_ws(ws_url: str) -> dict:
     return panel_data
 
 
-def fetch_tigo_data_from_ip(ip: str) -> dict:
-    base_url = f"http://{ip}/cgi-bin/summary_data"
-    date = datetime.now().date().isoformat()
-    temps = ["vin", "pin", "rssi"]
+def entity_prefix(source: str, ip: str) -> str:
+    """Prefisso stabile degli unique_id locali (es. ``cca_192168110``)."""
+    return f"{source[:3].lower()}_{ip.replace('.', '')}"
 
-    panel_data: dict[str, dict] = {}
 
-    params = {"date": date, "temp": "pin", "_": int(time.time())}
-    data = _get_json(base_url, params=params, timeout=6.0)
-    if not isinstance(data, dict):
-        return {}
-    dataset = data.get("dataset", [])
+def _summary_params(date: str, temp: str) -> dict:
+    return {"date": date, "temp": temp, "_": int(time.time())}
+
+
+def _last_row_values(dataset: list, fallback_order: list) -> dict[str, float]:
+    """Valori dell'ultima riga con dati del dataset summary_data: {panel: valore}."""
+    for block in reversed(dataset):
+        current_order = block.get("order") or fallback_order
+        for entry in reversed(block.get("data", [])):
+            raw = entry.get("d")
+            if not raw:
+                continue
+            values: dict[str, float] = {}
+            for i, panel in enumerate(current_order):
+                if i < len(raw):
+                    try:
+                        values[panel] = float(raw[i])
+                    except (TypeError, ValueError):
+                        values[panel] = 0.0
+            return values
+    return {}
+
+
+def _finalize_snapshot(snapshot: PanelSnapshot) -> PanelSnapshot:
+    """Normalizza RSSI (sempre negativo in dBm) e calcola Iin = Pin / Vin."""
+    columns = snapshot.columns
+    rssi = columns.get("Rssi")
+    if rssi is not None:
+        for i, v in enumerate(rssi):
+            if v > 0:
+                rssi[i] = -v
+
+    pin = columns.get("Pin")
+    vin = columns.get("Vin")
+    iin = array("d", [0.0]) * len(snapshot)
+    if pin is not None and vin is not None:
+        for i, v in enumerate(vin):
+            if v > 0:
+                p = pin[i]
+                iin[i] = round((0.0 if p != p else p) / v, 2)
+    columns["Iin"] = iin
+    return snapshot
+
+
+def snapshot_order(first: dict | list | None) -> list | None:
+    """Ordine dei pannelli dalla prima risposta ``pin``; None se non valida."""
+    if not isinstance(first, dict):
+        return None
+    dataset = first.get("dataset", [])
     if not dataset or "order" not in dataset[0]:
-        return {}
+        return None
+    return dataset[0]["order"]
 
-    panel_order = dataset[0]["order"]
 
-    for temp in temps:
-        params = {"date": date, "temp": temp, "_": int(time.time())}
-        data = _get_json(base_url, params=params, timeout=6.0)
+def build_snapshot_panels(
+    responses: dict,
+    panel_order: list,
+    date: str,
+    cursor: SummaryCursor | None = None,
+    stats: dict | None = None,
+) -> PanelSnapshot:
+    """Fonde le risposte summary_data {temp: risposta} in uno snapshot {panel_id: {"Pin", "Vin", ...}}.
+
+    Il risultato è un ``PanelSnapshot`` a colonne (una per metrica), letto
+    come un dict di dict.
+    """
+    values: dict[str, dict] = {}
+    for temp in SNAPSHOT_METRICS:
+        data = responses.get(temp)
         if not isinstance(data, dict):
             continue
-        ds = data.get("dataset", [])
-        if not ds:
-            continue
-
-        for block in reversed(ds):
-            current_order = block.get("order") or panel_order
-            for entry in reversed(block.get("data", [])):
-                raw = entry.get("d")
-                if not raw:
-                    continue
-                for i, panel in enumerate(current_order):
-                    if i < len(raw):
-                        try:
-                            val = float(raw[i])
-                        except (TypeError, ValueError):
-                            val = 0.0
-                        k = temp.capitalize()
-                        panel_data.setdefault(panel, {})[k] = val
-                break
-            if panel_data:
-                break
-
-    for panel, values in panel_data.items():
-        # RSSI è sempre negativo in dBm
-        rssi = values.get("Rssi")
-        if rssi is not None and rssi != 0:
-            values["Rssi"] = -abs(rssi)
-
-        try:
-            vin = float(values.get("Vin", 0) or 0)
-            pin = float(values.get("Pin", 0) or 0)
-            values["Iin"] = round(pin / vin, 2) if vin > 0 else 0.0
-        except (TypeError, ValueError):
-            values["Iin"] = 0.0
-
-    return panel_data or {}
-
-
-def fetch_tigo_layout_from_ip(ip: str) -> dict:
-    url = f"http://{ip}/cgi-bin/summary_config"
-    data = _get_json(url, timeout=6.0)
+        ds = data.get("dataset") or []
+        if cursor is not None:
+            rows = cursor.consume(temp, date, ds, panel_order)
+            if stats is not None:
+                stats["rows"] = stats.get("rows", 0) + rows
+            values[temp.capitalize()] = cursor.latest(temp)
+        else:
+            values[temp.capitalize()] = _last_row_values(ds, panel_order)
+    return _finalize_snapshot(snapshot_from_columns(panel_order, values))
+
+
+def parse_layout(data: dict | list | None) -> dict:
+    """Converte la risposta summary_config in {"system": {"inverters": [...]}}."""
     if not isinstance(data, list):
         return {}
 
@@ -194,45 +199,39 @@ def fetch_tigo_layout_from_ip(ip: str) -> dict:
     return layout
 
 
-def fetch_tigo_energy_history(ip: str) -> list[dict]:
-    url = f"http://{ip}/cgi-bin/summary_energy"
-    data = _get_json(url, timeout=6.0)
+def parse_energy_history(data: dict | list | None) -> list[dict]:
     if not isinstance(data, list):
         return []
     return [{"date": d[0], "energy_wh": d[1]} for d in data if isinstance(d, list) and len(d) == 2]
 
-def fetch_daily_energy(ip: str) -> dict:
-    base_url = f"http://{ip}/cgi-bin/summary_data"
+
+def day_energy_kwh(data: dict | list | None) -> float:
+    """kWh della giornata da una risposta summary_data?temp=pin (righe a minuti, W)."""
+    if not isinstance(data, dict):
+        return 0.0
+    dataset = data.get("dataset", [])
+    total_wh = 0.0
+    for block in dataset or []:
+        for entry in block.get("data", []):
+            values = entry.get("d", [])
+            minute_sum = 0.0
+            for v in values:
+                try:
+                    minute_sum += float(v)
+                except (TypeError, ValueError):
+                    pass
+            total_wh += minute_sum / 60.0
+    return round(total_wh / 1000.0, 2)
+
+
+def energy_history_dates(days: int = 7) -> list:
+    """Date (dalla più vecchia a oggi) su cui calcolare lo storico energia."""
     today = datetime.now().date()
-    history = []
+    return [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
 
-    def get_day_energy(date_str: str) -> float:
-        params = {"date": date_str, "temp": "pin", "_": int(time.time())}
-        data = _get_json(base_url, params=params, timeout=8.0)
-        if not isinstance(data, dict):
-            return 0.0
-        dataset = data.get("dataset", [])
-        total_wh = 0.0
-        for block in dataset or []:
-            for entry in block.get("data", []):
-                values = entry.get("d", [])
-                minute_sum = 0.0
-                for v in values:
-                    try:
-                        minute_sum += float(v)
-                    except (TypeError, ValueError):
-                        pass
-                total_wh += minute_sum / 60.0
-        return round(total_wh / 1000.0, 2)
-
-    for i in range(6, -1, -1):
-        date_obj = today - timedelta(days=i)
-        date_str = date_obj.isoformat()
-        energy = get_day_energy(date_str)
-        if date_obj != today and energy == 0.0:
-            energy = get_day_energy(date_str)
-        history.append([date_str, energy])
 
+def summarize_daily_energy(history: list[list]) -> dict:
+    """Totali oggi/ieri/7 giorni dallo storico [[date, kWh], ...] (ordinato per data)."""
     weekly_energy = sum(val for _, val in history[-7:])
     yesterday_energy = history[-2][1] if len(history) >= 2 else 0.0
     today_energy = history[-1][1] if history else 0.0
@@ -251,6 +250,7 @@ def fetch_daily_energy(ip: str) -> dict:
         "history_named": history_named,
     }
 
+
 def _parse_version(software: str | None) -> tuple[int, ...] | None:
     """Estrae una tupla di versione da una stringa tipo '4.0.4' o '4.0.4-abc'."""
     if not software:
@@ -261,55 +261,7 @@ def _parse_version(software: str | None) -> tuple[int, ...] | None:
     return tuple(int(x) for x in m.groups())
 
 
-def _tcp_reachable(ip: str, port: int = 80, timeout: float = 3.0) -> bool:
-    try:
-        with socket.create_connection((ip, port), timeout=timeout):
-            return True
-    except OSError:
-        return False
-
-
-def probe_local(ip: str) -> dict:
-    """Sonda il CCA locale per decidere se usare la sorgente locale o il cloud.
-
-    Ritorna:
-      - reachable: il device risponde su TCP:80
-      - software: versione firmware se leggibile con la vecchia password
-      - local_ok: si sono ottenuti dati validi dei pannelli in locale
-      - requires_cloud: firmware >= FIRMWARE_CLOUD_MIN, oppure raggiungibile ma
-        senza accesso locale ai dati (password nuova) -> serve login cloud
-    """
-    reachable = _tcp_reachable(ip)
-    info = fetch_device_info(ip) if reachable else {}
-    software = info.get("software")
-    version = _parse_version(software)
-
-    local_ok = False
-    if reachable:
-        try:
-            local_ok = bool(fetch_tigo_data_from_ip(ip))
-        except Exception:
-            local_ok = False
-
-    if version is not None:
-        requires_cloud = version >= FIRMWARE_CLOUD_MIN
-    else:
-        # Versione non leggibile: se raggiungibile ma senza dati locali,
-        # il firmware nuovo ha bloccato il locale -> cloud.
-        requires_cloud = reachable and not local_ok
-
-    return {
-        "reachable": reachable,
-        "software": software,
-        "version": version,
-        "local_ok": local_ok,
-        "requires_cloud": requires_cloud,
-    }
-
-
-def fetch_device_info(ip: str) -> dict:
-    url = f"http://{ip}/cgi-bin/mobile_api?cmd=DEVICE_INFO"
-    data = _get_json(url, timeout=6.0)
+def parse_device_info(data: dict | list | None) -> dict:
     if not isinstance(data, dict):
         return {}
 
@@ -324,3 +276,66 @@ def fetch_device_info(ip: str) -> dict:
     }
     return readable_status
 
+
+# Chiave di contesto per le entità che dipendono da tutto il pannello (es. nome)
+PANEL_ALL = "*"
+# Chiave di contesto per le entità energia: serve integrare anche a Pin costante
+PANEL_ENERGY = "energy"
+
+
+def panel_diff(old: dict, new: dict) -> set:
+    """Insieme delle chiavi cambiate tra due dati {panel_id: {metrica: valore}}.
+
+    Contiene ``(panel_id, metrica)`` per ogni valore cambiato,
+    ``(panel_id, PANEL_ALL)`` per pannelli nuovi/rimossi o rinominati e
+    ``(panel_id, PANEL_ENERGY)`` quando l'energia va integrata: Pin diverso da
+    zero (l'energia cresce anche a potenza costante) o appena cambiato. Con
+    tutti i pannelli a zero (notte) il diff è vuoto.
+    """
+    if isinstance(old, PanelSnapshot) and isinstance(new, PanelSnapshot) and old.index is new.index:
+        return _snapshot_diff(old, new)
+    dirty: set = set()
+    for panel_id in old.keys() | new.keys():
+        before = old.get(panel_id)
+        after = new.get(panel_id)
+        if not isinstance(before, Mapping) or not isinstance(after, Mapping):
+            dirty.add((panel_id, PANEL_ALL))
+            continue
+        if before is not after and before != after:
+            for key in before.keys() | after.keys():
+                if before.get(key) != after.get(key):
+                    dirty.add((panel_id, key))
+            if before.get("PanelName") != after.get("PanelName"):
+                dirty.add((panel_id, PANEL_ALL))
+        if (panel_id, "Pin") in dirty or (panel_id, "PinSamples") in dirty or after.get("Pin"):
+            dirty.add((panel_id, PANEL_ENERGY))
+    return dirty
+
+
+def _snapshot_diff(old: PanelSnapshot, new: PanelSnapshot) -> set:
+    """``panel_diff`` tra snapshot con lo stesso indice: si scorrono solo le colonne cambiate."""
+    dirty: set = set()
+    ids = new.index.ids
+    for metric in old.columns.keys() | new.columns.keys():
+        if not new.column_changed(metric, old):
+            continue
+        # Colonna assente = tutti i valori assenti
+        missing = [None] * len(ids)
+        a = old.columns.get(metric) or missing
+        b = new.columns.get(metric) or missing
+        for i, (x, y) in enumerate(zip(a, b)):
+            # NaN/None: valore assente; assente in entrambi non è un cambio
+            if x != y and not (_absent(x) and _absent(y)):
+                dirty.add((ids[i], metric))
+                if metric == "PanelName":
+                    dirty.add((ids[i], PANEL_ALL))
+    pin = new.columns.get("Pin")
+    for i, panel_id in enumerate(ids):
+        w = pin[i] if pin is not None else 0.0
+        if (panel_id, "Pin") in dirty or (panel_id, "PinSamples") in dirty or (w and w == w):
+            dirty.add((panel_id, PANEL_ENERGY))
+    return dirty
+
+
+def _absent(v) -> bool:
+    return v is None or v != v
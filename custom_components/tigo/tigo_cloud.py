@@ -18,12 +18,29 @@ dalla sorgente locale con firmware < 4.0.4.
 """
 from __future__ import annotations
 
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+from urllib.parse import quote
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from .const import CLOUD_BASE, CLOUD_HEADERS, _LOGGER
+from .const import (
+    CLOUD_BASE,
+    CLOUD_FULL_REFRESH_MAX_SEC,
+    CLOUD_HEADERS,
+    CLOUD_SLOT_SEC,
+    CLOUD_UPLOAD_GRACE_SEC,
+    _LOGGER,
+)
+from .tigo_ratelimit import CloudRateGovernor, parse_retry_after
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
 
 
 class TigoAuthError(Exception):
@@ -34,6 +51,13 @@ class TigoCloudError(Exception):
     """Errore generico nella comunicazione col cloud Tigo."""
 
 
+class TigoRateLimitedError(TigoCloudError):
+    """Richiesta non inviata o rifiutata (HTTP 429) per il limite del cloud."""
+
+
+# GET indipendenti di async_fetch_all eseguite in parallelo (una per endpoint)
+FETCH_ALL_WORKERS = 5
+
 # Mappatura tipo-oggetto (campo "B") dal tigobuild/config
 _TYPE_SYSTEM = 1
 _TYPE_PANEL = 2
@@ -41,44 +65,222 @@ _TYPE_STRING = 3
 _TYPE_INVERTER = 4
 _TYPE_CCA = 44
 
+# Layout di un impianto riusato dalle altre entry/reload dello stesso account
+ACCOUNT_LAYOUT_TTL_SEC = 900
+
+
+class PanelDaySeries:
+    """Serie a 15 minuti della giornata per pannello (una per ``temp`` di summary/summary).
+
+    ``merge`` confronta le righe ricevute con quelle già note e tocca solo
+    gli slot nuovi o cambiati (caricamenti in ritardo che riempiono un
+    ``"-"``), senza ricostruire nulla per gli altri. ``curves`` tiene per
+    pannello i punti ``(t, valore)`` in ordine di slot; ``last`` i valori
+    dell'ultimo slot con dati validi.
+
+    Dopo una matrice completa si chiedono al cloud solo gli slot dall'ultimo
+    noto in poi (``window_start``); cambio di giorno e, ogni
+    ``CLOUD_FULL_REFRESH_MAX_SEC``, il recupero dei buchi rifanno la giornata
+    intera (``full_at``).
+    """
+
+    __slots__ = ("day", "times", "rows", "curves", "last", "revision", "full_at")
+
+    def __init__(self) -> None:
+        self.day: str | None = None
+        # Orari degli slot e valori grezzi (riga "d") per slot, per confronto
+        self.times: list = []
+        self.rows: dict = {}
+        self.curves: dict[str, list[tuple]] = {}
+        self.last: dict[str, dict] = {}
+        # Cresce a ogni merge che cambia qualcosa
+        self.revision = 0
+        # Istante (monotonic) dell'ultima matrice completa del giorno
+        self.full_at: float | None = None
+
+    def reset(self, day: str) -> None:
+        self.day = day
+        self.times = []
+        self.rows = {}
+        self.curves = {}
+        self.last = {}
+        self.full_at = None
+        self.revision += 1
+
+    def window_start(self, day: str, now: float | None = None):
+        """Slot da cui chiedere la finestra (l'ultimo noto), o None se serve il giorno intero."""
+        if day != self.day or not self.times or self.full_at is None:
+            return None
+        if (now if now is not None else time.monotonic()) - self.full_at >= CLOUD_FULL_REFRESH_MAX_SEC:
+            return None
+        return self.times[-1]
+
+    def merge(self, day: str, order: list, rows: list) -> int:
+        """Fonde le righe della matrice del giorno. Ritorna il numero di slot nuovi/cambiati."""
+        if day != self.day:
+            self.reset(day)
+        order = [str(oid) for oid in order]
+        changed = 0
+        rebuild = False
+        for row in rows:
+            t = row.get("t")
+            d = tuple(row.get("d") or ())
+            key = (tuple(order), d)
+            old = self.rows.get(t)
+            if old == key:
+                continue
+            if old is None and (not self.times or _slot_after(t, self.times[-1])):
+                self._append(t, order, d)
+            else:
+                # Slot già noto riscritto o arrivato fuori ordine: curve da rifare
+                rebuild = True
+                if old is None:
+                    self.times.append(t)
+            self.rows[t] = key
+            changed += 1
+        if rebuild:
+            self.times.sort(key=_slot_key)
+            self.curves = {}
+            for t in self.times:
+                row_order, d = self.rows[t]
+                self._append(t, row_order, d, record=False)
+        if changed:
+            self.last = self._last_slot()
+            self.revision += 1
+        return changed
+
+    def _last_slot(self) -> dict[str, dict]:
+        for t in reversed(self.times):
+            order, d = self.rows[t]
+            out = {}
+            for i, oid in enumerate(order):
+                if i < len(d) and d[i] != "-":
+                    val = _to_float(d[i])
+                    if val is not None:
+                        out[oid] = {"value": val, "time": t}
+            if any(x != "-" for x in d):
+                return out
+        return {}
+
+    def _append(self, t, order: list, d: tuple, record: bool = True) -> None:
+        if record:
+            self.times.append(t)
+        for i, oid in enumerate(order):
+            if i >= len(d) or d[i] == "-":
+                continue
+            val = _to_float(d[i])
+            if val is None:
+                continue
+            self.curves.setdefault(oid, []).append((t, val))
+
+    def curve(self, panel_id: str) -> tuple:
+        return tuple(self.curves.get(panel_id, ()))
+
+
+class CloudAccount:
+    """Risorse condivise da tutti i client di uno stesso account cloud.
+
+    Token, sessione HTTP (pool di connessioni), budget richieste e layout
+    già letti: più impianti sotto lo stesso account fanno un solo login e
+    tengono un solo pool di connessioni aperto.
+    ``on_token`` viene chiamato (dal thread dell'executor) a ogni nuovo token.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        token: str | None = None,
+        governor: CloudRateGovernor | None = None,
+        on_token: Callable[[str], None] | None = None,
+    ) -> None:
+        self.username = username
+        self.password = password
+        self.token = token
+        self.governor = governor or CloudRateGovernor()
+        self.on_token = on_token
+        self.session = requests.Session()
+        # Pool HTTP dimensionato per le GET parallele di async_fetch_all
+        adapter = HTTPAdapter(max_retries=0, pool_connections=1, pool_maxsize=FETCH_ALL_WORKERS)
+        self.session.mount("https://", adapter)
+        # Un solo re-login anche se più GET parallele ricevono 401 insieme
+        self.login_lock = threading.Lock()
+        # {system_id: (monotonic, pannelli, uid CCA)}
+        self.layouts: dict[int, tuple[float, dict, str | None]] = {}
+
+    def set_token(self, token: str) -> None:
+        self.token = token
+        if self.on_token is not None:
+            self.on_token(token)
+
+    def cached_layout(self, system_id: int) -> tuple[dict, str | None] | None:
+        hit = self.layouts.get(system_id)
+        if hit is None or time.monotonic() - hit[0] > ACCOUNT_LAYOUT_TTL_SEC:
+            return None
+        return hit[1], hit[2]
+
+    def close(self) -> None:
+        """Chiude le connessioni (ultima entry dell'account scaricata)."""
+        self.session.close()
+
 
 class TigoCloudClient:
     """Wrapper sincrono attorno all'API cloud Tigo.
 
-    Va usato dentro ``hass.async_add_executor_job`` perché usa ``requests``.
+    Va usato dentro ``hass.async_add_executor_job`` perché usa ``requests``;
+    ``async_fetch_all`` gira invece nell'event loop e manda lì le singole GET.
     Ri-effettua il login automaticamente se il token scade (401/403).
+    Ogni richiesta passa dal ``CloudRateGovernor`` dell'account. Con
+    ``account`` il client usa token e connessioni condivisi (vedi
+    ``tigo_account``); senza, ne crea di propri.
     """
 
     def __init__(
         self,
-        username: str,
-        password: str,
+        username: str | None = None,
+        password: str | None = None,
         system_id: int | None = None,
         token: str | None = None,
+        governor: CloudRateGovernor | None = None,
+        account: CloudAccount | None = None,
     ) -> None:
-        self._username = username
-        self._password = password
+        self._owns_account = account is None
+        self.account = account or CloudAccount(username, password, token, governor)
         self.system_id = int(system_id) if system_id else None
-        self._token = token
-        self._session = requests.Session()
         # MAC del CCA (uid), necessario per la potenza per-pannello. Popolato da fetch_layout.
         self._cca_uid: str | None = None
+        # Freschezza: ultimo snapshot completo, istante del dato più recente e
+        # minLastTime di homepage al momento dello snapshot
+        self._snapshot: dict | None = None
+        self._snapshot_day: str | None = None
+        self._snapshot_at: datetime | None = None
+        self._data_at: datetime | None = None
+        self._home_last: object = None
+        # Esito dei poll: completo, solo homepage, nessuna richiesta
+        self.poll_counts = {"full": 0, "probe": 0, "skipped": 0}
+        # Curve del giorno per pannello, per ``temp`` di summary/summary
+        self.series: dict[str, PanelDaySeries] = {}
+        # Il cloud accetta la finestra start/end su summary/summary; si spegne
+        # alla prima risposta rifiutata e si torna alla matrice intera
+        self._summary_window = True
 
     # --- Autenticazione -------------------------------------------------
 
     def login(self) -> str:
         """Esegue il login e memorizza il token Bearer. Ritorna il token."""
         url = f"{CLOUD_BASE}/api/v3/user/login?type=8"
+        self._acquire("login")
         try:
-            r = self._session.post(
+            r = self.account.session.post(
                 url,
                 headers={**CLOUD_HEADERS, "content-type": "application/json"},
-                json={"username": self._username, "password": self._password},
+                json={"username": self.account.username, "password": self.account.password},
                 timeout=15,
             )
         except requests.RequestException as e:
             raise TigoCloudError(f"Login non raggiungibile: {e}") from e
 
+        self._check_throttled(r, "login")
         if r.status_code in (401, 403):
             raise TigoAuthError("Username o password Tigo non validi")
         if r.status_code != 200:
@@ -89,28 +291,52 @@ class TigoCloudClient:
         except (ValueError, KeyError, TypeError) as e:
             raise TigoCloudError(f"Risposta login inattesa: {e}") from e
 
-        self._token = token
+        self.account.set_token(token)
         return token
 
     @property
     def token(self) -> str | None:
-        return self._token
+        return self.account.token
+
+    @property
+    def governor(self) -> CloudRateGovernor:
+        return self.account.governor
+
+    @property
+    def cca_uid(self) -> str | None:
+        return self._cca_uid
+
+    @cca_uid.setter
+    def cca_uid(self, uid: str | None) -> None:
+        # Ripristinato dalla cache del layout, senza rileggere tigobuild/config
+        self._cca_uid = uid
+
+    def _relogin(self, stale_token: str | None) -> None:
+        """Login condiviso: se un'altra GET ha già rinnovato ``stale_token`` non rifà il login."""
+        with self.account.login_lock:
+            if self.account.token and self.account.token != stale_token:
+                return
+            if stale_token:
+                _LOGGER.info("Token Tigo scaduto/rifiutato, ri-eseguo login")
+            self.login()
 
     def _get(self, path: str, *, _retry: bool = True) -> dict | list | None:
         """GET autenticato. Ri-esegue il login una volta su 401/403."""
-        if not self._token:
-            self.login()
+        if not self.account.token:
+            self._relogin(None)
 
         url = f"{CLOUD_BASE}{path}"
-        headers = {**CLOUD_HEADERS, "authorization": f"Bearer {self._token}"}
+        token = self.account.token
+        headers = {**CLOUD_HEADERS, "authorization": f"Bearer {token}"}
+        self._acquire(path)
         try:
-            r = self._session.get(url, headers=headers, timeout=15)
+            r = self.account.session.get(url, headers=headers, timeout=15)
         except requests.RequestException as e:
             raise TigoCloudError(f"GET {path} fallita: {e}") from e
+        self._check_throttled(r, path)
 
         if r.status_code in (401, 403) and _retry:
-            _LOGGER.info("Token Tigo scaduto/rifiutato, ri-eseguo login")
-            self.login()
+            self._relogin(token)
             return self._get(path, _retry=False)
 
         if r.status_code != 200:
@@ -122,6 +348,25 @@ class TigoCloudClient:
         except ValueError:
             return None
 
+    def _acquire(self, what: str) -> None:
+        """Prende un gettone dal budget dell'account o fallisce subito.
+
+        Nessuna attesa nel thread dell'executor: il poll fallito viene
+        ripreso dal ``RetryScheduler`` (o la sonda tiene l'ultimo snapshot).
+        """
+        wait = self.governor.reserve()
+        if wait > 0:
+            raise TigoRateLimitedError(f"{what}: budget richieste esaurito, riprovo tra {wait:.0f} s")
+
+    def _check_throttled(self, r, what: str) -> None:
+        """429/5xx: sospende le richieste dell'account e fa fallire questa."""
+        if r.status_code == 429 or r.status_code >= 500:
+            pause = self.governor.record_throttled(r.status_code, parse_retry_after(r.headers.get("Retry-After")))
+            if r.status_code == 429:
+                raise TigoRateLimitedError(f"{what}: limitato dal cloud (HTTP 429), pausa {pause:.0f} s")
+            raise TigoCloudError(f"{what}: HTTP {r.status_code}, pausa {pause:.0f} s")
+        self.governor.record_success()
+
     # --- Discovery ------------------------------------------------------
 
     def discover_systems(self) -> list[dict]:
@@ -144,9 +389,15 @@ class TigoCloudClient:
         """Legge tigobuild/config e ritorna {object_id(str): {...}} per i pannelli.
 
         Ogni pannello: name, serial, short_serial, channel, watt_rating,
-        string, inverter, mp.
+        string, inverter, mp. Se un'altra entry (o il reload precedente) dello
+        stesso account l'ha appena letto, riusa quella copia.
         """
         sid = self.system_id
+        cached = self.account.cached_layout(sid)
+        if cached is not None:
+            panels, uid = cached
+            self._cca_uid = self._cca_uid or uid
+            return dict(panels)
         data = self._get(
             f"/api/v3/tigobuild/config?system_id={sid}&resourceId=config"
         )
@@ -190,6 +441,8 @@ class TigoCloudClient:
                 "string": label_of(string_id, _TYPE_STRING),
                 "inverter": label_of(inverter_id, _TYPE_INVERTER),
             }
+        if panels:
+            self.account.layouts[sid] = (time.monotonic(), panels, self._cca_uid)
         return panels
 
     # --- Dati ------------------------------------------------------------
@@ -231,8 +484,11 @@ class TigoCloudClient:
 
         ``temp`` = 'pin' (potenza) o 'reclaimedPower' (potenza recuperata).
         Ritorna {object_id(str): {'value', 'time'}} dall'ultimo intervallo con
-        dati validi della giornata. Vin/Vout/Iin/Temp/Rssi restituiscono vuoto
-        su un account Basic (non premium).
+        dati validi della giornata. Per oggi la matrice viene fusa in
+        ``self.series[temp]``, che tiene la curva del giorno: se la serie è già
+        piena si chiedono solo gli slot dall'ultimo noto in poi.
+        Vin/Vout/Iin/Temp/Rssi restituiscono vuoto su un account Basic
+        (non premium).
         """
         if not self._cca_uid:
             _LOGGER.debug("uid CCA assente: salto summary temp=%s", temp)
@@ -240,30 +496,47 @@ class TigoCloudClient:
 
         sid = self.system_id
         uid = self._cca_uid
-        date_str = date_str or self._today()
-        data = self._get(
+        today = self._today()
+        date_str = date_str or today
+        path = (
             f"/api/v4/system/summary/summary?system_id={sid}&date={date_str}"
             f"&temp={temp}&uid={uid}&resourceId=data-{date_str}-{temp}-{uid}"
         )
-        out: dict[str, dict] = {}
+        if date_str != today:
+            series = PanelDaySeries()
+            self._merge_summary(series, date_str, self._get(path))
+            return series.last
+
+        series = self.series.setdefault(temp, PanelDaySeries())
+        start = series.window_start(date_str) if self._summary_window else None
+        if start is not None:
+            data = self._get(f"{path}&start={quote(str(start))}&end={quote('23:59')}")
+            if isinstance(data, dict):
+                changed = self._merge_summary(series, date_str, data)
+                _LOGGER.debug("Cloud %s summary %s da %s: %d slot nuovi/cambiati", sid, temp, start, changed)
+                return dict(series.last)
+            _LOGGER.debug("Cloud %s: finestra summary rifiutata, torno alla giornata intera", sid)
+            self._summary_window = False
+
+        data = self._get(path)
+        if series.day != date_str:
+            # Giorno nuovo: niente valori di ieri anche se oggi è ancora vuoto
+            series.reset(date_str)
+        if isinstance(data, dict):
+            changed = self._merge_summary(series, date_str, data)
+            series.full_at = time.monotonic()
+            _LOGGER.debug("Cloud %s summary %s: %d slot nuovi/cambiati", sid, temp, changed)
+        return dict(series.last)
+
+    @staticmethod
+    def _merge_summary(series: PanelDaySeries, date_str: str, data) -> int:
         if not isinstance(data, dict):
-            return out
+            return 0
         dataset = data.get("dataset") or []
         if not dataset:
-            return out
+            return 0
         block = dataset[0]
-        order = block.get("order") or []
-        rows = block.get("data") or []
-        for row in reversed(rows):
-            d = row.get("d") or []
-            if any(x != "-" for x in d):
-                for i, oid in enumerate(order):
-                    if i < len(d) and d[i] != "-":
-                        val = _to_float(d[i])
-                        if val is not None:
-                            out[str(oid)] = {"value": val, "time": row.get("t")}
-                break
-        return out
+        return series.merge(date_str, block.get("order") or [], block.get("data") or [])
 
     def fetch_homepage(self) -> dict:
         """Totali sistema: potenza istantanea + energia day/week/month/year/lifetime (Wh)."""
@@ -313,16 +586,130 @@ class TigoCloudClient:
 
     # --- Aggregazione per il coordinator --------------------------------
 
-    def fetch_all(self, layout: dict | None = None) -> dict:
-        """Raccoglie tutto in un unico dict per il DataUpdateCoordinator."""
+    async def _async_fan_out(self, hass: HomeAssistant, calls: dict[str, tuple[Callable, Callable]]) -> dict:
+        """Esegue in parallelo ``{nome: (fetch, default)}`` e ritorna ``{nome: risultato}``.
+
+        Ogni GET è un job dell'executor di HA, lanciato dall'event loop.
+        Ogni endpoint può fallire da solo: al suo posto va ``default()`` e il
+        resto dello snapshot resta valido. Se falliscono tutti si propaga il
+        primo errore (poll fallito); credenziali rifiutate interrompono subito.
+        """
+        names = list(calls)
+        outcomes = await asyncio.gather(
+            *(hass.async_add_executor_job(calls[name][0]) for name in names),
+            return_exceptions=True,
+        )
+        results: dict = {}
+        errors: list[Exception] = []
+        for name, outcome in zip(names, outcomes):
+            if isinstance(outcome, TigoAuthError) or (
+                isinstance(outcome, BaseException) and not isinstance(outcome, Exception)
+            ):
+                raise outcome
+            if isinstance(outcome, Exception):
+                errors.append(outcome)
+                _LOGGER.warning("Endpoint cloud %s non disponibile: %s", name, outcome)
+                results[name] = calls[name][1]()
+            else:
+                results[name] = outcome
+        if errors and len(errors) == len(calls):
+            raise errors[0]
+        return results
+
+    def close(self) -> None:
+        """Chiude le connessioni, se non condivise con altri client."""
+        if self._owns_account:
+            self.account.close()
+
+    # --- Freschezza -------------------------------------------------------
+
+    @property
+    def next_data_due(self) -> datetime | None:
+        """Quando è atteso il prossimo slot di dati (ora locale), se noto."""
+        if self._data_at is None:
+            return None
+        return self._data_at + timedelta(seconds=CLOUD_SLOT_SEC + CLOUD_UPLOAD_GRACE_SEC)
+
+    def next_poll_delay(self, now: datetime | None = None) -> float | None:
+        """Secondi fino al prossimo slot atteso (None se già dovuto o ignoto)."""
+        due = self.next_data_due
+        if due is None:
+            return None
+        delay = (due - (now or datetime.now())).total_seconds()
+        return delay if delay > 0 else None
+
+    def _full_refresh_due(self, now: datetime) -> bool:
+        if self._snapshot is None or self._snapshot_day != now.date().isoformat():
+            return True
+        return (now - self._snapshot_at).total_seconds() >= CLOUD_FULL_REFRESH_MAX_SEC
+
+    async def async_fetch_all(self, hass: HomeAssistant, layout: dict | None = None) -> dict:
+        """Raccoglie tutto in un unico dict per il DataUpdateCoordinator.
+
+        I dati cloud avanzano a slot di 15 minuti: finché il prossimo slot
+        non è atteso si riusa l'ultimo snapshot senza richieste; poi si
+        sonda solo ``homepage`` e si rifà il giro completo quando
+        ``minLastTime`` cambia (nuovo caricamento). Cambio di giorno e
+        ``CLOUD_FULL_REFRESH_MAX_SEC`` forzano comunque il giro completo.
+        """
         if not self.system_id:
             raise TigoCloudError("system_id non impostato")
 
-        energy = self.fetch_panel_energy()
-        power = self.fetch_panel_summary("pin")
-        reclaimed = self.fetch_panel_summary("reclaimedPower")
-        home = self.fetch_homepage()
-        power_max = self.fetch_power_day_max()
+        now = datetime.now()
+        if not self._full_refresh_due(now):
+            due = self.next_data_due
+            if due is not None and now < due:
+                self.poll_counts["skipped"] += 1
+                return self._snapshot
+            try:
+                home = await hass.async_add_executor_job(self.fetch_homepage)
+            except TigoAuthError:
+                raise
+            except TigoRateLimitedError as e:
+                # Account in pausa: i dati dell'ultimo slot restano validi
+                _LOGGER.debug("Cloud %s: sonda rimandata (%s)", self.system_id, e)
+                return self._snapshot
+            except Exception as e:
+                _LOGGER.debug("Cloud %s: sonda homepage fallita (%s), refresh completo", self.system_id, e)
+                return await self._async_fetch_full(hass, layout, now)
+            if home["last_data"] is None or home["last_data"] == self._home_last:
+                self.poll_counts["probe"] += 1
+                # Stesso caricamento: aggiorna solo i totali di sistema
+                snapshot = {**self._snapshot, "system": {**self._snapshot["system"], **_home_system(home)}}
+                self._snapshot = snapshot
+                return snapshot
+            _LOGGER.debug("Cloud %s: nuovo caricamento (%s), refresh completo", self.system_id, home["last_data"])
+            return await self._async_fetch_full(hass, layout, now, home)
+        return await self._async_fetch_full(hass, layout, now)
+
+    async def _async_fetch_full(
+        self, hass: HomeAssistant, layout: dict | None, now: datetime, home: dict | None = None
+    ) -> dict:
+        """Le GET sono indipendenti e partono in parallelo (homepage solo se non già letta)."""
+        fetches = {
+            "aggenergy": (
+                self.fetch_panel_energy,
+                lambda: {"panels": {}, "total_energy_wh": None, "reclaimed_wh": None, "last_data": None},
+            ),
+            "summary pin": (lambda: self.fetch_panel_summary("pin"), dict),
+            "summary reclaimedPower": (lambda: self.fetch_panel_summary("reclaimedPower"), dict),
+            "homepage": (
+                self.fetch_homepage,
+                lambda: dict.fromkeys((
+                    "power_now_w", "energy_day_wh", "energy_week_wh", "energy_month_wh",
+                    "energy_year_wh", "energy_lifetime_wh", "last_data",
+                )),
+            ),
+            "aggpower": (self.fetch_power_day_max, lambda: None),
+        }
+        if home is not None:
+            del fetches["homepage"]
+        results = await self._async_fan_out(hass, fetches)
+        energy = results["aggenergy"]
+        power = results["summary pin"]
+        reclaimed = results["summary reclaimedPower"]
+        home = home or results["homepage"]
+        power_max = results["aggpower"]
 
         # Fonde layout (statico) + energia/potenza/recuperato (dinamici) per pannello
         panels: dict[str, dict] = {}
@@ -333,6 +720,7 @@ class TigoCloudClient:
             | set(power.keys())
             | set(reclaimed.keys())
         )
+        latest: list[datetime] = []
         for oid in panel_ids:
             base = dict(layout.get(oid, {}))
             base.update(energy["panels"].get(oid, {}))
@@ -345,19 +733,78 @@ class TigoCloudClient:
                 base["reclaimed_w"] = r["value"]
             base.setdefault("name", oid)
             panels[oid] = base
+            ts = _parse_time(base.get("last_data"), now)
+            if ts is not None:
+                latest.append(ts)
 
         system = {
-            "power_now_w": home["power_now_w"],
+            **_home_system(home),
             "power_day_max_w": power_max,
             "energy_today_wh": home["energy_day_wh"] if home["energy_day_wh"] is not None else energy["total_energy_wh"],
-            "energy_week_wh": home["energy_week_wh"],
-            "energy_month_wh": home["energy_month_wh"],
-            "energy_year_wh": home["energy_year_wh"],
-            "energy_lifetime_wh": home["energy_lifetime_wh"],
             "reclaimed_today_wh": energy["reclaimed_wh"],
             "last_data": home["last_data"] or energy["last_data"],
         }
-        return {"panels": panels, "system": system}
+        snapshot = {"panels": panels, "system": system}
+
+        # Istante del dato più recente: lastData/minLastTime/datasetLastData
+        for value in (home["last_data"], energy["last_data"]):
+            ts = _parse_time(value, now)
+            if ts is not None:
+                latest.append(ts)
+        self._data_at = max(latest) if latest else None
+        self._home_last = home["last_data"]
+        self._snapshot = snapshot
+        self._snapshot_day = now.date().isoformat()
+        self._snapshot_at = now
+        self.poll_counts["full"] += 1
+        return snapshot
+
+
+def _home_system(home: dict) -> dict:
+    """Totali di sistema presi da homepage (aggiornabili con la sola sonda)."""
+    return {
+        "power_now_w": home["power_now_w"],
+        "energy_week_wh": home["energy_week_wh"],
+        "energy_month_wh": home["energy_month_wh"],
+        "energy_year_wh": home["energy_year_wh"],
+        "energy_lifetime_wh": home["energy_lifetime_wh"],
+        **({"energy_today_wh": home["energy_day_wh"]} if home["energy_day_wh"] is not None else {}),
+    }
+
+
+def _parse_time(value, now: datetime) -> datetime | None:
+    """Timestamp del cloud (ISO, "YYYY-MM-DD HH:MM:SS" o epoch) in ora locale naive.
+
+    Valori nel futuro (orologi sfasati) vengono limitati a ``now``.
+    """
+    if value in (None, ""):
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            ts = datetime.fromtimestamp(value / 1000.0 if value > 1e12 else value)
+        else:
+            text = str(value).strip().replace("Z", "+00:00")
+            ts = datetime.fromisoformat(text)
+            if ts.tzinfo is not None:
+                ts = ts.astimezone().replace(tzinfo=None)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+    return min(ts, now)
+
+
+def _slot_key(t):
+    """Chiave d'ordinamento di un orario di slot ("HH:MM", ISO o numero)."""
+    if isinstance(t, (int, float)):
+        return (0, (t,), "")
+    text = str(t)
+    parts = text.split(":")
+    if 2 <= len(parts) <= 3 and all(p.isdigit() for p in parts):
+        return (0, tuple(int(p) for p in parts), "")
+    return (1, (), text)
+
+
+def _slot_after(t, previous) -> bool:
+    return _slot_key(t) > _slot_key(previous)
 
 
 def _to_float(v) -> float | None:
@@ -0,0 +1,271 @@
+"""Decodifica colonnare dei dataset ``summary_data`` del CCA.
+
+Un dataset ``{"dataset": [{"order": [...], "data": [{"t": ..., "d": [...]}]}]}``
+diventa una matrice ``(minuti × pannelli)`` di float32, con NaN per le celle
+mancanti o non numeriche (``"-"``, null, righe corte), più l'indice dei
+pannelli. Somme giornaliere, ultima riga e statistiche per pannello diventano
+operazioni vettoriali.
+
+NumPy è opzionale: se non è installato la stessa API gira in Python puro
+(liste di float con NaN), con gli stessi risultati.
+"""
+from __future__ import annotations
+
+import math
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dipende dall'ambiente HA
+    np = None
+
+HAS_NUMPY = np is not None
+
+_NAN = float("nan")
+
+
+def _cell(v) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return _NAN
+
+
+def _row_py(raw: list, cols: list[int], width: int) -> list[float]:
+    row = [_NAN] * width
+    for i, v in enumerate(raw[:len(cols)]):
+        row[cols[i]] = _cell(v)
+    return row
+
+
+def _block_np(raw_rows: list, cols: list[int], width: int):
+    """Righe di un blocco → matrice float32 (righe × width)."""
+    n = len(cols)
+    out = np.full((len(raw_rows), width), np.nan, dtype=np.float32)
+    # Colonne contigue (caso tipico: un solo blocco): assegnazione su slice
+    target = slice(cols[0], cols[0] + n) if n and cols == list(range(cols[0], cols[0] + n)) else cols
+    if all(len(raw) == n for raw in raw_rows):
+        try:
+            # Percorso veloce: blocco interamente numerico (anche stringhe "12.5")
+            out[:, target] = np.asarray(raw_rows, dtype=np.float32)
+            return out
+        except (TypeError, ValueError):
+            pass
+        # Celle "-" (standby): maschera sulla matrice di oggetti, poi una sola
+        # conversione del blocco
+        cells = np.array(raw_rows, dtype=object)
+        cells[cells == "-"] = np.nan
+        try:
+            out[:, target] = cells.astype(np.float32)
+            return out
+        except (TypeError, ValueError):
+            pass
+    # Righe corte o celle null/non numeriche: conversione riga per riga,
+    # cella per cella solo dove serve
+    for r, raw in enumerate(raw_rows):
+        if len(raw) == n:
+            try:
+                out[r, target] = raw
+                continue
+            except (TypeError, ValueError):
+                pass
+        out[r, cols[:len(raw)]] = [_cell(v) for v in raw[:n]]
+    return out
+
+
+class SummaryMatrix:
+    """Matrice ``values[minuto][pannello]`` di un dataset summary_data.
+
+    ``order`` è l'unione ordinata dei pannelli di tutti i blocchi, ``index``
+    la posizione di ogni pannello, ``times`` il timestamp ``t`` di ogni riga.
+    ``values`` è un ``numpy.ndarray`` float32 o, senza NumPy, una lista di
+    liste di float. ``blocks`` elenca ``(prima riga, colonne)`` di ogni
+    blocco, per sapere quali pannelli compaiono in una riga.
+    """
+
+    __slots__ = ("order", "index", "times", "values", "numpy", "blocks")
+
+    def __init__(self, order: tuple, times: list, values, use_numpy: bool, blocks: list) -> None:
+        self.order = order
+        self.index = {p: i for i, p in enumerate(order)}
+        self.times = times
+        self.values = values
+        self.numpy = use_numpy
+        self.blocks = blocks
+
+    def _row_cols(self, r: int) -> list[int]:
+        cols: list[int] = []
+        for first, block_cols in self.blocks:
+            if first > r:
+                break
+            cols = block_cols
+        return cols
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def day_wh(self) -> float:
+        """Wh della giornata (righe a minuti in W): somma di tutte le celle / 60."""
+        if self.numpy:
+            if not len(self.times):
+                return 0.0
+            # Accumulo in float64: float32 basta per i valori, non per la somma
+            return float(np.nansum(self.values, dtype=np.float64)) / 60.0
+        total = 0.0
+        for row in self.values:
+            total += sum(v for v in row if not math.isnan(v)) / 60.0
+        return total
+
+    def day_kwh(self) -> float:
+        return round(self.day_wh() / 1000.0, 2)
+
+    def last_row(self) -> dict[str, float]:
+        """Ultima riga: {panel: valore} (celle non numeriche → 0.0).
+
+        Come ``tigo_api._last_row_values``: solo i pannelli dell'order del
+        blocco della riga (le righe senza ``d`` sono già scartate).
+        """
+        r = len(self.times) - 1
+        if r < 0:
+            return {}
+        row = self.values[r]
+        out: dict[str, float] = {}
+        for i in self._row_cols(r):
+            v = self._float(row[i])
+            out[self.order[i]] = 0.0 if math.isnan(v) else v
+        return out
+
+    def _float(self, v) -> float:
+        # float32 → float con le sole cifre significative (123.4, non 123.40000152)
+        return float(str(v)) if self.numpy else v
+
+    def panel_stats(self) -> dict[str, dict]:
+        """Per pannello: min, max, media (ignorando NaN) e Wh della giornata."""
+        out: dict[str, dict] = {}
+        if self.numpy:
+            if not len(self.times):
+                return out
+            counts = np.count_nonzero(~np.isnan(self.values), axis=0)
+            sums = np.nansum(self.values, axis=0, dtype=np.float64)
+            filled = np.where(np.isnan(self.values), np.inf, self.values)
+            mins = filled.min(axis=0)
+            maxs = np.where(np.isnan(self.values), -np.inf, self.values).max(axis=0)
+            for i, p in enumerate(self.order):
+                n = int(counts[i])
+                if not n:
+                    continue
+                out[p] = {
+                    "min": self._float(mins[i]),
+                    "max": self._float(maxs[i]),
+                    "mean": float(sums[i]) / n,
+                    "wh": float(sums[i]) / 60.0,
+                }
+            return out
+        for i, p in enumerate(self.order):
+            col = [row[i] for row in self.values if not math.isnan(row[i])]
+            if not col:
+                continue
+            total = sum(col)
+            out[p] = {"min": min(col), "max": max(col), "mean": total / len(col), "wh": total / 60.0}
+        return out
+
+    def panel_window(self, panel_id: str, start: int, stop: int) -> tuple[float, float | None]:
+        """Somma e ultimo valore del pannello nelle righe ``[start, stop)`` (NaN esclusi).
+
+        Ritorna ``(0.0, None)`` se il pannello non ha valori nell'intervallo.
+        """
+        i = self.index.get(panel_id)
+        if i is None or start >= stop:
+            return 0.0, None
+        if self.numpy:
+            col = self.values[start:stop, i]
+            valid = np.flatnonzero(~np.isnan(col))
+            if not len(valid):
+                return 0.0, None
+            return float(np.nansum(col, dtype=np.float64)), self._float(col[valid[-1]])
+        total, last = 0.0, None
+        for row in self.values[start:stop]:
+            v = row[i]
+            if not math.isnan(v):
+                total += v
+                last = v
+        return total, last
+
+    def column_sums(self, start: int, stop: int) -> dict[str, float]:
+        """Somma per pannello delle righe ``[start, stop)``, solo pannelli con valori."""
+        out: dict[str, float] = {}
+        if start >= stop:
+            return out
+        if self.numpy:
+            block = self.values[start:stop]
+            counts = np.count_nonzero(~np.isnan(block), axis=0)
+            sums = np.nansum(block, axis=0, dtype=np.float64)
+            for i, p in enumerate(self.order):
+                if counts[i]:
+                    out[p] = float(sums[i])
+            return out
+        for row in self.values[start:stop]:
+            for i, v in enumerate(row):
+                if not math.isnan(v):
+                    out[self.order[i]] = out.get(self.order[i], 0.0) + v
+        return out
+
+    def panel(self, panel_id: str) -> list[tuple]:
+        """Serie ``[(t, valore), ...]`` del pannello, senza le celle mancanti."""
+        i = self.index.get(panel_id)
+        if i is None:
+            return []
+        out = []
+        for t, row in zip(self.times, self.values):
+            v = self._float(row[i])
+            if not math.isnan(v):
+                out.append((t, v))
+        return out
+
+
+def decode_summary(
+    data: dict | list | None,
+    fallback_order: list | None = None,
+    use_numpy: bool | None = None,
+) -> SummaryMatrix:
+    """Decodifica un dataset summary_data in ``SummaryMatrix``.
+
+    Le righe senza ``d`` vengono scartate. ``use_numpy=None`` usa NumPy se
+    disponibile; False forza il percorso in Python puro.
+    """
+    use_np = HAS_NUMPY if use_numpy is None else (use_numpy and HAS_NUMPY)
+    dataset = data.get("dataset") if isinstance(data, dict) else None
+
+    blocks: list[tuple[list, list]] = []
+    order: list = []
+    index: dict = {}
+    for block in dataset or []:
+        if not isinstance(block, dict):
+            continue
+        block_order = block.get("order") or fallback_order or []
+        for p in block_order:
+            if p not in index:
+                index[p] = len(order)
+                order.append(p)
+        rows = [e for e in block.get("data") or [] if isinstance(e, dict) and e.get("d")]
+        if rows:
+            blocks.append(([index[p] for p in block_order], rows))
+
+    width = len(order)
+    times: list = []
+    spans: list[tuple[int, list]] = []
+    parts = []
+    for cols, rows in blocks:
+        # Celle oltre l'order del blocco vengono scartate
+        spans.append((len(times), cols))
+        times.extend(e.get("t") for e in rows)
+        raw_rows = [e["d"] for e in rows]
+        if use_np:
+            parts.append(_block_np(raw_rows, cols, width))
+        else:
+            parts.extend(_row_py(raw, cols, width) for raw in raw_rows)
+
+    if use_np:
+        values = np.concatenate(parts) if parts else np.empty((0, width), dtype=np.float32)
+    else:
+        values = parts
+    return SummaryMatrix(tuple(order), times, values, use_np, spans)
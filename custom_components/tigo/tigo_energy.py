@@ -0,0 +1,343 @@
+"""Cache persistente dell'energia giornaliera calcolata dai dati del CCA.
+
+Lo storico a 7 giorni richiedeva ad ogni refresh l'intera giornata a minuti
+di ogni giorno (e una seconda volta per i giorni a zero). Un giorno concluso
+però non cambia più: il suo totale viene salvato nello storage di HA
+(``.storage/tigo.day_energy.<entry_id>``) e da lì in poi si scarica solo la
+giornata corrente.
+
+Anche la giornata corrente si calcola in modo incrementale:
+``TodayEnergyAccumulator`` tiene la somma parziale in Wh e la posizione
+dell'ultima riga sommata, così ad ogni refresh si analizzano solo le righe
+nuove.
+
+``PanelEnergyBackfill`` ricostruisce invece l'energia per pannello persa
+durante un riavvio di HA o una serie di poll falliti, dalle righe a minuti
+di ``pin`` che il CCA conserva.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import time as monotonic_time
+from collections.abc import Awaitable, Callable
+from datetime import date, datetime, time, timedelta
+from typing import TYPE_CHECKING
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, ENERGY_CACHE_MAX_DAYS, ENERGY_CACHE_STORAGE_VERSION, _LOGGER
+from .tigo_decode import SummaryMatrix, decode_summary
+
+if TYPE_CHECKING:
+    from .tigo_local import TigoLocalClient
+
+# Dopo la mezzanotte il CCA può non aver ancora scritto l'ultimo minuto di ieri
+DAY_SETTLE = timedelta(minutes=15)
+# Ritardo del salvataggio su disco (più giorni chiusi in un solo write)
+SAVE_DELAY_SEC = 10
+# kWh di un giorno per cui il CCA ha risposto senza righe (va in cache come gli altri)
+EMPTY_DAY_KWH = 0.0
+
+
+def energy_cache_key(entry_id: str) -> str:
+    return f"{DOMAIN}.day_energy.{entry_id}"
+
+
+class DayEnergyCache:
+    """kWh dei giorni conclusi di un CCA: {"YYYY-MM-DD": kWh}.
+
+    Un giorno entra in cache solo se è concluso da almeno ``DAY_SETTLE`` e il
+    fetch è riuscito, anche senza righe (``EMPTY_DAY_KWH``): un fetch fallito
+    (None) non viene mai salvato, così il giorno viene ritentato al refresh
+    successivo.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self._store = Store(hass, ENERGY_CACHE_STORAGE_VERSION, energy_cache_key(entry_id))
+        self._days: dict[str, float] = {}
+
+    async def async_load(self) -> None:
+        try:
+            stored = await self._store.async_load()
+        except Exception as e:
+            _LOGGER.warning("Cache energia giornaliera non leggibile, riparto da vuota: %s", e)
+            stored = None
+        days = (stored or {}).get("days") or {}
+        self._days = {
+            str(d): float(v) for d, v in days.items() if isinstance(v, (int, float))
+        }
+
+    def __len__(self) -> int:
+        return len(self._days)
+
+    def get(self, date_str: str) -> float | None:
+        return self._days.get(date_str)
+
+    @staticmethod
+    def is_final(day: date, now: datetime | None = None) -> bool:
+        """True se il giorno è concluso (e assestato) rispetto a ``now`` (ora locale)."""
+        now = now or datetime.now()
+        return now >= datetime.combine(day + timedelta(days=1), time.min) + DAY_SETTLE
+
+    def put(self, day: date, kwh: float | None, now: datetime | None = None) -> bool:
+        """Salva il totale di un giorno concluso. False se non è memorizzabile."""
+        if kwh is None or not self.is_final(day, now):
+            return False
+        date_str = day.isoformat()
+        if self._days.get(date_str) == kwh:
+            return True
+        self._days[date_str] = kwh
+        oldest = ((now or datetime.now()).date() - timedelta(days=ENERGY_CACHE_MAX_DAYS)).isoformat()
+        for old in [d for d in self._days if d < oldest]:
+            del self._days[old]
+        self._store.async_delay_save(self._data, SAVE_DELAY_SEC)
+        return True
+
+    def _data(self) -> dict:
+        return {"days": dict(self._days)}
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
+
+
+def _row_wh(raw) -> float:
+    """Wh di una riga a minuti (somma dei W dei pannelli / 60), come ``day_energy_kwh``."""
+    minute_sum = 0.0
+    for v in raw or ():
+        try:
+            minute_sum += float(v)
+        except (TypeError, ValueError):
+            pass
+    return minute_sum / 60.0
+
+
+class TodayEnergyAccumulator:
+    """Somma incrementale dell'energia di oggi dalle righe summary_data?temp=pin.
+
+    Ricorda data, blocco, riga e timestamp dell'ultima riga sommata (come
+    ``SummaryCursor``). Le righe sono sommate nello stesso ordine di
+    ``tigo_api.day_energy_kwh``, quindi il risultato coincide con un ricalcolo
+    completo. Al cambio di data riparte da zero.
+    """
+
+    def __init__(self) -> None:
+        self.date: str | None = None
+        self.wh = 0.0
+        self._pos: tuple | None = None
+
+    def reset(self, date: str | None = None) -> None:
+        self.date = date
+        self.wh = 0.0
+        self._pos = None
+
+    def stream_start(self, date: str) -> tuple[int, int]:
+        """Posizione da cui il parser in streaming deve conservare le righe.
+
+        Include la riga già sommata (serve a validare la posizione); senza
+        posizione per la data servono tutte le righe.
+        """
+        if self.date != date or self._pos is None:
+            return 0, 0
+        return self._pos[0], self._pos[1]
+
+    def consume(self, date: str, dataset: list) -> float | None:
+        """Somma le righe nuove e ritorna i kWh di oggi.
+
+        None se la posizione non combacia più con il dataset (riga sostituita,
+        dataset accorciato): l'accumulatore è stato azzerato e va richiamato
+        con il dataset completo.
+        """
+        if date != self.date:
+            self.reset(date)
+        b_start, r_start = 0, 0
+        if self._pos is not None:
+            b_idx, r_idx, t = self._pos
+            block = dataset[b_idx] if b_idx < len(dataset) else None
+            rows = (block or {}).get("data") or []
+            local = r_idx - (block or {}).get("row_offset", 0)
+            if block is None or not 0 <= local < len(rows) or rows[local].get("t") != t:
+                self.reset(date)
+                return None
+            b_start, r_start = b_idx, r_idx + 1
+
+        for b_idx in range(b_start, len(dataset)):
+            block = dataset[b_idx]
+            rows = block.get("data") or []
+            offset = block.get("row_offset", 0)
+            if offset and self._pos is None:
+                # Dataset ridotto senza posizione: mancano le righe iniziali
+                self.reset(date)
+                return None
+            first = max((r_start if b_idx == b_start else 0) - offset, 0)
+            for local in range(first, len(rows)):
+                entry = rows[local]
+                raw = entry.get("d")
+                self.wh += _row_wh(raw)
+                if raw:
+                    self._pos = (b_idx, offset + local, entry.get("t"))
+        return round(self.wh / 1000.0, 2)
+
+
+# --- Backfill energia per pannello ----------------------------------------
+
+# Buchi più corti di così (o di due intervalli di polling) si integrano dal vivo
+BACKFILL_MIN_GAP = timedelta(minutes=5)
+# Giorni al massimo ricostruiti all'indietro (oggi compreso)
+BACKFILL_MAX_DAYS = 2
+# Per quanto la giornata corrente scaricata resta valida tra i pannelli
+BACKFILL_TODAY_TTL_SEC = 60
+# Dopo un fetch fallito la giornata non viene richiesta di nuovo per un po'
+BACKFILL_RETRY_SEC = 120
+
+
+def row_time(day: date, t, index: int) -> datetime:
+    """Istante (UTC) di una riga a minuti di ``day``.
+
+    Accetta ``t`` come "HH:MM[:SS]", data/ora ISO, minuto del giorno o epoch
+    (s/ms); altrimenti usa l'indice della riga come minuto dalla mezzanotte.
+    """
+    midnight = dt_util.start_of_local_day(day)
+    if isinstance(t, str):
+        parsed = dt_util.parse_datetime(t)
+        if parsed is not None:
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=dt_util.get_default_time_zone())
+            return dt_util.as_utc(parsed)
+        parts = t.split(":")
+        if 2 <= len(parts) <= 3 and all(p.isdigit() for p in parts):
+            hh, mm = int(parts[0]), int(parts[1])
+            ss = int(parts[2]) if len(parts) == 3 else 0
+            return dt_util.as_utc(midnight + timedelta(hours=hh, minutes=mm, seconds=ss))
+    elif isinstance(t, (int, float)) and not isinstance(t, bool):
+        if t > 1e11:
+            return dt_util.utc_from_timestamp(t / 1000.0)
+        if t > 86400:
+            return dt_util.utc_from_timestamp(t)
+        if 0 <= t < 24 * 60:
+            return dt_util.as_utc(midnight + timedelta(minutes=t))
+    return dt_util.as_utc(midnight + timedelta(minutes=index))
+
+
+def _decode_day(day: date, data: dict) -> tuple[SummaryMatrix, list[float]]:
+    """Matrice della giornata e istante (epoch) di ogni riga."""
+    matrix = decode_summary(data)
+    return matrix, [row_time(day, t, i).timestamp() for i, t in enumerate(matrix.times)]
+
+
+class PanelEnergyBackfill:
+    """Energia per pannello ricostruita dalle righe a minuti di ``pin`` del CCA.
+
+    Ogni giornata viene scaricata una sola volta per tutti i pannelli e
+    decodificata in ``SummaryMatrix``: i giorni conclusi restano in memoria,
+    oggi viene riscaricato al più ogni ``BACKFILL_TODAY_TTL_SEC``. Le righe
+    sono trattate come potenza media del minuto (Wh = W / 60). Una giornata
+    non scaricata (CCA in standby) non viene richiesta di nuovo per
+    ``BACKFILL_RETRY_SEC``, così gli altri pannelli falliscono subito.
+
+    I pannelli non fanno il backfill da soli: lo chiedono con
+    ``async_request`` e un unico task in background dell'entry esegue le
+    richieste una alla volta, fuori dal setup della piattaforma.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry, client: TigoLocalClient) -> None:
+        self._hass = hass
+        self._entry = entry
+        self._client = client
+        self._days: dict[str, tuple[float, SummaryMatrix, list[float]]] = {}
+        self._failed: dict[str, float] = {}
+        self._lock = asyncio.Lock()
+        self._pending: dict[str, Callable[[], Awaitable[None]]] = {}
+        self._running = False
+
+    @staticmethod
+    def min_gap(update_interval: timedelta | None) -> timedelta:
+        """Buco oltre il quale conviene il backfill invece dell'integrazione dal vivo."""
+        return max(BACKFILL_MIN_GAP, 2 * (update_interval or timedelta()))
+
+    @callback
+    def async_request(self, key: str, job: Callable[[], Awaitable[None]]) -> None:
+        """Accoda il backfill ``job`` (uno per ``key``) nel task in background."""
+        self._pending[key] = job
+        if not self._running:
+            self._running = True
+            self._entry.async_create_background_task(
+                self._hass, self._async_run(), f"tigo_panel_backfill_{self._entry.entry_id}"
+            )
+
+    async def _async_run(self) -> None:
+        try:
+            while self._pending:
+                key = next(iter(self._pending))
+                job = self._pending.pop(key)
+                try:
+                    await job()
+                except Exception as e:
+                    _LOGGER.warning("Backfill energia %s fallito: %s", key, e)
+        finally:
+            self._running = False
+
+    async def _day(self, day: date) -> tuple[SummaryMatrix, list[float]] | None:
+        key = day.isoformat()
+        async with self._lock:
+            cached = self._days.get(key)
+            if cached is not None and (
+                day < dt_util.now().date()
+                or monotonic_time.monotonic() - cached[0] < BACKFILL_TODAY_TTL_SEC
+            ):
+                return cached[1], cached[2]
+            failed = self._failed.get(key)
+            if failed is not None and monotonic_time.monotonic() - failed < BACKFILL_RETRY_SEC:
+                return None
+            data = await self._client.fetch_day_summary(key, nan_cells=True)
+            if data is None:
+                self._failed[key] = monotonic_time.monotonic()
+                return None
+            self._failed.pop(key, None)
+            # Decodifica di una giornata intera: fuori dall'event loop
+            matrix, stamps = await self._hass.async_add_executor_job(_decode_day, day, data)
+            self._days[key] = (monotonic_time.monotonic(), matrix, stamps)
+            for old in sorted(self._days)[:-BACKFILL_MAX_DAYS]:
+                del self._days[old]
+            return matrix, stamps
+
+    async def async_panel_energy(
+        self, panel_id: str, start: datetime, end: datetime
+    ) -> tuple[float, datetime | None, float | None] | None:
+        """Wh del pannello nelle righe con ``start < t <= end``.
+
+        Ritorna ``(wh, istante ultima riga, ultimo W valido)`` (istante None se
+        non ci sono righe nella finestra), oppure None se il CCA non ha
+        risposto: in quel caso il chiamante non deve avanzare.
+        """
+        first = dt_util.as_local(start).date()
+        last = dt_util.as_local(end).date()
+        first = max(first, last - timedelta(days=BACKFILL_MAX_DAYS - 1))
+        t0, t1 = start.timestamp(), end.timestamp()
+
+        wh = 0.0
+        last_ts: float | None = None
+        last_w: float | None = None
+        day = first
+        while day <= last:
+            loaded = await self._day(day)
+            if loaded is None:
+                return None
+            matrix, stamps = loaded
+            # Righe in ordine di tempo: la finestra è un intervallo di indici
+            lo = bisect.bisect_right(stamps, t0)
+            hi = bisect.bisect_right(stamps, t1)
+            total, value = matrix.panel_window(panel_id, lo, hi)
+            wh += total / 60.0
+            if hi > lo:
+                # Coperto fino all'ultima riga della finestra, anche se vuota
+                last_ts = stamps[hi - 1]
+                last_w = value if value is not None else last_w
+            day += timedelta(days=1)
+
+        if last_ts is None:
+            return wh, None, None
+        return wh, dt_util.utc_from_timestamp(last_ts), last_w or 0.0
@@ -0,0 +1,203 @@
+"""Cache persistente del layout (CCA ``summary_config`` / cloud ``tigobuild/config``).
+
+Il layout di un impianto non cambia quasi mai, ma veniva riletto dal device
+(o dal cloud) ad ogni setup, bloccando l'avvio sulla rete. Ora viene salvato
+nello storage di HA (``.storage/tigo.layout.<entry_id>``) insieme a un hash
+del contenuto: all'avvio si usa subito la copia salvata e la si riconvalida
+in background. Solo se l'hash cambia (pannelli aggiunti, rimossi o
+rinominati) i device dei pannelli spariti vengono rimossi e l'entry viene
+ricaricata per creare quelli nuovi.
+
+``PanelInventory`` salva invece l'elenco dei pannelli già visti (ID, label,
+metriche disponibili, info di layout e stringa/inverter): le entità vengono
+create subito da lì, anche se il device è in standby al riavvio di HA.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Awaitable, Callable
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN, INVENTORY_STORAGE_VERSION, LAYOUT_CACHE_STORAGE_VERSION, _LOGGER
+
+
+def layout_cache_key(entry_id: str) -> str:
+    return f"{DOMAIN}.layout.{entry_id}"
+
+
+def inventory_key(entry_id: str) -> str:
+    return f"{DOMAIN}.inventory.{entry_id}"
+
+
+def layout_hash(layout: dict) -> str:
+    """Hash stabile del layout (chiavi ordinate, indipendente dall'ordine del JSON)."""
+    raw = json.dumps(layout, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def layout_panel_ids(layout: dict) -> set[str]:
+    """ID dei pannelli di un layout CCA ({"system": {"inverters": [...]}}) o cloud."""
+    system = layout.get("system")
+    if not isinstance(system, dict):
+        # Layout cloud: {"panels": {object_id: {...}}}
+        return {str(oid) for oid in (layout.get("panels") or {})}
+    return {
+        str(panel.get("object_id"))
+        for inverter in system.get("inverters", [])
+        for mppt in inverter.get("mppts", [])
+        for panel in mppt.get("panels", [])
+    }
+
+
+class LayoutCache:
+    """Ultimo layout valido di un impianto, con il suo hash.
+
+    ``source_key`` identifica il CCA o il sistema cloud (IP / system_id): se
+    l'entry viene ripuntata altrove la copia salvata viene ignorata.
+    Un layout vuoto (device in standby, errore) non viene mai salvato.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str, source_key: str) -> None:
+        self._store = Store(hass, LAYOUT_CACHE_STORAGE_VERSION, layout_cache_key(entry_id))
+        self._source_key = str(source_key)
+        self.layout: dict | None = None
+        self.hash: str | None = None
+
+    async def async_load(self) -> dict | None:
+        try:
+            stored = await self._store.async_load()
+        except Exception as e:
+            _LOGGER.warning("Cache layout non leggibile, la rileggo dal device: %s", e)
+            stored = None
+        stored = stored or {}
+        if stored.get("key") != self._source_key or not isinstance(stored.get("layout"), dict):
+            return None
+        self.layout = stored["layout"]
+        self.hash = stored.get("hash") or layout_hash(self.layout)
+        return self.layout
+
+    async def async_update(self, layout: dict) -> bool:
+        """Salva ``layout`` se diverso da quello in cache. True se è cambiato."""
+        if not layout:
+            return False
+        new_hash = layout_hash(layout)
+        if new_hash == self.hash:
+            return False
+        self.layout, self.hash = layout, new_hash
+        await self._store.async_save({"key": self._source_key, "hash": new_hash, "layout": layout})
+        return True
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
+
+
+async def async_cached_layout(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    cache: LayoutCache,
+    fetch: Callable[[], Awaitable[dict]],
+    device_prefix: str,
+    inventory: PanelInventory | None = None,
+) -> dict:
+    """Layout dalla cache (riconvalidato in background) o, la prima volta, dal device.
+
+    ``device_prefix`` è il prefisso degli identificatori dei device pannello
+    (``<prefisso>_<panel_id>``), usato per rimuovere i pannelli spariti, che
+    escono anche da ``inventory``.
+    """
+    cached = await cache.async_load()
+    if cached is not None:
+        entry.async_create_background_task(
+            hass,
+            _async_revalidate(hass, entry, cache, fetch, device_prefix, inventory),
+            f"tigo_layout_{entry.entry_id}",
+        )
+        return cached
+    try:
+        layout = await fetch()
+    except Exception as e:
+        _LOGGER.warning("Layout non disponibile al setup: %s", e)
+        return {}
+    await cache.async_update(layout)
+    return layout or {}
+
+
+async def _async_revalidate(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    cache: LayoutCache,
+    fetch: Callable[[], Awaitable[dict]],
+    device_prefix: str,
+    inventory: PanelInventory | None,
+) -> None:
+    try:
+        layout = await fetch()
+    except Exception as e:
+        _LOGGER.debug("Riconvalida layout non riuscita, resto sulla cache: %s", e)
+        return
+    old_panels = layout_panel_ids(cache.layout or {})
+    if not await cache.async_update(layout):
+        return
+
+    removed = old_panels - layout_panel_ids(layout)
+    _LOGGER.info(
+        "Layout Tigo cambiato (%d pannelli rimossi): ricarico l'entry %s",
+        len(removed), entry.title,
+    )
+    if removed:
+        if inventory is not None:
+            await inventory.async_drop(removed)
+        device_registry = dr.async_get(hass)
+        for panel_id in removed:
+            device = device_registry.async_get_device(identifiers={(DOMAIN, f"{device_prefix}_{panel_id}")})
+            if device is not None:
+                device_registry.async_update_device(device.id, remove_config_entry_id=entry.entry_id)
+    hass.config_entries.async_schedule_reload(entry.entry_id)
+
+
+class PanelInventory:
+    """Pannelli noti di un'entry: {panel_id: {"label", "metrics", "layout", "parents"}}.
+
+    ``metrics`` elenca i parametri (Pin, Vin, ...) per cui esiste un sensore.
+    L'inventario cresce soltanto: un pannello che non risponde resta, i
+    pannelli rimossi dal layout escono con la riconciliazione di
+    ``LayoutCache`` (reload dell'entry).
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self._store = Store(hass, INVENTORY_STORAGE_VERSION, inventory_key(entry_id))
+        self.panels: dict[str, dict] = {}
+
+    async def async_load(self) -> dict[str, dict]:
+        try:
+            stored = await self._store.async_load()
+        except Exception as e:
+            _LOGGER.warning("Inventario pannelli non leggibile, riparto da vuoto: %s", e)
+            stored = None
+        panels = (stored or {}).get("panels") or {}
+        self.panels = {str(pid): info for pid, info in panels.items() if isinstance(info, dict)}
+        return self.panels
+
+    async def async_drop(self, panel_ids: set[str]) -> None:
+        """Dimentica i pannelli rimossi dal layout."""
+        kept = {pid: info for pid, info in self.panels.items() if pid not in panel_ids}
+        if len(kept) != len(self.panels):
+            self.panels = kept
+            await self._store.async_save({"panels": kept})
+
+    async def async_update(self, panels: dict[str, dict]) -> bool:
+        """Aggiunge/aggiorna ``panels`` e salva se qualcosa è cambiato."""
+        merged = {**self.panels, **panels}
+        if merged == self.panels:
+            return False
+        self.panels = merged
+        await self._store.async_save({"panels": merged})
+        return True
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
@@ -0,0 +1,265 @@
+"""Client asincrono per gli endpoint locali ``/cgi-bin`` del CCA.
+
+Unico accesso HTTP al CCA (polling, energia, layout e sonda del config flow)
+su ``aiohttp``: le richieste girano nell'event loop di Home Assistant, senza
+occupare thread dell'executor condiviso, e riusano le connessioni keep-alive
+verso il CCA della sessione HTTP di HA. Il parsing delle risposte resta in
+``tigo_api``.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import aiohttp
+
+from .const import AUTH_HEADER, FIRMWARE_CLOUD_MIN
+from .tigo_api import (
+    SNAPSHOT_METRICS,
+    STREAM_CHUNK_SIZE,
+    _log_throttled,
+    _parse_version,
+    _summary_params,
+    build_snapshot_panels,
+    day_energy_kwh,
+    energy_history_dates,
+    parse_device_info,
+    parse_energy_history,
+    parse_layout,
+    snapshot_order,
+    summarize_daily_energy,
+)
+from .tigo_energy import EMPTY_DAY_KWH
+from .tigo_summary import SummaryCursor, SummaryStreamParser
+
+if TYPE_CHECKING:
+    from .tigo_energy import DayEnergyCache, TodayEnergyAccumulator
+
+
+class TigoLocalClient:
+    """Client asincrono verso un singolo CCA.
+
+    ``session`` è tipicamente ``async_get_clientsession(hass)``: il connettore
+    condiviso di HA tiene aperte le connessioni per host tra un poll e l'altro.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, ip: str) -> None:
+        self._session = session
+        self.ip = ip
+        self._base = f"http://{ip}/cgi-bin"
+
+    async def _get_json(
+        self,
+        path: str,
+        *,
+        params: dict | None = None,
+        timeout: float = 6.0,
+        stats: dict | None = None,
+        parser: SummaryStreamParser | None = None,
+        nan_cells: bool = False,
+    ) -> dict | list | None:
+        """GET JSON asincrona. Ritorna None (con log throttled) se il CCA non risponde.
+
+        Con ``nan_cells`` le celle ``"-"`` diventano NaN già nel testo JSON.
+        """
+        url = f"{self._base}/{path}"
+        client_timeout = aiohttp.ClientTimeout(total=None, connect=timeout, sock_read=timeout)
+        try:
+            async with self._session.get(
+                url, headers=AUTH_HEADER, params=params or {}, timeout=client_timeout
+            ) as r:
+                r.raise_for_status()
+                if parser is not None:
+                    async for chunk in r.content.iter_chunked(STREAM_CHUNK_SIZE):
+                        parser.feed(chunk)
+                    size = parser.bytes
+                    data = parser.close()
+                else:
+                    body = await r.read()
+                    size = len(body)
+                    if nan_cells:
+                        body = body.replace(b'"-"', b"NaN")
+                    data = json.loads(body)
+            if stats is not None:
+                stats["requests"] = stats.get("requests", 0) + 1
+                stats["bytes"] = stats.get("bytes", 0) + size
+            return data
+        except asyncio.TimeoutError:
+            _log_throttled(f"timeout:{url}", logging.INFO, f"Tigo timeout su {url}: probabile standby notturno")
+            return None
+        except aiohttp.ClientConnectionError as e:
+            _log_throttled(f"connerr:{url}", logging.INFO, f"Tigo non raggiungibile ({e.__class__.__name__}): {url}")
+            return None
+        except ValueError as e:
+            _log_throttled(f"badjson:{url}", logging.WARNING, f"Tigo JSON non valido da {url}: {e}")
+            return None
+        except Exception as e:
+            _log_throttled(f"generic:{url}", logging.WARNING, f"Errore generico su {url}: {e}")
+            return None
+
+    # --- Dati live --------------------------------------------------------
+
+    async def fetch_snapshot(self, cursor: SummaryCursor | None = None, stream: bool = True) -> dict:
+        """Legge l'ultimo valore di ogni metrica del CCA con il minimo di richieste.
+
+        La risposta ``pin`` serve sia per l'ordine dei pannelli sia come
+        metrica, le altre metriche partono insieme. Con un ``cursor`` si
+        analizzano solo le righe nuove dall'ultimo poll (e si alimenta la sua
+        serie a minuti). Con ``stream`` le risposte sono decodificate in
+        streaming e si materializzano solo ``order`` e le righe utili. Ritorna
+        ``{"panels": {panel_id: {...}},
+        "stats": {"requests", "bytes", "rows", "elapsed_ms"}}``.
+        """
+        started = time.monotonic()
+        date = datetime.now().date().isoformat()
+        stats = {"requests": 0, "bytes": 0, "rows": 0}
+
+        def _parser(temp: str) -> SummaryStreamParser | None:
+            if not stream:
+                return None
+            return SummaryStreamParser(cursor.stream_start(temp, date) if cursor is not None else None)
+
+        def _result(panels: dict) -> dict:
+            stats["elapsed_ms"] = round((time.monotonic() - started) * 1000.0, 1)
+            return {"panels": panels, "stats": stats}
+
+        first = await self._get_json(
+            "summary_data", params=_summary_params(date, "pin"), stats=stats, parser=_parser("pin"),
+        )
+        panel_order = snapshot_order(first)
+        if panel_order is None:
+            return _result({})
+
+        others = [temp for temp in SNAPSHOT_METRICS if temp != "pin"]
+        results = await asyncio.gather(*(
+            self._get_json(
+                "summary_data", params=_summary_params(date, temp), stats=stats, parser=_parser(temp),
+            )
+            for temp in others
+        ))
+        responses = {"pin": first, **dict(zip(others, results))}
+        return _result(build_snapshot_panels(responses, panel_order, date, cursor, stats))
+
+    # --- Layout / info / energia -----------------------------------------
+
+    async def fetch_layout(self) -> dict:
+        return parse_layout(await self._get_json("summary_config"))
+
+    async def fetch_device_info(self) -> dict:
+        return parse_device_info(await self._get_json("mobile_api", params={"cmd": "DEVICE_INFO"}))
+
+    async def fetch_energy_history(self) -> list[dict]:
+        return parse_energy_history(await self._get_json("summary_energy"))
+
+    async def fetch_day_summary(self, date_str: str, temp: str = "pin", nan_cells: bool = False) -> dict | None:
+        """Dataset summary_data completo (righe a minuti) di una giornata.
+
+        ``nan_cells`` serve a chi lo passa a ``decode_summary``: senza celle
+        ``"-"`` la matrice si converte in un colpo solo.
+        """
+        data = await self._get_json(
+            "summary_data", params=_summary_params(date_str, temp), timeout=8.0, nan_cells=nan_cells,
+        )
+        return data if isinstance(data, dict) else None
+
+    async def fetch_day_energy(self, date_str: str) -> float | None:
+        """kWh della giornata (``EMPTY_DAY_KWH`` senza righe); None se il CCA non ha risposto."""
+        data = await self.fetch_day_summary(date_str)
+        if not isinstance(data, dict):
+            return None
+        if not any(block.get("data") for block in data.get("dataset") or [] if isinstance(block, dict)):
+            return EMPTY_DAY_KWH
+        return day_energy_kwh(data)
+
+    async def fetch_today_energy(self, accumulator: TodayEnergyAccumulator) -> float | None:
+        """kWh di oggi sommando solo le righe nuove dall'ultimo refresh."""
+        date = datetime.now().date().isoformat()
+        for _ in range(2):
+            data = await self._get_json(
+                "summary_data", params=_summary_params(date, "pin"), timeout=8.0,
+                parser=SummaryStreamParser(accumulator.stream_start(date)),
+            )
+            if not isinstance(data, dict):
+                return None
+            kwh = accumulator.consume(date, data.get("dataset") or [])
+            if kwh is not None:
+                return kwh
+            # Posizione non più valida: secondo giro con la giornata completa
+        return None
+
+    async def fetch_daily_energy(
+        self,
+        cache: DayEnergyCache | None = None,
+        today_energy: TodayEnergyAccumulator | None = None,
+    ) -> dict:
+        """Storico a 7 giorni: giorni conclusi (anche vuoti) da ``cache``, oggi dalle righe nuove."""
+        today = datetime.now().date()
+        history = []
+        for date_obj in energy_history_dates():
+            date_str = date_obj.isoformat()
+            energy = cache.get(date_str) if cache is not None and date_obj != today else None
+            if energy is None and date_obj == today and today_energy is not None:
+                energy = await self.fetch_today_energy(today_energy)
+            elif energy is None:
+                energy = await self.fetch_day_energy(date_str)
+                # Giorno concluso a zero: riletto una volta, poi resta in cache
+                if date_obj != today and not energy:
+                    energy = await self.fetch_day_energy(date_str)
+                if cache is not None and date_obj != today:
+                    cache.put(date_obj, energy)
+            history.append([date_str, energy or 0.0])
+        return summarize_daily_energy(history)
+
+    # --- Sonda del config flow -------------------------------------------
+
+    async def _tcp_reachable(self, port: int = 80, timeout: float = 3.0) -> bool:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(self.ip, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        with contextlib.suppress(Exception):
+            await writer.wait_closed()
+        return True
+
+    async def probe(self) -> dict:
+        """Sonda il CCA locale per decidere se usare la sorgente locale o il cloud.
+
+        Ritorna:
+          - reachable: il device risponde su TCP:80
+          - software: versione firmware se leggibile con la vecchia password
+          - local_ok: si sono ottenuti dati validi dei pannelli in locale
+          - requires_cloud: firmware >= FIRMWARE_CLOUD_MIN, oppure raggiungibile ma
+            senza accesso locale ai dati (password nuova) -> serve login cloud
+        """
+        reachable = await self._tcp_reachable()
+        info = await self.fetch_device_info() if reachable else {}
+        software = info.get("software")
+        version = _parse_version(software)
+
+        local_ok = False
+        if reachable:
+            try:
+                local_ok = bool((await self.fetch_snapshot())["panels"])
+            except Exception:
+                local_ok = False
+
+        if version is not None:
+            requires_cloud = version >= FIRMWARE_CLOUD_MIN
+        else:
+            # Versione non leggibile: se raggiungibile ma senza dati locali,
+            # il firmware nuovo ha bloccato il locale -> cloud.
+            requires_cloud = reachable and not local_ok
+
+        return {
+            "reachable": reachable,
+            "software": software,
+            "version": version,
+            "local_ok": local_ok,
+            "requires_cloud": requires_cloud,
+        }
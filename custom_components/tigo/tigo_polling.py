@@ -0,0 +1,203 @@
+"""Politica di retry e backoff del polling, interamente asincrona.
+
+Sostituisce il vecchio ``_with_retries`` (``time.sleep`` dentro un job
+dell'executor): le attese sono ``asyncio`` e si interrompono subito quando
+l'entry viene scaricata. Dopo una serie di poll falliti il device viene
+considerato "addormentato" (standby notturno del CCA/ESP): si smette di
+ritentare e il coordinator passa a un heartbeat lento finché il device non
+risponde di nuovo.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+from datetime import timedelta
+from typing import Awaitable, Callable, TypeVar
+
+from .const import _LOGGER
+
+T = TypeVar("T")
+
+STATE_AWAKE = "awake"
+STATE_ASLEEP = "asleep"
+
+# Poll consecutivi a vuoto/falliti prima di considerare il device in standby
+ASLEEP_AFTER_MISSES = 3
+# Intervallo di heartbeat mentre il device dorme
+ASLEEP_HEARTBEAT = timedelta(minutes=10)
+
+
+class PollCancelled(Exception):
+    """Il polling è stato annullato (entry scaricata) durante un'attesa."""
+
+
+class RetryScheduler:
+    """Esegue un fetch asincrono con retry a backoff con jitter.
+
+    - sveglio: fino a ``attempts`` tentativi, attese ``min(base * i, max)``
+      scalate da un jitter casuale (50–100%) per non allineare più entry;
+    - un risultato vuoto non viene ritentato ma conta come poll mancato;
+    - dopo ``asleep_after`` poll mancati di fila passa a "asleep": un solo
+      tentativo per poll e ``on_state_change(True)`` per rallentare il polling;
+    - al primo poll con dati torna "awake" (``on_state_change(False)``).
+    """
+
+    def __init__(
+        self,
+        label: str,
+        *,
+        attempts: int = 5,
+        base_sleep: float = 15,
+        max_sleep: float = 60,
+        asleep_after: int = ASLEEP_AFTER_MISSES,
+        on_state_change: Callable[[bool], None] | None = None,
+    ) -> None:
+        self.label = label
+        self._attempts = attempts
+        self._base_sleep = base_sleep
+        self._max_sleep = max_sleep
+        self._asleep_after = asleep_after
+        self._on_state_change = on_state_change
+        self._cancelled = asyncio.Event()
+        self.state = STATE_AWAKE
+        self.failure_streak = 0
+
+    @property
+    def asleep(self) -> bool:
+        return self.state == STATE_ASLEEP
+
+    def cancel(self) -> None:
+        """Interrompe le attese in corso e i poll futuri (unload dell'entry)."""
+        self._cancelled.set()
+
+    def mark_alive(self) -> None:
+        """Il device ha inviato dati fuori dal polling (es. frame WebSocket)."""
+        self._record(True)
+
+    def backoff(self, attempt: int) -> float:
+        """Attesa prima del tentativo ``attempt + 1`` (con jitter)."""
+        wait = min(self._base_sleep * attempt, self._max_sleep)
+        return wait * random.uniform(0.5, 1.0)
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._cancelled.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            return
+        raise PollCancelled(self.label)
+
+    def _set_state(self, state: str) -> None:
+        if state == self.state:
+            return
+        self.state = state
+        if state == STATE_ASLEEP:
+            _LOGGER.info("[%s] nessuna risposta da %d poll: probabile standby, passo all'heartbeat",
+                         self.label, self.failure_streak)
+        else:
+            _LOGGER.info("[%s] device di nuovo raggiungibile", self.label)
+        if self._on_state_change is not None:
+            self._on_state_change(state == STATE_ASLEEP)
+
+    def _record(self, ok: bool) -> None:
+        if ok:
+            self.failure_streak = 0
+            self._set_state(STATE_AWAKE)
+            return
+        self.failure_streak += 1
+        if self.failure_streak >= self._asleep_after:
+            self._set_state(STATE_ASLEEP)
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        if self._cancelled.is_set():
+            raise PollCancelled(self.label)
+
+        attempts = 1 if self.asleep else self._attempts
+        last_err: Exception | None = None
+        for i in range(1, attempts + 1):
+            try:
+                result = await fn()
+            except Exception as e:
+                last_err = e
+                if i < attempts:
+                    wait = self.backoff(i)
+                    _LOGGER.debug("[%s] tentativo %d/%d fallito: %s → ritento tra %.0fs",
+                                  self.label, i, attempts, e, wait)
+                    await self._sleep(wait)
+                continue
+            self._record(bool(result))
+            return result
+
+        self._record(False)
+        if not self.asleep:
+            _LOGGER.warning("[%s] ancora non raggiungibile dopo %d tentativi: %s", self.label, attempts, last_err)
+        raise last_err
+
+
+# --- Intervallo adattivo ---------------------------------------------------
+
+# Sole sotto questa elevazione: notte, il CCA/ESP dorme
+NIGHT_ELEVATION = -6.0
+# Sole sotto questa elevazione: alba/tramonto
+LOW_SUN_ELEVATION = 5.0
+# Intervallo notturno (e tetto dell'intervallo adattivo)
+NIGHT_INTERVAL_SEC = 600
+# Di giorno, con potenza stabile, l'intervallo si allunga fino a questo tetto
+STABLE_INTERVAL_MAX_SEC = 300
+# Variazione relativa di Pin al minuto sotto la quale la potenza è "stabile"
+STABLE_POWER_RATE = 0.02
+
+
+class AdaptiveInterval:
+    """Calcola l'intervallo di polling da posizione del sole, errori e variazione di Pin.
+
+    - notte: ``NIGHT_INTERVAL_SEC``;
+    - alba: il floor configurato, anche se il device risulta addormentato,
+      per accorgersi subito del risveglio; tramonto: il doppio del floor;
+    - giorno: il floor, raddoppiato ad ogni poll fallito di fila, e allungato
+      fino a ``STABLE_INTERVAL_MAX_SEC`` se la potenza totale è stabile;
+    - senza posizione del sole: il floor (o l'heartbeat se il device dorme).
+
+    Il valore configurato dall'utente (``floor``) non viene mai ridotto.
+    """
+
+    def __init__(self, floor: float) -> None:
+        self.floor = float(floor)
+        self._last_power: tuple[float, float] | None = None
+        self.power_rate: float | None = None
+
+    def observe_power(self, total_w: float | None, now: float) -> None:
+        """Registra la potenza totale (W) al tempo ``now`` (secondi monotoni)."""
+        if total_w is None:
+            return
+        if self._last_power is not None:
+            prev_w, prev_t = self._last_power
+            minutes = (now - prev_t) / 60.0
+            if minutes > 0:
+                self.power_rate = abs(total_w - prev_w) / max(prev_w, total_w, 1.0) / minutes
+        self._last_power = (float(total_w), now)
+
+    def next_interval(
+        self,
+        *,
+        elevation: float | None,
+        rising: bool | None,
+        failure_streak: int = 0,
+        asleep: bool = False,
+    ) -> float:
+        floor = self.floor
+        if elevation is None:
+            return max(ASLEEP_HEARTBEAT.total_seconds(), floor) if asleep else floor
+
+        if elevation < NIGHT_ELEVATION:
+            return max(NIGHT_INTERVAL_SEC, floor)
+
+        if elevation < LOW_SUN_ELEVATION:
+            return floor if rising else min(floor * 2, max(NIGHT_INTERVAL_SEC, floor))
+
+        if asleep or failure_streak:
+            return min(floor * 2 ** max(failure_streak, 1), max(NIGHT_INTERVAL_SEC, floor))
+
+        rate = self.power_rate
+        if rate is not None and rate < STABLE_POWER_RATE:
+            return max(floor, min(floor * 2, STABLE_INTERVAL_MAX_SEC))
+        return floor
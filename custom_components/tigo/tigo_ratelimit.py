@@ -0,0 +1,145 @@
+"""Governatore delle richieste verso il cloud Tigo, condiviso per account.
+
+``TigoCloudClient._get`` trattava ogni risposta diversa da 200 (a parte
+401/403) come un ``None`` silenzioso: un account limitato dal cloud
+sembrava solo "senza dati" e il poll successivo colpiva di nuovo il limite.
+
+``CloudRateGovernor`` è un token bucket (``burst`` richieste subito, poi
+``per_hour`` all'ora) condiviso da tutte le entry cloud dello stesso
+account. Un HTTP 429 o 5xx blocca le richieste per il ``Retry-After``
+indicato dal server o, in sua assenza, per un backoff esponenziale; finché
+il blocco è attivo le richieste falliscono subito senza toccare la rete.
+I contatori (richieste nell'ultima ora, risposte limitate, budget residuo)
+sono esposti come sensori diagnostici.
+
+Il client cloud gira nei thread dell'executor: lo stato è protetto da un lock.
+"""
+from __future__ import annotations
+
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from .const import (
+    CLOUD_BACKOFF_BASE_SEC,
+    CLOUD_BACKOFF_MAX_SEC,
+    CLOUD_RATE_BURST,
+    CLOUD_RATE_PER_HOUR,
+    DOMAIN,
+    _LOGGER,
+)
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+# Chiave di hass.data con i governatori per account
+GOVERNORS_KEY = f"{DOMAIN}_rate_governors"
+
+
+def parse_retry_after(value, now: float | None = None) -> float | None:
+    """Secondi indicati da un header ``Retry-After`` (secondi o data HTTP)."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    now_dt = datetime.fromtimestamp(now, timezone.utc) if now is not None else datetime.now(timezone.utc)
+    return max(0.0, (when - now_dt).total_seconds())
+
+
+class CloudRateGovernor:
+    """Token bucket + blocco su 429/5xx per un account cloud."""
+
+    def __init__(
+        self,
+        per_hour: float = CLOUD_RATE_PER_HOUR,
+        burst: float = CLOUD_RATE_BURST,
+        clock=time.monotonic,
+    ) -> None:
+        self.per_hour = float(per_hour)
+        self.burst = float(burst)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = clock()
+        self._blocked_until = 0.0
+        self._streak = 0
+        self._sent: deque[float] = deque()
+        self.throttled = 0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.per_hour / 3600.0)
+            self._refilled_at = now
+
+    def reserve(self) -> float:
+        """Prende un gettone: 0 se la richiesta può partire, altrimenti i secondi da attendere.
+
+        Se il risultato è > 0 nessun gettone è stato consumato.
+        """
+        with self._lock:
+            now = self._clock()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._refill(now)
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) * 3600.0 / self.per_hour
+            self._tokens -= 1.0
+            self._sent.append(now)
+            return 0.0
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._streak = 0
+
+    def record_throttled(self, status: int, retry_after: float | None) -> float:
+        """Registra un 429/5xx e blocca le richieste. Ritorna la durata del blocco (s)."""
+        with self._lock:
+            self._streak += 1
+            if status == 429:
+                self.throttled += 1
+            if retry_after is None:
+                retry_after = min(CLOUD_BACKOFF_BASE_SEC * 2 ** (self._streak - 1), CLOUD_BACKOFF_MAX_SEC)
+            now = self._clock()
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+            # Il bucket riparte vuoto: niente raffica appena finisce il blocco
+            self._tokens = 0.0
+            self._refilled_at = self._blocked_until
+        _LOGGER.warning("Cloud Tigo: HTTP %s, richieste sospese per %.0f s", status, retry_after)
+        return retry_after
+
+    def stats(self) -> dict:
+        """Contatori per i sensori diagnostici."""
+        with self._lock:
+            now = self._clock()
+            while self._sent and self._sent[0] <= now - 3600.0:
+                self._sent.popleft()
+            self._refill(now)
+            return {
+                "requests_hour": len(self._sent),
+                "throttled": self.throttled,
+                "budget": 0 if now < self._blocked_until else int(self._tokens),
+                "blocked_for": max(0.0, round(self._blocked_until - now, 1)),
+            }
+
+
+def governor_for(hass: HomeAssistant, username: str) -> CloudRateGovernor:
+    """Governatore dell'account ``username``, condiviso tra le sue entry cloud."""
+    governors: dict = hass.data.setdefault(GOVERNORS_KEY, {})
+    key = (username or "").strip().lower()
+    governor = governors.get(key)
+    if governor is None:
+        governor = governors[key] = CloudRateGovernor()
+    return governor
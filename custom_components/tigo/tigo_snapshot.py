@@ -0,0 +1,208 @@
+"""Snapshot compatto dei valori per pannello delle sorgenti locali.
+
+Il coordinator teneva ``{panel_id: {"Pin": ..., "Vin": ..., ...}}``: un dict
+per pannello con le stesse chiavi stringa ripetute, ricostruito da zero ad
+ogni poll. ``PanelSnapshot`` tiene invece un indice fisso dei pannelli
+(``PanelIndex``, riusato finché l'elenco non cambia) e una colonna per
+metrica: ``array('d')`` per le metriche numeriche (NaN = valore assente),
+lista per le altre (PanelName, Addr, PinSamples, ...).
+
+L'API di lettura resta quella di un dict: ``snapshot[panel_id]`` o
+``snapshot.get(panel_id)`` danno una ``PanelView`` (``__slots__``) che si
+legge come ``{metrica: valore}``, con solo le metriche presenti.
+"""
+from __future__ import annotations
+
+import math
+from array import array
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Iterator
+
+# Metriche numeriche: colonne array('d'); tutte le altre sono liste
+NUMERIC_METRICS = ("Pin", "Vin", "Vout", "Iin", "Temp", "Rssi")
+_NUMERIC = frozenset(NUMERIC_METRICS)
+_NAN = float("nan")
+
+
+def _num(v) -> float:
+    try:
+        return float(v) if v is not None else _NAN
+    except (TypeError, ValueError):
+        return _NAN
+
+
+class PanelIndex:
+    """Elenco ordinato e immutabile dei pannelli con la posizione di ognuno."""
+
+    __slots__ = ("ids", "pos")
+
+    def __init__(self, ids: tuple) -> None:
+        self.ids = ids
+        self.pos = {p: i for i, p in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+@lru_cache(maxsize=8)
+def panel_index(ids: tuple) -> PanelIndex:
+    """``PanelIndex`` condiviso per un elenco di pannelli (stesso oggetto ad ogni poll)."""
+    return PanelIndex(ids)
+
+
+class PanelView(Mapping):
+    """Valori di un pannello, letti dalle colonne dello snapshot."""
+
+    __slots__ = ("_snap", "_i")
+
+    def __init__(self, snap: PanelSnapshot, i: int) -> None:
+        self._snap = snap
+        self._i = i
+
+    def _value(self, metric: str):
+        col = self._snap.columns.get(metric)
+        if col is None:
+            return None
+        v = col[self._i]
+        if metric in _NUMERIC and math.isnan(v):
+            return None
+        return v
+
+    def __getitem__(self, metric: str):
+        col = self._snap.columns.get(metric)
+        if col is None:
+            raise KeyError(metric)
+        v = col[self._i]
+        if v is None or (metric in _NUMERIC and math.isnan(v)):
+            raise KeyError(metric)
+        return v
+
+    def get(self, metric: str, default=None):
+        v = self._value(metric)
+        return default if v is None else v
+
+    def __contains__(self, metric) -> bool:
+        return self._value(metric) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        i = self._i
+        for metric, col in self._snap.columns.items():
+            v = col[i]
+            if v is not None and not (metric in _NUMERIC and math.isnan(v)):
+                yield metric
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"PanelView({dict(self.items())!r})"
+
+
+class PanelSnapshot(Mapping):
+    """{panel_id: PanelView} a colonne; confronto e diff colonna per colonna."""
+
+    __slots__ = ("index", "columns")
+
+    def __init__(self, index: PanelIndex, columns: dict) -> None:
+        self.index = index
+        self.columns = columns
+
+    def __getitem__(self, panel_id) -> PanelView:
+        return PanelView(self, self.index.pos[panel_id])
+
+    def get(self, panel_id, default=None):
+        i = self.index.pos.get(panel_id)
+        return default if i is None else PanelView(self, i)
+
+    def __contains__(self, panel_id) -> bool:
+        return panel_id in self.index.pos
+
+    def __iter__(self) -> Iterator:
+        return iter(self.index.ids)
+
+    def __len__(self) -> int:
+        return len(self.index.ids)
+
+    def __repr__(self) -> str:
+        return f"PanelSnapshot({len(self)} pannelli, metriche={list(self.columns)})"
+
+    def total(self, metric: str) -> float:
+        """Somma della metrica numerica sui pannelli (valori assenti esclusi)."""
+        col = self.columns.get(metric)
+        if col is None:
+            return 0.0
+        return sum(v for v in col if not math.isnan(v))
+
+    def column_changed(self, metric: str, other: PanelSnapshot) -> bool:
+        """True se la colonna differisce da quella di ``other`` (stesso indice)."""
+        a = self.columns.get(metric)
+        b = other.columns.get(metric)
+        if a is None or b is None:
+            return a is not b
+        if metric in _NUMERIC:
+            # Confronto byte a byte: NaN uguale a NaN, nessun ciclo Python
+            return a.tobytes() != b.tobytes()
+        return a != b
+
+    def merged(self, panels: dict[str, dict]) -> PanelSnapshot:
+        """Nuovo snapshot con i valori di ``panels`` sovrapposti a questo (frame parziali ESP32)."""
+        ids = self.index.ids
+        extra = tuple(p for p in panels if p not in self.index.pos)
+        index = panel_index(ids + extra) if extra else self.index
+        n, grow = len(index), len(extra)
+        columns: dict = {}
+        for metric, col in self.columns.items():
+            columns[metric] = col + array("d", [_NAN]) * grow if metric in _NUMERIC else col + [None] * grow
+        _fill(index, columns, panels, n)
+        return PanelSnapshot(index, columns)
+
+
+def _fill(index: PanelIndex, columns: dict, panels: dict[str, dict], n: int) -> None:
+    pos = index.pos
+    for panel_id, values in panels.items():
+        i = pos[panel_id]
+        for metric, v in values.items():
+            col = columns.get(metric)
+            if col is None:
+                col = columns[metric] = array("d", [_NAN]) * n if metric in _NUMERIC else [None] * n
+            col[i] = _num(v) if metric in _NUMERIC else v
+
+
+def snapshot_from_panels(panels: dict[str, dict] | None) -> PanelSnapshot:
+    """Snapshot da un dict ``{panel_id: {metrica: valore}}`` (es. frame WebSocket ESP32)."""
+    panels = panels or {}
+    index = panel_index(tuple(panels))
+    columns: dict = {}
+    _fill(index, columns, panels, len(index))
+    return PanelSnapshot(index, columns)
+
+
+def snapshot_from_columns(order: list, values: dict[str, dict]) -> PanelSnapshot:
+    """Snapshot dalle ultime letture per metrica ``{metrica: {panel_id: valore}}`` (CCA).
+
+    Entrano solo i pannelli con almeno una metrica, nell'ordine di ``order``
+    (più gli eventuali pannelli fuori ordine). Con l'elenco invariato
+    l'indice è lo stesso oggetto del poll precedente.
+    """
+    seen = set()
+    for by_panel in values.values():
+        seen.update(by_panel)
+    ids = [p for p in order if p in seen]
+    if len(ids) != len(seen):
+        known = set(ids)
+        for by_panel in values.values():
+            for p in by_panel:
+                if p not in known:
+                    known.add(p)
+                    ids.append(p)
+    index = panel_index(tuple(ids))
+    pos = index.pos
+    n = len(index)
+    columns: dict = {}
+    for metric, by_panel in values.items():
+        col = array("d", [_NAN]) * n
+        for panel_id, v in by_panel.items():
+            col[pos[panel_id]] = _num(v)
+        columns[metric] = col
+    return PanelSnapshot(index, columns)
@@ -0,0 +1,491 @@
+"""Statistiche a lungo termine ricostruite dallo storico del CCA.
+
+Se HA resta spento per giorni, i sensori energia (pannello, giorno/mese,
+sistema) saltano quell'energia. Il CCA però conserva le righe a minuti di
+``pin`` per ogni giornata (``summary_data``) e i totali giornalieri
+(``summary_energy``): un job in background percorre i giorni conclusi non
+ancora importati, calcola l'energia oraria per pannello e di sistema e la
+importa in blocco come statistiche esterne del recorder
+(``tigo:<prefisso>_<pannello>_energy``, ``tigo:<prefisso>_system_energy``),
+senza scrivere stati.
+
+Il job è riprendibile: dopo ogni gruppo di giorni importati salva su disco
+(``.storage/tigo.statistics.<entry_id>``) l'ultima ora importata e le somme
+cumulative di ogni statistica.
+
+In modalità "solo statistiche" ``HourlyAggregator`` riceve dal cursore
+summary_data le righe a minuti già scaricate dal polling e le riduce in
+media/min/max orari per pannello e metrica; ogni ora conclusa viene importata
+insieme all'energia, senza riscaricare nulla.
+
+Per la sorgente cloud ``CloudPowerStatistics`` fa lo stesso con le curve a
+15 minuti della giornata già tenute in memoria dal client
+(``PanelDaySeries``): media/min/max orari della potenza per pannello.
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import date, datetime, timedelta
+
+from homeassistant.const import (
+    SIGNAL_STRENGTH_DECIBELS_MILLIWATT,
+    UnitOfElectricPotential,
+    UnitOfEnergy,
+    UnitOfPower,
+)
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
+
+from .const import (
+    DOMAIN,
+    STATISTICS_BACKFILL_CONCURRENCY,
+    STATISTICS_BACKFILL_MAX_DAYS,
+    STATISTICS_STORAGE_VERSION,
+    _LOGGER,
+)
+from .tigo_decode import SummaryMatrix, decode_summary
+from .tigo_energy import row_time
+from .tigo_local import TigoLocalClient
+
+SYSTEM_KEY = "system"
+
+# Metriche summary_data aggregate in media/min/max: (suffisso, unità, unit_class)
+MEAN_METRICS = {
+    "pin": ("power", UnitOfPower.WATT, "power"),
+    "vin": ("voltage", UnitOfElectricPotential.VOLT, "voltage"),
+    "rssi": ("rssi", SIGNAL_STRENGTH_DECIBELS_MILLIWATT, None),
+}
+# Ritardo dopo la fine dell'ora prima di considerarla conclusa (righe in ritardo)
+HOUR_SETTLE = timedelta(minutes=3)
+
+
+def statistics_key(entry_id: str) -> str:
+    return f"{DOMAIN}.statistics.{entry_id}"
+
+
+def statistic_id(prefix: str, key: str, metric: str = "energy") -> str:
+    """ID di una statistica esterna: ``tigo:<prefisso>_<pannello>_<metrica>``."""
+    return f"{DOMAIN}:{slugify(f'{prefix}_{key}_{metric}')}"
+
+
+def _history_date(value) -> date | None:
+    """Data di una riga di ``summary_energy`` ("YYYY-MM-DD" o epoch s/ms)."""
+    if isinstance(value, str):
+        parsed = dt_util.parse_date(value[:10])
+        if parsed is not None:
+            return parsed
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        ts = value / 1000.0 if value > 1e11 else value
+        return dt_util.as_local(dt_util.utc_from_timestamp(ts)).date()
+    return None
+
+
+def _hour_start(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def hourly_panel_sums(matrix: SummaryMatrix, day: date) -> dict[datetime, dict[str, float]]:
+    """Righe a minuti → ``{inizio ora UTC: {pannello: somma dei valori}}``.
+
+    Per ``pin`` (W a minuto) la somma / 60 è l'energia oraria in Wh.
+    """
+    out: dict[datetime, dict[str, float]] = {}
+    if not len(matrix):
+        return out
+    stamps = [row_time(day, t, i) for i, t in enumerate(matrix.times)]
+    start = 0
+    for i in range(1, len(stamps) + 1):
+        hour = _hour_start(stamps[start])
+        if i < len(stamps) and _hour_start(stamps[i]) == hour:
+            continue
+        sums = matrix.column_sums(start, i)
+        if sums:
+            bucket = out.setdefault(hour, {})
+            for panel, total in sums.items():
+                bucket[panel] = bucket.get(panel, 0.0) + total
+        start = i
+    return out
+
+
+def _decode_hourly(data: dict, day: date) -> dict[datetime, dict[str, float]]:
+    """``hourly_panel_sums`` di una risposta summary_data (da eseguire nell'executor)."""
+    return hourly_panel_sums(decode_summary(data), day)
+
+
+def _energy_metadata(stat_id: str, name: str) -> dict:
+    from homeassistant.components.recorder.models import StatisticMeanType
+
+    return {
+        "has_mean": False,
+        "mean_type": StatisticMeanType.NONE,
+        "has_sum": True,
+        "name": name,
+        "source": DOMAIN,
+        "statistic_id": stat_id,
+        "unit_class": "energy",
+        "unit_of_measurement": UnitOfEnergy.KILO_WATT_HOUR,
+    }
+
+
+def _mean_metadata(stat_id: str, name: str, unit: str, unit_class: str | None) -> dict:
+    from homeassistant.components.recorder.models import StatisticMeanType
+
+    return {
+        "has_mean": True,
+        "mean_type": StatisticMeanType.ARITHMETIC,
+        "has_sum": False,
+        "name": name,
+        "source": DOMAIN,
+        "statistic_id": stat_id,
+        "unit_class": unit_class,
+        "unit_of_measurement": unit,
+    }
+
+
+class HourlyAggregator:
+    """Aggrega le righe a minuti in bucket orari per metrica e pannello.
+
+    Si registra come ``SummaryCursor.row_listeners``: ogni riga nuova aggiorna
+    ``[conteggio, somma, min, max]`` del pannello nell'ora della riga, in
+    O(pannelli). Le ore concluse restano qui finché non vengono importate.
+    """
+
+    def __init__(self) -> None:
+        self._hours: dict[datetime, dict[str, dict[str, list]]] = {}
+
+    def add_row(self, metric: str, day: str, row_idx: int, t, order: tuple, values) -> None:
+        if metric not in MEAN_METRICS:
+            return
+        parsed = dt_util.parse_date(day)
+        if parsed is None:
+            return
+        hour = _hour_start(row_time(parsed, t, row_idx))
+        buckets = self._hours.setdefault(hour, {}).setdefault(metric, {})
+        for i, panel in enumerate(order[:len(values)]):
+            v = values[i]
+            if metric == "rssi" and v:
+                v = -abs(v)
+            b = buckets.get(panel)
+            if b is None:
+                buckets[panel] = [1, v, v, v]
+            else:
+                b[0] += 1
+                b[1] += v
+                if v < b[2]:
+                    b[2] = v
+                if v > b[3]:
+                    b[3] = v
+
+    def completed(self, now: datetime) -> list[datetime]:
+        """Ore concluse (da almeno ``HOUR_SETTLE``) in ordine cronologico."""
+        limit = now - HOUR_SETTLE - timedelta(hours=1)
+        return sorted(h for h in self._hours if h <= limit)
+
+    def pop(self, hour: datetime) -> dict[str, dict[str, list]]:
+        return self._hours.pop(hour, {})
+
+
+class StatisticsBackfill:
+    """Job di import dell'energia oraria dei giorni conclusi di un CCA.
+
+    ``async_run`` importa i giorni dal checkpoint (al primo avvio gli ultimi
+    ``STATISTICS_BACKFILL_MAX_DAYS``) fino a ieri, scaricandone al più
+    ``STATISTICS_BACKFILL_CONCURRENCY`` in parallelo. Se il CCA non risponde
+    si ferma e riprende dallo stesso giorno alla prossima esecuzione.
+
+    Con un ``aggregator`` (modalità solo statistiche), a giorni passati in
+    pari importa anche le ore concluse di oggi: energia e media/min/max.
+    Ogni ora viene importata una sola volta (``last_hour`` nel checkpoint).
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entry_id: str,
+        client: TigoLocalClient,
+        prefix: str,
+        label: str,
+        aggregator: HourlyAggregator | None = None,
+    ) -> None:
+        self.hass = hass
+        self.aggregator = aggregator
+        self._client = client
+        self._prefix = prefix
+        self._label = label
+        self._store = Store(hass, STATISTICS_STORAGE_VERSION, statistics_key(entry_id))
+        self._lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(STATISTICS_BACKFILL_CONCURRENCY)
+        self._checkpoint: dict | None = None
+        self.imported_days = 0
+
+    async def _load(self) -> dict:
+        if self._checkpoint is None:
+            try:
+                stored = await self._store.async_load()
+            except Exception as e:
+                _LOGGER.warning("[%s] checkpoint statistiche non leggibile: %s", self._label, e)
+                stored = None
+            self._checkpoint = {"last_hour": None, "sums": {}, **(stored or {})}
+        return self._checkpoint
+
+    @staticmethod
+    def _last_hour(checkpoint: dict) -> datetime | None:
+        """Inizio (UTC) dell'ultima ora importata."""
+        return dt_util.parse_datetime(checkpoint.get("last_hour") or "")
+
+    @staticmethod
+    def _day_last_hour(day: date) -> datetime:
+        return dt_util.as_utc(dt_util.start_of_local_day(day + timedelta(days=1))) - timedelta(hours=1)
+
+    def pending_dates(self, checkpoint: dict, today: date) -> list[date]:
+        """Giorni conclusi da importare, dal checkpoint (o dal limite massimo) a ieri."""
+        yesterday = today - timedelta(days=1)
+        oldest = yesterday - timedelta(days=STATISTICS_BACKFILL_MAX_DAYS - 1)
+        last = self._last_hour(checkpoint)
+        if last is not None:
+            # Il giorno dell'ora successiva può essere importato solo in parte
+            first = max(dt_util.as_local(last + timedelta(hours=1)).date(), oldest)
+        else:
+            first = oldest
+        return [first + timedelta(days=i) for i in range((yesterday - first).days + 1)]
+
+    async def _fetch_day(self, day: date) -> dict | None:
+        async with self._semaphore:
+            return await self._client.fetch_day_summary(day.isoformat(), nan_cells=True)
+
+    async def async_run(self) -> None:
+        """Importa i giorni mancanti. Sicuro da chiamare più volte (lock)."""
+        if "recorder" not in self.hass.config.components:
+            if self.aggregator is not None:
+                for hour in self.aggregator.completed(dt_util.utcnow()):
+                    self.aggregator.pop(hour)
+            return
+        if self._lock.locked():
+            return
+        async with self._lock:
+            checkpoint = await self._load()
+            dates = self.pending_dates(checkpoint, dt_util.now().date())
+            if dates and not await self._async_import_days(checkpoint, dates):
+                return
+            if self.aggregator is not None:
+                await self._async_import_live(checkpoint)
+
+    async def _async_import_days(self, checkpoint: dict, dates: list[date]) -> bool:
+        """Importa i giorni conclusi. False se il CCA smette di rispondere."""
+        history = {
+            d: row.get("energy_wh")
+            for row in await self._client.fetch_energy_history()
+            if (d := _history_date(row.get("date"))) is not None
+        }
+        _LOGGER.debug("[%s] statistiche: %d giorni da importare (%s → %s)",
+                      self._label, len(dates), dates[0], dates[-1])
+
+        step = STATISTICS_BACKFILL_CONCURRENCY * 2
+        for i in range(0, len(dates), step):
+            chunk = dates[i:i + step]
+            results = await asyncio.gather(*(self._fetch_day(d) for d in chunk))
+            batch: dict[str, list] = {}
+            names: dict[str, str] = {}
+            completed: date | None = None
+            for day, data in zip(chunk, results):
+                if data is None:
+                    break
+                # Decodifica e somme orarie di una giornata intera: fuori dall'event loop
+                hourly = await self.hass.async_add_executor_job(_decode_hourly, data, day)
+                self._add_day(checkpoint, batch, names, day, hourly, history.get(day))
+                completed = day
+            self._flush(batch, names)
+            if completed is not None:
+                checkpoint["last_hour"] = self._day_last_hour(completed).isoformat()
+                self.imported_days += (completed - chunk[0]).days + 1
+                await self._store.async_save(checkpoint)
+            if completed != chunk[-1]:
+                _LOGGER.info("[%s] statistiche: CCA non raggiungibile, riprendo più tardi", self._label)
+                return False
+        _LOGGER.info("[%s] statistiche importate fino al %s", self._label, dates[-1])
+        return True
+
+    async def _async_import_live(self, checkpoint: dict) -> None:
+        """Importa le ore concluse raccolte dall'aggregatore (modalità solo statistiche)."""
+        last = self._last_hour(checkpoint)
+        batch: dict[str, list] = {}
+        names: dict[str, str] = {}
+        means: dict[str, tuple] = {}
+        for hour in self.aggregator.completed(dt_util.utcnow()):
+            buckets = self.aggregator.pop(hour)
+            if last is not None and hour <= last:
+                continue
+            self._add_hour(checkpoint, batch, names, hour, {
+                panel: b[1] for panel, b in buckets.get("pin", {}).items()
+            })
+            for metric, panels in buckets.items():
+                suffix, unit, unit_class = MEAN_METRICS[metric]
+                for panel, (count, total, low, high) in panels.items():
+                    stat_id = statistic_id(self._prefix, panel, suffix)
+                    means[stat_id] = (f"Tigo {panel} {suffix}", unit, unit_class)
+                    batch.setdefault(stat_id, []).append({
+                        "start": hour, "mean": total / count, "min": low, "max": high,
+                    })
+            last = hour
+            checkpoint["last_hour"] = hour.isoformat()
+        if not batch:
+            return
+        self._flush(batch, names, means)
+        self._store.async_delay_save(lambda: checkpoint, 10)
+
+    def _add_day(
+        self,
+        checkpoint: dict,
+        batch: dict[str, list],
+        names: dict[str, str],
+        day: date,
+        hourly: dict[datetime, dict[str, float]],
+        day_total_wh,
+    ) -> None:
+        """Aggiunge al batch le ore (non ancora importate) di un giorno (da ``_decode_hourly``)."""
+        last = self._last_hour(checkpoint)
+        for hour in sorted(hourly):
+            if last is None or hour > last:
+                self._add_hour(checkpoint, batch, names, hour, hourly[hour])
+
+        day_start = dt_util.as_utc(dt_util.start_of_local_day(day))
+        if not hourly and day_total_wh and (last is None or last < day_start):
+            # Righe a minuti non più disponibili: resta il totale del giorno
+            try:
+                kwh = float(day_total_wh) / 1000.0
+            except (TypeError, ValueError):
+                return
+            noon = dt_util.as_utc(dt_util.start_of_local_day(day) + timedelta(hours=12))
+            self._append_energy(checkpoint, batch, names, SYSTEM_KEY, f"Tigo {self._label} energy", noon, kwh)
+
+    def _append_energy(
+        self,
+        checkpoint: dict,
+        batch: dict[str, list],
+        names: dict[str, str],
+        key: str,
+        name: str,
+        start: datetime,
+        kwh: float,
+    ) -> None:
+        sums: dict[str, float] = checkpoint["sums"]
+        stat_id = statistic_id(self._prefix, key)
+        names[stat_id] = name
+        total = sums.get(stat_id, 0.0) + kwh
+        sums[stat_id] = total
+        batch.setdefault(stat_id, []).append({"start": start, "state": total, "sum": total})
+
+    def _add_hour(
+        self,
+        checkpoint: dict,
+        batch: dict[str, list],
+        names: dict[str, str],
+        hour: datetime,
+        pin_sums: dict[str, float],
+    ) -> None:
+        """Energia di un'ora da ``{pannello: somma dei W a minuto}``."""
+        system_kwh = 0.0
+        for panel, total in pin_sums.items():
+            kwh = total / 60.0 / 1000.0
+            system_kwh += kwh
+            self._append_energy(checkpoint, batch, names, panel, f"Tigo {panel} energy", hour, kwh)
+        self._append_energy(checkpoint, batch, names, SYSTEM_KEY, f"Tigo {self._label} energy", hour, system_kwh)
+
+    def _flush(self, batch: dict[str, list], names: dict[str, str], means: dict[str, tuple] | None = None) -> None:
+        from homeassistant.components.recorder.statistics import async_add_external_statistics
+
+        for stat_id, rows in batch.items():
+            if means and stat_id in means:
+                metadata = _mean_metadata(stat_id, *means[stat_id])
+            else:
+                metadata = _energy_metadata(stat_id, names[stat_id])
+            async_add_external_statistics(self.hass, metadata, rows)
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
+
+
+def hourly_slot_stats(day: date, times: list, curves: dict[str, list[tuple]]) -> dict[datetime, dict[str, tuple]]:
+    """Punti a 15 minuti → ``{inizio ora UTC: {pannello: (media, min, max)}}``."""
+    stamps = {t: row_time(day, t, i * 15) for i, t in enumerate(times)}
+    buckets: dict[datetime, dict[str, list]] = {}
+    for panel, points in curves.items():
+        for t, value in points:
+            hour = _hour_start(stamps[t])
+            values = buckets.setdefault(hour, {}).setdefault(panel, [])
+            values.append(value)
+    return {
+        hour: {panel: (sum(v) / len(v), min(v), max(v)) for panel, v in panels.items()}
+        for hour, panels in buckets.items()
+    }
+
+
+class CloudPowerStatistics:
+    """Import orario della potenza per pannello dalle curve cloud della giornata.
+
+    Un'ora è conclusa quando la serie ha già uno slot successivo oppure, per
+    l'ultima ora caricata, passato ``HOUR_SETTLE`` più uno slot dalla sua
+    fine. Ogni ora viene importata una sola volta (``last_hour`` su disco).
+    """
+
+    def __init__(self, hass: HomeAssistant, entry_id: str, prefix: str) -> None:
+        self.hass = hass
+        self._prefix = prefix
+        self._store = Store(hass, STATISTICS_STORAGE_VERSION, statistics_key(entry_id))
+        self._checkpoint: dict | None = None
+        # Revisione della serie già esaminata e quando riprovare l'ora in sospeso
+        self._revision: int | None = None
+        self._retry_at: datetime | None = None
+
+    async def async_import(self, series) -> None:
+        """Importa le ore concluse di ``series`` (``PanelDaySeries`` di ``pin``)."""
+        if "recorder" not in self.hass.config.components or series is None or series.day is None:
+            return
+        now = dt_util.utcnow()
+        if series.revision == self._revision and (self._retry_at is None or now < self._retry_at):
+            return
+        self._revision = series.revision
+        self._retry_at = None
+        day = dt_util.parse_date(series.day)
+        if day is None or not series.times:
+            return
+        # Copia sincrona: il client può fondere nuovi slot dal thread dell'executor
+        times = list(series.times)
+        hourly = hourly_slot_stats(day, times, {p: list(c) for p, c in series.curves.items()})
+
+        if self._checkpoint is None:
+            try:
+                stored = await self._store.async_load()
+            except Exception as e:
+                _LOGGER.warning("Checkpoint statistiche cloud non leggibile: %s", e)
+                stored = None
+            self._checkpoint = {"last_hour": None, **(stored or {})}
+        last = dt_util.parse_datetime(self._checkpoint.get("last_hour") or "")
+        newest = row_time(day, times[-1], (len(times) - 1) * 15)
+
+        batch: dict[str, list] = {}
+        means: dict[str, tuple] = {}
+        suffix, unit, unit_class = MEAN_METRICS["pin"]
+        for hour in sorted(hourly):
+            end = hour + timedelta(hours=1)
+            if last is not None and hour <= last:
+                continue
+            if newest < end and now < end + HOUR_SETTLE + timedelta(minutes=15):
+                self._retry_at = end + HOUR_SETTLE + timedelta(minutes=15)
+                break
+            for panel, (mean, low, high) in hourly[hour].items():
+                stat_id = statistic_id(self._prefix, panel, suffix)
+                means[stat_id] = (f"Tigo {panel} {suffix}", unit, unit_class)
+                batch.setdefault(stat_id, []).append({"start": hour, "mean": mean, "min": low, "max": high})
+            last = hour
+            self._checkpoint["last_hour"] = hour.isoformat()
+        if not batch:
+            return
+
+        from homeassistant.components.recorder.statistics import async_add_external_statistics
+
+        for stat_id, rows in batch.items():
+            async_add_external_statistics(self.hass, _mean_metadata(stat_id, *means[stat_id]), rows)
+        checkpoint = self._checkpoint
+        self._store.async_delay_save(lambda: checkpoint, 10)
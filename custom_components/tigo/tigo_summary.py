@@ -0,0 +1,392 @@
+"""Lettura incrementale dei dataset ``summary_data`` del CCA.
+
+Il CCA restituisce sempre l'intera giornata a minuti per la metrica richiesta:
+``{"dataset": [{"order": [...], "data": [{"t": ..., "d": [...]}, ...]}, ...]}``.
+Qui si tiene, per ogni CCA, la posizione dell'ultima riga già letta per ogni
+metrica, così ad ogni poll si analizzano solo le righe nuove, e una serie a
+minuti in memoria leggibile dagli stadi successivi (energia, analisi).
+"""
+from __future__ import annotations
+
+from array import array
+from collections import deque
+import codecs
+import json
+
+# Righe a minuti tenute in memoria per metrica (una giornata)
+SERIES_MAXLEN = 24 * 60
+
+_WS = " \t\r\n"
+_DELIMS = _WS + ",]}"
+_DECODER = json.JSONDecoder()
+
+
+def _row_values(raw: list) -> array:
+    values = array("d")
+    for v in raw:
+        try:
+            values.append(float(v))
+        except (TypeError, ValueError):
+            values.append(0.0)
+    return values
+
+
+class MinuteSeries:
+    """Serie rolling a minuti per pannello, organizzata per righe.
+
+    Ogni riga tiene l'ordine dei pannelli (condiviso tra le righe dello stesso
+    blocco) e un ``array('d')`` di valori: molto più compatta di una deque per
+    ogni pannello. La vista per pannello si costruisce su richiesta.
+    """
+
+    def __init__(self, maxlen: int = SERIES_MAXLEN) -> None:
+        self._maxlen = maxlen
+        self._rows: dict[str, deque] = {}
+        self._index: dict[tuple, dict[str, int]] = {}
+
+    def append(self, metric: str, t, order: tuple, values: array) -> None:
+        if order not in self._index:
+            self._index[order] = {p: i for i, p in enumerate(order)}
+        rows = self._rows.setdefault(metric, deque(maxlen=self._maxlen))
+        rows.append((t, order, values))
+
+    def clear(self, metric: str | None = None) -> None:
+        if metric is None:
+            self._rows.clear()
+            self._index.clear()
+        else:
+            self._rows.pop(metric, None)
+
+    def metrics(self) -> list[str]:
+        return list(self._rows)
+
+    def panels(self) -> set[str]:
+        return {p for idx in self._index.values() for p in idx}
+
+    def __len__(self) -> int:
+        return max((len(rows) for rows in self._rows.values()), default=0)
+
+    def panel(self, panel_id: str, metric: str) -> list[tuple]:
+        """Serie ``[(t, valore), ...]`` di un pannello per la metrica (es. 'pin')."""
+        out: list[tuple] = []
+        for t, order, values in self._rows.get(metric, ()):
+            i = self._index[order].get(panel_id)
+            if i is not None and i < len(values):
+                out.append((t, values[i]))
+        return out
+
+    def rows(self, metric: str) -> list[tuple]:
+        """Righe grezze ``[(t, order, values), ...]`` della metrica."""
+        return list(self._rows.get(metric, ()))
+
+
+class SummaryCursor:
+    """Cursore "dall'ultima riga" per i dataset summary_data di un CCA.
+
+    Per ogni metrica ricorda data, blocco, riga e timestamp dell'ultima riga con
+    dati letta. Se il dataset non combacia più (cambio giorno, riga diversa nella
+    stessa posizione, dataset accorciato) il cursore riparte da capo.
+
+    ``row_listeners`` ricevono ogni riga nuova come
+    ``(metric, date, row_idx, t, order, values)``; con ``full_day`` il primo
+    poll di una giornata conserva tutte le righe (non solo l'ultima), così i
+    listener vedono la giornata completa. Ogni riga arriva ai listener una
+    sola volta: dopo un reset del cursore le righe fino all'ultima già
+    consegnata vengono rilette ma non rinotificate.
+    """
+
+    def __init__(self, series: MinuteSeries | None = None) -> None:
+        self.series = series if series is not None else MinuteSeries()
+        self._pos: dict[str, tuple] = {}
+        self._latest: dict[str, dict[str, float]] = {}
+        self.row_listeners: list = []
+        # {metrica: (date, block_idx, row_idx)} dell'ultima riga data ai listener
+        self._delivered: dict[str, tuple] = {}
+        self.full_day = False
+
+    def reset(self, metric: str | None = None) -> None:
+        if metric is None:
+            self._pos.clear()
+            self._latest.clear()
+        else:
+            self._pos.pop(metric, None)
+            self._latest.pop(metric, None)
+        self.series.clear(metric)
+
+    def position(self, metric: str) -> tuple | None:
+        """``(date, block_idx, row_idx, t)`` dell'ultima riga letta, o None."""
+        return self._pos.get(metric)
+
+    def stream_start(self, metric: str, date: str) -> tuple[int, int] | None:
+        """Posizione da cui un parser in streaming deve conservare le righe.
+
+        Include la riga del cursore (serve a validarlo). Se per la data non
+        c'è ancora un cursore basta l'ultima riga di ogni blocco (None), o
+        tutte con ``full_day``.
+        """
+        pos = self._pos.get(metric)
+        if pos is None or pos[0] != date:
+            return (0, 0) if self.full_day else None
+        return pos[1], pos[2]
+
+    def latest(self, metric: str) -> dict[str, float]:
+        """Ultimi valori letti per la metrica: {panel: valore}."""
+        return dict(self._latest.get(metric, {}))
+
+    def _start(self, metric: str, date: str, dataset: list) -> tuple[int, int]:
+        """Primo (blocco, riga) da analizzare per la metrica."""
+        pos = self._pos.get(metric)
+        if pos is None:
+            return 0, 0
+        p_date, b_idx, r_idx, t = pos
+        if p_date != date:
+            # Giorno nuovo: la serie rolling resta, riparte solo il cursore
+            self._pos.pop(metric, None)
+            return 0, 0
+        if b_idx >= len(dataset):
+            self.reset(metric)
+            return 0, 0
+        block = dataset[b_idx]
+        rows = block.get("data") or []
+        local = r_idx - block.get("row_offset", 0)
+        if not 0 <= local < len(rows) or rows[local].get("t") != t:
+            self.reset(metric)
+            return 0, 0
+        return b_idx, r_idx + 1
+
+    def _was_delivered(self, metric: str, date: str, b_idx: int, r_idx: int) -> bool:
+        """True se la riga è già stata consegnata ai listener (prima di un reset)."""
+        last = self._delivered.get(metric)
+        return last is not None and last[0] == date and (b_idx, r_idx) <= last[1:]
+
+    def consume(self, metric: str, date: str, dataset: list, fallback_order: list) -> int:
+        """Analizza solo le righe successive al cursore. Ritorna quante ne ha lette."""
+        b_start, r_start = self._start(metric, date, dataset)
+        parsed = 0
+        for b_idx in range(b_start, len(dataset)):
+            block = dataset[b_idx]
+            order = tuple(block.get("order") or fallback_order)
+            rows = block.get("data") or []
+            # I dataset ridotti dal parser in streaming partono da row_offset
+            offset = block.get("row_offset", 0)
+            first = max((r_start if b_idx == b_start else 0) - offset, 0)
+            for local in range(first, len(rows)):
+                r_idx = offset + local
+                entry = rows[local]
+                raw = entry.get("d")
+                if not raw:
+                    continue
+                values = _row_values(raw)
+                t = entry.get("t")
+                self.series.append(metric, t, order, values)
+                self._pos[metric] = (date, b_idx, r_idx, t)
+                parsed += 1
+                latest = self._latest.setdefault(metric, {})
+                for i, panel in enumerate(order):
+                    if i < len(values):
+                        latest[panel] = values[i]
+                if self.row_listeners and not self._was_delivered(metric, date, b_idx, r_idx):
+                    self._delivered[metric] = (date, b_idx, r_idx)
+                    for listener in self.row_listeners:
+                        listener(metric, date, r_idx, t, order, values)
+        return parsed
+
+
+class SummaryStreamParser:
+    """Decodifica incrementale di una risposta summary_data.
+
+    Riceve la risposta a pezzi (``feed``) e materializza solo ``order`` e le
+    righe utili di ogni blocco, scartando le altre appena lette: il picco di
+    memoria resta limitato a prescindere dall'ora del giorno. Ogni riga è
+    decodificata dal decoder C di ``json``, solo la struttura esterna è
+    gestita qui.
+
+    ``keep_from=(blocco, riga)`` conserva tutte le righe da quella posizione in
+    poi (vedi ``SummaryCursor.stream_start``); con None si tiene solo l'ultima
+    riga con dati di ogni blocco. I blocchi restituiti hanno in più
+    ``row_offset`` (indice della prima riga conservata) e ``row_count``.
+    """
+
+    def __init__(self, keep_from: tuple[int, int] | None = None) -> None:
+        self._keep_from = keep_from
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._state = "top"
+        self._key = None
+        self._top: dict = {}
+        self._dataset: list = []
+        self._block: dict = {}
+        self._rows: list = []
+        self._row_idx = 0
+        self._offset: int | None = None
+        self.bytes = 0
+
+    def feed(self, chunk: bytes) -> None:
+        self.bytes += len(chunk)
+        self._buf = self._buf[self._pos:] + self._decoder.decode(chunk)
+        self._pos = 0
+        self._run()
+
+    def close(self) -> dict:
+        """Chiude lo stream e ritorna il dataset ridotto. ValueError se il JSON è incompleto."""
+        self._buf = self._buf[self._pos:] + self._decoder.decode(b"", final=True)
+        self._pos = 0
+        self._eof = True
+        self._run()
+        if self._state != "done":
+            raise ValueError("risposta summary_data incompleta")
+        out = dict(self._top)
+        out["dataset"] = self._dataset
+        return out
+
+    # --- Scanner ----------------------------------------------------------
+
+    def _peek(self) -> str | None:
+        buf, pos, n = self._buf, self._pos, len(self._buf)
+        while pos < n and buf[pos] in _WS:
+            pos += 1
+        self._pos = pos
+        return buf[pos] if pos < n else None
+
+    def _expect(self, ch: str) -> bool:
+        c = self._peek()
+        if c is None:
+            return False
+        if c != ch:
+            raise ValueError(f"atteso {ch!r} alla posizione {self._pos}, trovato {c!r}")
+        self._pos += 1
+        return True
+
+    def _value(self) -> tuple[bool, object]:
+        """Decodifica un valore JSON completo; (False, None) se servono altri dati."""
+        if self._peek() is None:
+            if self._eof:
+                raise ValueError("risposta summary_data incompleta")
+            return False, None
+        try:
+            value, end = _DECODER.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._eof:
+                raise
+            return False, None
+        if (
+            not self._eof
+            and not isinstance(value, (dict, list, str))
+            and (end == len(self._buf) or self._buf[end] not in _DELIMS)
+        ):
+            # Numero o letterale non ancora delimitato: potrebbe essere troncato
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _keep_row(self, row) -> None:
+        idx = self._row_idx
+        self._row_idx += 1
+        if self._keep_from is not None:
+            kb, kr = self._keep_from
+            b = len(self._dataset)
+            if b > kb or (b == kb and idx >= kr):
+                if self._offset is None:
+                    self._offset = idx
+                self._rows.append(row)
+        elif isinstance(row, dict) and row.get("d"):
+            self._rows = [row]
+            self._offset = idx
+
+    def _run(self) -> None:
+        while self._state != "done" and self._step():
+            pass
+
+    def _step(self) -> bool:
+        """Avanza di un elemento della struttura. False se servono altri dati."""
+        state = self._state
+
+        if state == "top":
+            if not self._expect("{"):
+                return False
+            self._state = "top_key"
+        elif state in ("top_key", "block_key"):
+            c = self._peek()
+            if c is None:
+                return False
+            if c == ",":
+                self._pos += 1
+            elif c == "}":
+                self._pos += 1
+                if state == "top_key":
+                    self._state = "done"
+                else:
+                    self._block["data"] = self._rows
+                    self._block["row_offset"] = self._row_idx if self._offset is None else self._offset
+                    self._block["row_count"] = self._row_idx
+                    self._dataset.append(self._block)
+                    self._state = "ds_item"
+            else:
+                ok, key = self._value()
+                if not ok:
+                    return False
+                self._key = key
+                self._state = "top_colon" if state == "top_key" else "block_colon"
+        elif state == "top_colon":
+            if not self._expect(":"):
+                return False
+            self._state = "ds_open" if self._key == "dataset" else "top_value"
+        elif state == "block_colon":
+            if not self._expect(":"):
+                return False
+            self._state = "rows_open" if self._key == "data" else "block_value"
+        elif state in ("top_value", "block_value"):
+            ok, value = self._value()
+            if not ok:
+                return False
+            if state == "top_value":
+                self._top[self._key] = value
+                self._state = "top_key"
+            else:
+                self._block[self._key] = value
+                self._state = "block_key"
+        elif state in ("ds_open", "rows_open"):
+            c = self._peek()
+            if c is None:
+                return False
+            if c != "[":
+                # Valore inatteso (es. null): lo si decodifica così com'è
+                self._state = "top_value" if state == "ds_open" else "block_value"
+            else:
+                self._pos += 1
+                self._state = "ds_item" if state == "ds_open" else "row_item"
+        elif state == "ds_item":
+            c = self._peek()
+            if c is None:
+                return False
+            if c == ",":
+                self._pos += 1
+            elif c == "]":
+                self._pos += 1
+                self._state = "top_key"
+            elif c == "{":
+                self._pos += 1
+                self._block = {}
+                self._rows = []
+                self._row_idx = 0
+                self._offset = None
+                self._state = "block_key"
+            else:
+                raise ValueError(f"blocco dataset inatteso alla posizione {self._pos}")
+        elif state == "row_item":
+            c = self._peek()
+            if c is None:
+                return False
+            if c == ",":
+                self._pos += 1
+            elif c == "]":
+                self._pos += 1
+                self._state = "block_key"
+            else:
+                ok, row = self._value()
+                if not ok:
+                    return False
+                self._keep_row(row)
+        return True
@@ -0,0 +1,183 @@
+"""Indice precalcolato della topologia dei pannelli (pannello → stringa → inverter → CCA).
+
+Prima il setup costruiva una ``layout_map`` piatta e per ogni pannello
+risaliva i link ``parent`` (controllando sia i nomi sia i codici numerici dei
+tipi); poi ognuna delle 7+ entità del pannello ricostruiva per conto suo
+device info, MAC dal ``channel``, label e area. Ora il layout viene
+attraversato una sola volta, seguendo l'annidamento inverter → stringhe →
+pannelli, e ogni pannello diventa un ``PanelNode`` immutabile con la device
+info già pronta, condivisa da tutte le sue entità.
+
+Lo stesso indice si costruisce dal layout cloud (``TigoCloudClient.fetch_layout``),
+che ha già stringa e inverter per pannello.
+"""
+from __future__ import annotations
+
+from types import MappingProxyType
+from typing import Iterator, NamedTuple
+
+from .const import DOMAIN
+
+
+def channel_mac(channel) -> str | None:
+    """MAC ``aa:bb:cc:dd:ee:ff`` dal ``channel`` del CCA (``"001122AABBCC.3"``), se presente."""
+    if not isinstance(channel, str) or "." not in channel:
+        return None
+    mac = channel.split(".")[0].lower()
+    if len(mac) != 12:
+        return None
+    return ":".join(mac[i:i + 2] for i in range(0, 12, 2))
+
+
+class PanelNode(NamedTuple):
+    """Un pannello con i suoi parent e la device info già costruita.
+
+    ``device_info`` è condivisa da tutte le entità del pannello: non va
+    modificata.
+    """
+
+    panel_id: str
+    label: str
+    serial: str | None
+    channel: str | None
+    mp: object
+    model: str
+    string: str | None
+    inverter: str | None
+    mac: str | None
+    short_serial: str | None
+    watt_rating: object
+    device_info: dict
+
+    @property
+    def area(self) -> str | None:
+        return self.string or self.inverter
+
+    @property
+    def parents(self) -> dict:
+        return {"string": self.string, "inverter": self.inverter}
+
+    def layout_info(self) -> dict:
+        """Voce di layout in forma di ``summary_config`` (per l'inventario su disco)."""
+        return {"label": self.label, "serial": self.serial, "channel": self.channel, "MP": self.mp, "type": self.model}
+
+
+def panel_node(
+    panel_id: str,
+    layout_info: dict | None,
+    parents: dict | None,
+    label: str | None,
+    prefix: str,
+    via_device: str,
+) -> PanelNode:
+    """``PanelNode`` di un pannello locale (CCA o ESP32) da voce di layout e parent.
+
+    ``via_device`` è l'identificatore del device di sistema (es.
+    ``<prefisso>_tigo_system``).
+    """
+    layout_info = layout_info or {}
+    parents = parents or {}
+    label = label or layout_info.get("label") or panel_id
+    serial = layout_info.get("serial", panel_id)
+    channel = layout_info.get("channel", "unknown")
+    model = layout_info.get("type", "Tigo Panel")
+    device_info = {
+        "identifiers": {(DOMAIN, f"{prefix}_{panel_id}")},
+        "name": f"Panel {label}",
+        "manufacturer": "Tigo",
+        "model": model,
+        "sw_version": channel,
+        "hw_version": serial,
+        "via_device": (DOMAIN, via_device),
+    }
+    area = parents.get("string") or parents.get("inverter")
+    if area:
+        device_info["suggested_area"] = area
+    return PanelNode(
+        panel_id=panel_id,
+        label=label,
+        serial=layout_info.get("serial"),
+        channel=layout_info.get("channel"),
+        mp=layout_info.get("MP"),
+        model=model,
+        string=parents.get("string"),
+        inverter=parents.get("inverter"),
+        mac=channel_mac(channel),
+        short_serial=None,
+        watt_rating=None,
+        device_info=device_info,
+    )
+
+
+def cloud_panel_node(panel_id: str, info: dict | None, prefix: str) -> PanelNode:
+    """``PanelNode`` di un pannello cloud da una voce di ``fetch_layout``."""
+    info = info or {}
+    panel_id = str(panel_id)
+    label = info.get("name") or panel_id
+    device_info = {
+        "identifiers": {(DOMAIN, f"{prefix}_{panel_id}")},
+        "name": f"Panel {label}",
+        "manufacturer": "Tigo",
+        "model": "Tigo Panel",
+        "hw_version": info.get("serial") or panel_id,
+        "via_device": (DOMAIN, f"{prefix}_system"),
+    }
+    area = info.get("string") or info.get("inverter")
+    if area:
+        device_info["suggested_area"] = area
+    return PanelNode(
+        panel_id=panel_id,
+        label=label,
+        serial=info.get("serial"),
+        channel=info.get("channel"),
+        mp=info.get("mp"),
+        model="Tigo Panel",
+        string=info.get("string"),
+        inverter=info.get("inverter"),
+        mac=None,
+        short_serial=info.get("short_serial"),
+        watt_rating=info.get("watt_rating"),
+        device_info=device_info,
+    )
+
+
+class PanelTopology:
+    """Indice immutabile {panel_id: PanelNode} di un impianto."""
+
+    __slots__ = ("_nodes",)
+
+    def __init__(self, nodes: dict[str, PanelNode] | None = None) -> None:
+        self._nodes = MappingProxyType(dict(nodes or {}))
+
+    @classmethod
+    def from_layout(cls, layout: dict | None, prefix: str) -> PanelTopology:
+        """Indice dal layout locale ``{"system": {"inverters": [...]}}`` (``parse_layout``)."""
+        via = f"{prefix}_tigo_system"
+        nodes: dict[str, PanelNode] = {}
+        for inverter in ((layout or {}).get("system") or {}).get("inverters", []):
+            inverter_label = inverter.get("label")
+            for mppt in inverter.get("mppts", []):
+                parents = {"string": mppt.get("label"), "inverter": inverter_label}
+                for panel in mppt.get("panels", []):
+                    panel_id = panel.get("object_id")
+                    if panel_id is None:
+                        continue
+                    nodes[panel_id] = panel_node(panel_id, panel, parents, None, prefix, via)
+        return cls(nodes)
+
+    @classmethod
+    def from_cloud_layout(cls, panels: dict | None, prefix: str) -> PanelTopology:
+        """Indice dal layout cloud ``{object_id: {...}}`` (``TigoCloudClient.fetch_layout``)."""
+        return cls({str(oid): cloud_panel_node(oid, info, prefix) for oid, info in (panels or {}).items()})
+
+    def get(self, panel_id, default: PanelNode | None = None) -> PanelNode | None:
+        return self._nodes.get(panel_id, default)
+
+    def __contains__(self, panel_id) -> bool:
+        return panel_id in self._nodes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
@@ -0,0 +1,164 @@
+"""Sottoscrizione WebSocket persistente verso l'ESP32.
+
+Invece di aprire una connessione ``websocket`` ad ogni poll e leggere un solo
+frame, si tiene aperta una connessione per entry: ogni frame che il firmware
+invia viene decodificato e passato al coordinator. In caso di disconnessione
+il listener si riconnette con backoff.
+
+Se il firmware invia più frame di quanti ne servano a HA, ``FrameCoalescer``
+li fonde in una finestra temporale: al coordinator arriva un solo
+aggiornamento per finestra con l'ultimo valore di ogni pannello/metrica, più
+tutti i campioni di potenza ricevuti (``PinSamples``) per l'integrazione
+dell'energia.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+import aiohttp
+
+from .const import _LOGGER
+from .tigo_api import parse_ws_frame
+
+# Attesa massima tra due tentativi di riconnessione
+WS_RECONNECT_MAX_SEC = 60
+# Ping WebSocket per accorgersi delle connessioni morte
+WS_HEARTBEAT_SEC = 30
+WS_CONNECT_TIMEOUT_SEC = 10
+
+
+class TigoWsListener:
+    """Listener WebSocket di lunga durata per una entry ESP32.
+
+    ``on_frame`` riceve ogni frame decodificato ({panel_id: {...}}) nel loop
+    di HA. ``run()`` va avviato come task di background dell'entry: termina
+    solo quando il task viene annullato (unload).
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        on_frame: Callable[[dict], None],
+    ) -> None:
+        self._session = session
+        self.url = url
+        self._on_frame = on_frame
+        self.connected = False
+        self.frames = 0
+        self.last_frame: float | None = None
+
+    def frame_age(self) -> float | None:
+        """Secondi dall'ultimo frame ricevuto (None se mai ricevuto)."""
+        if self.last_frame is None:
+            return None
+        return time.monotonic() - self.last_frame
+
+    async def run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                await self._listen()
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                _LOGGER.debug("WS %s disconnesso: %s", self.url, e)
+            finally:
+                self.connected = False
+            wait = min(2 ** failures, WS_RECONNECT_MAX_SEC) * random.uniform(0.5, 1.0)
+            await asyncio.sleep(wait)
+
+    async def _listen(self) -> None:
+        ws = await asyncio.wait_for(
+            self._session.ws_connect(self.url, heartbeat=WS_HEARTBEAT_SEC),
+            timeout=WS_CONNECT_TIMEOUT_SEC,
+        )
+        async with ws:
+            self.connected = True
+            _LOGGER.debug("WS %s connesso", self.url)
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    self._handle(msg.data)
+                elif msg.type == aiohttp.WSMsgType.BINARY:
+                    self._handle(msg.data.decode("utf-8", errors="replace"))
+                elif msg.type in (aiohttp.WSMsgType.ERROR, aiohttp.WSMsgType.CLOSED):
+                    break
+
+    def _handle(self, raw: str) -> None:
+        try:
+            data_list = json.loads(raw) if raw else []
+        except ValueError as e:
+            _LOGGER.debug("WS %s frame non valido: %s", self.url, e)
+            return
+        panels = parse_ws_frame(data_list if isinstance(data_list, list) else [])
+        if not panels:
+            return
+        self.frames += 1
+        self.last_frame = time.monotonic()
+        self._on_frame(panels)
+
+
+class FrameCoalescer:
+    """Fonde i frame WebSocket ricevuti entro ``window`` secondi.
+
+    Il primo frame di una finestra pianifica il flush; i successivi
+    aggiornano l'ultimo valore per pannello/metrica. Al flush ogni pannello
+    riceve anche ``PinSamples``: la lista ``[(timestamp UTC, W), ...]`` di
+    tutti i valori di Pin della finestra, così l'energia non perde campioni.
+    Con ``window`` <= 0 ogni frame viene inoltrato subito.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        on_flush: Callable[[dict], None],
+        now: Callable[[], datetime] | None = None,
+    ) -> None:
+        self.window = float(window)
+        self._on_flush = on_flush
+        self._now = now or (lambda: datetime.now(timezone.utc))
+        self._pending: dict[str, dict] = {}
+        self._samples: dict[str, list] = {}
+        self._handle: asyncio.TimerHandle | None = None
+        self.frames_in = 0
+        self.flushes = 0
+
+    def push(self, panels: dict) -> None:
+        self.frames_in += 1
+        ts = self._now()
+        for panel_id, values in panels.items():
+            self._pending.setdefault(panel_id, {}).update(values)
+            if values.get("Pin") is not None:
+                self._samples.setdefault(panel_id, []).append((ts, values["Pin"]))
+        if self.window <= 0:
+            self.flush()
+        elif self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+    def flush(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self._pending:
+            return
+        pending, samples = self._pending, self._samples
+        self._pending, self._samples = {}, {}
+        for panel_id, values in pending.items():
+            values["PinSamples"] = samples.get(panel_id, [])
+        self.flushes += 1
+        self._on_flush(pending)
+
+    def cancel(self) -> None:
+        """Scarta i frame in attesa (unload dell'entry)."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._pending.clear()
+        self._samples.clear()
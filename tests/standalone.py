@@ -0,0 +1,23 @@
+"""Import dei moduli puri dell'integrazione senza Home Assistant.
+
+``custom_components.tigo`` importa Home Assistant già nel suo ``__init__``:
+qui la cartella viene registrata come pacchetto a sé, senza eseguire
+``__init__.py``, e i moduli che non dipendono da HA (decodifica, parser,
+rate limit, serie cloud) si importano da lì.
+"""
+import importlib
+import sys
+import types
+from pathlib import Path
+
+_PACKAGE = "_tigo_standalone"
+_PATH = Path(__file__).resolve().parents[1] / "custom_components" / "tigo"
+
+
+def tigo_module(name: str):
+    """Modulo ``custom_components/tigo/<name>.py`` importato fuori dal pacchetto HA."""
+    if _PACKAGE not in sys.modules:
+        package = types.ModuleType(_PACKAGE)
+        package.__path__ = [str(_PATH)]
+        sys.modules[_PACKAGE] = package
+    return importlib.import_module(f"{_PACKAGE}.{name}")
@@ -0,0 +1,63 @@
+"""PanelDaySeries.merge: solo slot nuovi o cambiati, riscritture e fuori ordine."""
+import pytest
+
+pytest.importorskip("requests")
+
+from tests.standalone import tigo_module  # noqa: E402
+
+PanelDaySeries = tigo_module("tigo_cloud").PanelDaySeries
+
+DAY = "2026-10-17"
+ORDER = [1, 2]
+
+
+def _rows(*slots):
+    return [{"t": t, "d": d} for t, d in slots]
+
+
+def test_merge_is_idempotent():
+    series = PanelDaySeries()
+    rows = _rows(("10:00", [100, 200]), ("10:15", [110, "-"]))
+    assert series.merge(DAY, ORDER, rows) == 2
+    revision = series.revision
+    assert series.merge(DAY, ORDER, rows) == 0
+    assert series.revision == revision
+    assert series.curve("1") == (("10:00", 100.0), ("10:15", 110.0))
+    assert series.curve("2") == (("10:00", 200.0),)
+    assert series.last == {"1": {"value": 110.0, "time": "10:15"}}
+
+
+def test_window_appends_only_new_slots():
+    series = PanelDaySeries()
+    series.merge(DAY, ORDER, _rows(("10:00", [100, 200]), ("10:15", [110, 210])))
+    # Risposta a finestra: solo dall'ultimo slot noto in poi
+    assert series.merge(DAY, ORDER, _rows(("10:15", [110, 210]), ("10:30", [120, 220]))) == 1
+    assert series.times == ["10:00", "10:15", "10:30"]
+    assert series.last["2"] == {"value": 220.0, "time": "10:30"}
+
+
+def test_late_upload_and_out_of_order_rebuild_curves():
+    series = PanelDaySeries()
+    series.merge(DAY, ORDER, _rows(("10:00", [100, "-"]), ("10:30", [120, 220])))
+    changed = series.merge(DAY, ORDER, _rows(("10:00", [100, 205]), ("10:15", [110, 210])))
+    assert changed == 2
+    assert series.times == ["10:00", "10:15", "10:30"]
+    assert series.curve("2") == (("10:00", 205.0), ("10:15", 210.0), ("10:30", 220.0))
+
+
+def test_new_day_resets():
+    series = PanelDaySeries()
+    series.merge(DAY, ORDER, _rows(("23:45", [5, 5])))
+    series.merge("2026-10-18", ORDER, _rows(("06:00", [1, 2])))
+    assert series.times == ["06:00"]
+    assert series.curve("1") == (("06:00", 1.0),)
+
+
+def test_window_start_needs_a_recent_full_matrix():
+    series = PanelDaySeries()
+    series.merge(DAY, ORDER, _rows(("10:00", [100, 200])))
+    assert series.window_start(DAY) is None
+    series.full_at = 50.0
+    assert series.window_start(DAY, now=60.0) == "10:00"
+    assert series.window_start("2026-10-18", now=60.0) is None
+    assert series.window_start(DAY, now=50.0 + 24 * 3600) is None
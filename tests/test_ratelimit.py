@@ -0,0 +1,58 @@
+"""CloudRateGovernor: token bucket e blocco dopo 429/5xx, con orologio finto."""
+import pytest
+
+from tests.standalone import tigo_module
+
+CloudRateGovernor = tigo_module("tigo_ratelimit").CloudRateGovernor
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_wait_for_refill():
+    clock = _Clock()
+    governor = CloudRateGovernor(per_hour=3600, burst=2, clock=clock)
+    assert governor.reserve() == 0.0
+    assert governor.reserve() == 0.0
+    # Bucket vuoto: un gettone ogni secondo, nessuno consumato mentre si attende
+    assert governor.reserve() == pytest.approx(1.0)
+    clock.now += 0.5
+    assert governor.reserve() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert governor.reserve() == 0.0
+    assert governor.stats()["requests_hour"] == 3
+
+
+def test_refill_is_capped_at_burst():
+    clock = _Clock()
+    governor = CloudRateGovernor(per_hour=3600, burst=2, clock=clock)
+    governor.reserve()
+    clock.now += 3600
+    assert [governor.reserve() for _ in range(2)] == [0.0, 0.0]
+    assert governor.reserve() > 0
+
+
+def test_throttle_blocks_and_empties_bucket():
+    clock = _Clock()
+    governor = CloudRateGovernor(per_hour=3600, burst=5, clock=clock)
+    assert governor.record_throttled(429, 10.0) == 10.0
+    assert governor.reserve() == pytest.approx(10.0)
+    clock.now += 10.0
+    # Niente raffica a fine blocco: il bucket riparte vuoto
+    assert governor.reserve() == pytest.approx(1.0)
+    clock.now += 1.0
+    assert governor.reserve() == 0.0
+    assert governor.stats()["throttled"] == 1
+
+
+def test_backoff_doubles_without_retry_after():
+    governor = CloudRateGovernor(clock=_Clock())
+    first = governor.record_throttled(503, None)
+    assert governor.record_throttled(503, None) == 2 * first
+    governor.record_success()
+    assert governor.record_throttled(503, None) == first
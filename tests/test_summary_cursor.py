@@ -0,0 +1,38 @@
+"""Cursore summary_data: righe consegnate ai listener dopo un reset."""
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.tigo.tigo_summary import SummaryCursor  # noqa: E402
+
+DATE = "2026-10-17"
+
+
+def _dataset(rows):
+    return [{"order": ["A1", "A2"], "data": [{"t": t, "d": d} for t, d in rows]}]
+
+
+def test_reset_does_not_redeliver_rows():
+    cursor = SummaryCursor()
+    delivered = []
+    cursor.row_listeners.append(lambda metric, date, r_idx, t, order, values: delivered.append(t))
+
+    rows = [("10:00", [100, 110]), ("10:01", [101, 111])]
+    cursor.consume("pin", DATE, _dataset(rows), [])
+    assert delivered == ["10:00", "10:01"]
+
+    # Riga già letta riscritta dal CCA: il cursore riparte da capo
+    rows = [("10:00", [100, 110]), ("10:01b", [102, 112]), ("10:02", [103, 113])]
+    assert cursor.consume("pin", DATE, _dataset(rows), []) == 3
+    assert delivered == ["10:00", "10:01", "10:02"]
+    assert cursor.latest("pin") == {"A1": 103.0, "A2": 113.0}
+
+
+def test_new_day_delivers_from_start():
+    cursor = SummaryCursor()
+    delivered = []
+    cursor.row_listeners.append(lambda metric, date, r_idx, t, order, values: delivered.append((date, t)))
+
+    cursor.consume("pin", DATE, _dataset([("23:59", [1, 1])]), [])
+    cursor.consume("pin", "2026-10-18", _dataset([("00:00", [2, 2])]), [])
+    assert delivered == [(DATE, "23:59"), ("2026-10-18", "00:00")]
@@ -0,0 +1,95 @@
+"""decode_summary contro il vecchio ciclo cella per cella, celle "-" comprese."""
+import json
+import math
+import random
+
+import pytest
+
+from tests.standalone import tigo_module
+
+tigo_decode = tigo_module("tigo_decode")
+
+PATHS = [False] + ([True] if tigo_decode.HAS_NUMPY else [])
+
+
+def _day(panels=6, minutes=90, seed=1) -> dict:
+    rnd = random.Random(seed)
+    order = [f"A{i}" for i in range(panels)]
+    rows = []
+    for m in range(minutes):
+        d = ["-" if rnd.random() < 0.1 else round(rnd.uniform(0, 400), 1) for _ in order]
+        rows.append({"t": f"{m // 60:02d}:{m % 60:02d}", "d": d})
+    return {"dataset": [{"order": order, "data": rows}]}
+
+
+def _legacy(data: dict) -> tuple:
+    """KWh della giornata e ultima riga come li calcolava il codice precedente."""
+    total_wh = 0.0
+    last: dict = {}
+    for block in data.get("dataset", []):
+        order = block.get("order") or []
+        for entry in block.get("data", []):
+            raw = entry.get("d", [])
+            if not raw:
+                continue
+            minute_sum = 0.0
+            last = {}
+            for i, v in enumerate(raw[:len(order)]):
+                try:
+                    f = float(v)
+                except (TypeError, ValueError):
+                    last[order[i]] = 0.0
+                    continue
+                minute_sum += f
+                last[order[i]] = f
+            total_wh += minute_sum / 60.0
+    return round(total_wh / 1000.0, 2), last
+
+
+def _nan_json(data: dict) -> dict:
+    """Come il client con ``nan_cells=True``: "-" diventa NaN già nel testo JSON."""
+    return json.loads(json.dumps(data).encode().replace(b'"-"', b"NaN"))
+
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+@pytest.mark.parametrize("nan_cells", [False, True])
+def test_matches_legacy(use_numpy, nan_cells):
+    data = _day()
+    kwh, last = _legacy(data)
+    matrix = tigo_decode.decode_summary(_nan_json(data) if nan_cells else data, use_numpy=use_numpy)
+    assert matrix.day_kwh() == kwh
+    assert matrix.last_row() == pytest.approx(last)
+    assert len(matrix) == 90
+
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_dash_null_and_short_rows(use_numpy):
+    data = {"dataset": [{"order": ["A", "B", "C"], "data": [
+        {"t": "1", "d": [60, "-", None]},
+        {"t": "2", "d": ["120", 60]},
+        {"t": "3", "d": []},
+        {"t": "4", "d": ["-", 30, "x"]},
+    ]}]}
+    matrix = tigo_decode.decode_summary(data, use_numpy=use_numpy)
+    assert matrix.times == ["1", "2", "4"]
+    assert matrix.day_wh() == pytest.approx(270 / 60.0)
+    assert matrix.last_row() == {"A": 0.0, "B": 30.0, "C": 0.0}
+    assert matrix.panel("B") == [("2", 60.0), ("4", 30.0)]
+    stats = matrix.panel_stats()
+    assert stats["A"] == pytest.approx({"min": 60.0, "max": 120.0, "mean": 90.0, "wh": 3.0})
+    assert "C" not in stats
+
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_blocks_with_different_order(use_numpy):
+    data = {"dataset": [
+        {"order": ["A", "B"], "data": [{"t": "1", "d": [10, 20]}]},
+        {"order": ["B", "C"], "data": [{"t": "2", "d": [30, "-"]}]},
+    ]}
+    matrix = tigo_decode.decode_summary(data, use_numpy=use_numpy)
+    assert matrix.order == ("A", "B", "C")
+    # Solo i pannelli del blocco dell'ultima riga
+    assert matrix.last_row() == {"B": 30.0, "C": 0.0}
+    a_sum, a_last = matrix.panel_window("A", 0, 2)
+    assert (a_sum, a_last) == (10.0, 10.0)
+    assert math.isclose(matrix.column_sums(0, 2)["B"], 50.0)
@@ -0,0 +1,63 @@
+"""SummaryStreamParser: stesso risultato di ``json.loads`` a qualunque taglio dei chunk."""
+import json
+
+import pytest
+
+from tests.standalone import tigo_module
+
+SummaryStreamParser = tigo_module("tigo_summary").SummaryStreamParser
+
+DAY = {
+    "unit": "W",
+    "dataset": [
+        {
+            "order": ["A1", "A2"],
+            "data": [
+                {"t": "10:00", "d": [100.5, "-"]},
+                {"t": "10:01", "d": [101, 111]},
+                {"t": "10:02", "d": []},
+            ],
+        },
+        {"order": ["B1"], "data": [{"t": "10:03", "d": [7]}]},
+    ],
+}
+BODY = json.dumps(DAY).encode()
+
+
+def _parse(body: bytes, size: int, keep_from=None) -> dict:
+    parser = SummaryStreamParser(keep_from)
+    for i in range(0, len(body), size):
+        parser.feed(body[i:i + size])
+    return parser.close()
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(BODY)])
+def test_last_row_of_each_block(size):
+    out = _parse(BODY, size)
+    assert out["unit"] == "W"
+    first, second = out["dataset"]
+    assert first["order"] == ["A1", "A2"]
+    # L'ultima riga con dati, non quella vuota
+    assert first["data"] == [{"t": "10:01", "d": [101, 111]}]
+    assert (first["row_offset"], first["row_count"]) == (1, 3)
+    assert second["data"] == [{"t": "10:03", "d": [7]}]
+
+
+@pytest.mark.parametrize("size", [2, len(BODY)])
+def test_keep_from_keeps_following_rows(size):
+    out = _parse(BODY, size, keep_from=(0, 1))
+    first, second = out["dataset"]
+    assert first["data"] == DAY["dataset"][0]["data"][1:]
+    assert first["row_offset"] == 1
+    assert second["data"] == DAY["dataset"][1]["data"]
+
+
+def test_multibyte_split_across_chunks():
+    body = json.dumps({"dataset": [{"order": ["Pannello è"], "data": [{"t": "1", "d": [1]}]}]},
+                      ensure_ascii=False).encode()
+    assert _parse(body, 1)["dataset"][0]["order"] == ["Pannello è"]
+
+
+def test_truncated_body_raises():
+    with pytest.raises(ValueError):
+        _parse(BODY[:-5], 16)
@@ -0,0 +1,39 @@
+"""Coordinator di sistema CCA: ``fetch_system_energy``."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.tigo.sensor import fetch_system_energy  # noqa: E402
+
+
+class _FakeLocalClient:
+    def __init__(self):
+        self.accumulator = None
+
+    async def fetch_daily_energy(self, energy_cache, today_accumulator):
+        self.accumulator = today_accumulator
+        return {
+            "today_energy": 3.2,
+            "yesterday_energy": 11.5,
+            "weekly_energy": 60.1,
+            "history": [["2026-10-15", 10.0], ["2026-10-16", 11.5]],
+        }
+
+    async def fetch_device_info(self):
+        return {"serial": "04C05B000001", "software": "3.7.2"}
+
+
+def test_fetch_system_energy_reads_accumulator():
+    client = _FakeLocalClient()
+    accumulator = object()
+
+    data = asyncio.run(fetch_system_energy(client, None, accumulator))
+
+    assert client.accumulator is accumulator
+    assert data["today_energy"] == 3.2
+    assert data["yesterday_energy"] == 11.5
+    assert data["weekly_energy"] == 60.1
+    assert data["serial"] == "04C05B000001"
+    assert list(data["history_weekly_named"]) == ["2026-10-15 (Thursday)", "2026-10-16 (Friday)"]